@@ -208,6 +208,17 @@ class OuvrageViewSet(viewsets.ModelViewSet):
                 {"detail": "Catégorie non trouvée"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+    
+    @action(detail=True, methods=['get'])
+    def price_history(self, request, pk=None):
+        """
+        Historique des prix de vente pratiqués pour l'ouvrage dans les devis acceptés
+        et refusés : nombre de lignes, prix unitaire et marge (min, médiane, max).
+        """
+        from devis.historique_prix import obtenir_historique_prix
+        
+        ouvrage = self.get_object()
+        return Response(obtenir_historique_prix(ouvrage.id))
 
 class IngredientOuvrageViewSet(viewsets.ModelViewSet):
     """
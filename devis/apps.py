@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DevisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "devis"
+
+    def ready(self):
+        from . import prevision, recherche
+        recherche.connecter_signaux()
+        prevision.connecter_signaux()
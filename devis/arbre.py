@@ -0,0 +1,106 @@
+"""
+Chargement d'un devis complet (client, lots, lignes) en un nombre fixe de requêtes.
+
+L'arbre calcule en une seule passe Python les totaux et marges des lignes,
+des lots et du devis. Il est partagé par l'endpoint de calculs, le détail
+d'un devis et la génération PDF.
+"""
+from decimal import Decimal
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Devis, Lot, LigneDevis
+
+
+def calculer_marge(total_ht, total_debourse):
+    """
+    Calcule une marge en pourcentage.
+    Formule : (Prix de vente - Déboursé) / Prix de vente * 100
+    """
+    if total_ht == 0:
+        return 0
+
+    return ((total_ht - total_debourse) / total_ht) * 100
+
+
+def prefetch_arbre():
+    """
+    Retourne les préchargements nécessaires à la construction d'un arbre de devis :
+    lots et lignes dans l'ordre d'affichage, adresses et contacts du client.
+    """
+    lignes = LigneDevis.objects.order_by('ordre', 'id')
+    lots = Lot.objects.order_by('ordre', 'nom').prefetch_related(Prefetch('lignes', queryset=lignes))
+    return [
+        Prefetch('lots', queryset=lots),
+        'client__adresses',
+        'client__contacts',
+    ]
+
+
+def queryset_arbre(queryset=None):
+    """
+    Ajoute à un queryset de devis les jointures et préchargements de l'arbre.
+    """
+    if queryset is None:
+        queryset = Devis.objects.all()
+    return queryset.select_related('client').prefetch_related(*prefetch_arbre())
+
+
+class LotArbre:
+    """
+    Un lot de l'arbre avec ses lignes ordonnées et ses totaux calculés.
+    """
+    def __init__(self, lot):
+        self.lot = lot
+        self.lignes = list(lot.lignes.all())
+        self.total_ht = sum((ligne.total_ht for ligne in self.lignes), Decimal('0'))
+        self.total_debourse = sum((ligne.total_debourse for ligne in self.lignes), Decimal('0'))
+
+    @property
+    def marge(self):
+        return calculer_marge(self.total_ht, self.total_debourse)
+
+
+class ArbreDevis:
+    """
+    Arbre complet d'un devis : devis, client, lots et lignes.
+
+    Exemple:
+        arbre = ArbreDevis.charger(devis_id)
+        for noeud in arbre.lots:
+            noeud.lot.nom, noeud.total_ht, noeud.lignes
+    """
+    def __init__(self, devis):
+        """
+        Construit l'arbre à partir d'une instance de devis. Si les lots n'ont pas
+        été préchargés (voir queryset_arbre), ils le sont ici en une fois.
+        """
+        if 'lots' not in getattr(devis, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([devis], *prefetch_arbre())
+
+        self.devis = devis
+        self.client = devis.client
+        self.lots = [LotArbre(lot) for lot in devis.lots.all()]
+        self.total_ht = sum((noeud.total_ht for noeud in self.lots), Decimal('0'))
+        self.total_debourse = sum((noeud.total_debourse for noeud in self.lots), Decimal('0'))
+
+    @classmethod
+    def charger(cls, devis_id, queryset=None):
+        """
+        Charge l'arbre d'un devis par son ID.
+
+        Raises:
+            Devis.DoesNotExist: si le devis n'existe pas
+        """
+        return cls(queryset_arbre(queryset).get(pk=devis_id))
+
+    @property
+    def marge_totale(self):
+        return calculer_marge(self.total_ht, self.total_debourse)
+
+    def lignes(self):
+        """
+        Itère sur toutes les lignes du devis, dans l'ordre des lots.
+        """
+        for noeud in self.lots:
+            yield from noeud.lignes
@@ -0,0 +1,87 @@
+"""
+Calculs (totaux, déboursés et marges par devis et par lot) de plusieurs devis
+à la fois.
+
+Les totaux sont calculés à partir des lignes, comme l'endpoint de calculs d'un
+devis (voir devis/arbre.py), mais par une seule requête groupée par lot sur
+l'ensemble des devis demandés, sans charger les lignes. Avec la lecture des
+devis et celle de leurs lots, le calcul coûte trois requêtes quel que soit le
+nombre de devis.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from .arbre import calculer_marge
+from .models import Lot, LigneDevis
+from .totaux import MONTANT_DEBOURSE, MONTANT_HT
+
+LIMITE_DEVIS = 1000
+
+
+def _totaux(total_ht, total_debourse, nombre_lignes, avec_couts):
+    totaux = {'total_ht': total_ht, 'nombre_lignes': nombre_lignes}
+    if avec_couts:
+        totaux['total_debourse'] = total_debourse
+        totaux['marge'] = calculer_marge(total_ht, total_debourse)
+    return totaux
+
+
+def calculer_devis(devis, avec_couts=True):
+    """
+    Calcule les totaux de chaque devis et de chacun de ses lots.
+
+    Args:
+        devis: Queryset des devis concernés (au plus LIMITE_DEVIS)
+        avec_couts: Inclut les déboursés et les marges
+
+    Returns:
+        Liste, dans l'ordre du queryset, de dictionnaires {'id', 'numero', 'client',
+        'objet', 'statut', 'total_ht', 'nombre_lignes', ('total_debourse', 'marge'),
+        'lots': [...]}
+    """
+    entetes = list(devis.values('id', 'numero', 'client__nom', 'objet', 'statut'))
+    ids = [entete['id'] for entete in entetes]
+
+    sommes = {
+        somme['lot_id']: somme
+        for somme in LigneDevis.objects.filter(lot__devis_id__in=ids)
+        .order_by()
+        .values('lot_id')
+        .annotate(total_ht=Sum(MONTANT_HT), total_debourse=Sum(MONTANT_DEBOURSE), nombre=Count('id'))
+    }
+
+    lots = defaultdict(list)
+    for lot_id, devis_id, nom in (
+        Lot.objects.filter(devis_id__in=ids)
+        .order_by('devis_id', 'ordre', 'nom', 'id')
+        .values_list('id', 'devis_id', 'nom')
+    ):
+        somme = sommes.get(lot_id, {})
+        lots[devis_id].append((
+            lot_id, nom, somme.get('total_ht') or Decimal('0'),
+            somme.get('total_debourse') or Decimal('0'), somme.get('nombre', 0)
+        ))
+
+    resultat = []
+    for entete in entetes:
+        lots_devis = lots[entete['id']]
+        resultat.append({
+            'id': entete['id'],
+            'numero': entete['numero'],
+            'client': entete['client__nom'],
+            'objet': entete['objet'],
+            'statut': entete['statut'],
+            **_totaux(
+                sum((lot[2] for lot in lots_devis), Decimal('0')),
+                sum((lot[3] for lot in lots_devis), Decimal('0')),
+                sum(lot[4] for lot in lots_devis),
+                avec_couts
+            ),
+            'lots': [
+                {'id': lot_id, 'nom': nom, **_totaux(total_ht, total_debourse, nombre, avec_couts)}
+                for lot_id, nom, total_ht, total_debourse, nombre in lots_devis
+            ],
+        })
+    return resultat
@@ -0,0 +1,167 @@
+"""
+Comparaison du contenu de deux devis, ou de deux révisions figées.
+
+Contrairement à la comparaison des révisions d'un même devis par identifiant
+(voir devis/revisions.py), les lignes sont ici rapprochées par leur contenu, ce
+qui permet de comparer un devis à sa copie (duplicate) ou à un autre devis :
+- les lots sont rapprochés par nom ;
+- dans deux lots rapprochés, les lignes sont rapprochées par (ouvrage,
+  description normalisée), via un dictionnaire de files : chaque ligne est
+  placée puis cherchée une seule fois, sans comparaison deux à deux. Les lignes
+  de même clé sont appariées dans l'ordre d'affichage.
+
+Chaque côté est chargé en un nombre fixe de requêtes : lots puis lignes (sous
+forme de tuples de valeurs) d'un devis vivant, ou une seule ligne de
+RevisionDevis pour une révision.
+"""
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from .models import LigneDevis
+from .revisions import lire_revision
+
+CHAMPS_LIGNE = ('ouvrage', 'description', 'unite', 'quantite', 'prix_unitaire', 'debourse')
+CHAMPS_COMPARES = ('unite', 'quantite', 'prix_unitaire', 'debourse')
+CENTIME = Decimal('0.01')
+
+
+def _normaliser(texte):
+    return ' '.join((texte or '').split()).casefold()
+
+
+def _decimal(valeur):
+    return Decimal(str(valeur)) if valeur is not None else Decimal('0')
+
+
+def _ligne(valeurs):
+    ligne = dict(zip(CHAMPS_LIGNE, valeurs))
+    for champ in ('quantite', 'prix_unitaire', 'debourse'):
+        ligne[champ] = _decimal(ligne[champ])
+    return ligne
+
+
+def charger_devis(devis):
+    """
+    Charge l'arbre d'un devis vivant (deux requêtes) : [(nom du lot, [lignes])].
+    """
+    lots = {lot_id: (nom, []) for lot_id, nom in devis.lots.order_by('ordre', 'nom', 'id').values_list('id', 'nom')}
+    for valeurs in (
+        LigneDevis.objects.filter(lot__devis=devis)
+        .order_by('lot_id', 'ordre', 'id')
+        .values_list('lot_id', 'ouvrage_id', 'description', 'unite', 'quantite', 'prix_unitaire', 'debourse')
+    ):
+        lots[valeurs[0]][1].append(_ligne(valeurs[1:]))
+    return list(lots.values())
+
+
+def charger_revision(devis_id, numero):
+    """
+    Charge l'arbre d'une révision (une requête), ou None si elle n'existe pas.
+    """
+    detail = lire_revision(devis_id, numero)
+    if detail is None:
+        return None
+    return [
+        (lot['nom'], [_ligne(ligne.get(champ) for champ in CHAMPS_LIGNE) for ligne in lot.get('lignes', [])])
+        for lot in detail.get('lots', [])
+    ]
+
+
+def _total(lignes, champ='prix_unitaire'):
+    return sum((ligne['quantite'] * ligne[champ] for ligne in lignes), Decimal('0'))
+
+
+def _delta(avant, apres):
+    avant, apres = avant.quantize(CENTIME), apres.quantize(CENTIME)
+    return {'avant': avant, 'apres': apres, 'delta': apres - avant}
+
+
+def _cle(ligne):
+    return (ligne['ouvrage'], _normaliser(ligne['description']))
+
+
+def _public(ligne, avec_couts):
+    ligne = {**ligne, 'total_ht': (ligne['quantite'] * ligne['prix_unitaire']).quantize(CENTIME)}
+    if not avec_couts:
+        ligne.pop('debourse')
+    return ligne
+
+
+def _comparer_lignes(avant, apres, avec_couts):
+    """
+    Rapproche les lignes de deux lots par clé, en temps linéaire.
+    """
+    files = defaultdict(deque)
+    for ligne in avant:
+        files[_cle(ligne)].append(ligne)
+
+    champs = CHAMPS_COMPARES if avec_couts else CHAMPS_COMPARES[:-1]
+    ajoutees, modifiees, identiques = [], [], 0
+    for ligne in apres:
+        file = files.get(_cle(ligne))
+        if not file:
+            ajoutees.append(_public(ligne, avec_couts))
+            continue
+        ancienne = file.popleft()
+        changements = {
+            champ: {'avant': ancienne[champ], 'apres': ligne[champ]}
+            for champ in champs if ancienne[champ] != ligne[champ]
+        }
+        if not changements:
+            identiques += 1
+            continue
+        modifiees.append({
+            'ouvrage': ligne['ouvrage'],
+            'description': ligne['description'],
+            'changements': changements,
+            'total_ht': _delta(
+                ancienne['quantite'] * ancienne['prix_unitaire'], ligne['quantite'] * ligne['prix_unitaire']
+            ),
+        })
+
+    supprimees = [_public(ligne, avec_couts) for file in files.values() for ligne in file]
+    return {'ajoutees': ajoutees, 'supprimees': supprimees, 'modifiees': modifiees, 'identiques': identiques}
+
+
+def comparer_arbres(avant, apres, avec_couts=True):
+    """
+    Compare deux arbres [(nom du lot, [lignes])].
+
+    Returns:
+        Dictionnaire {'lots', 'totaux', 'resume'} : différences par lot (lots de
+        l'arbre comparé dans leur ordre, puis lots supprimés) avec la variation de
+        leur total HT, variation des totaux et nombre de lignes par résultat
+    """
+    lots_avant = defaultdict(deque)
+    for nom, lignes in avant:
+        lots_avant[_normaliser(nom)].append((nom, lignes))
+
+    paires = []
+    for nom, lignes in apres:
+        file = lots_avant.get(_normaliser(nom))
+        if file:
+            paires.append((nom, 'modifie', file.popleft()[1], lignes))
+        else:
+            paires.append((nom, 'ajoute', [], lignes))
+    paires.extend((nom, 'supprime', lignes, []) for file in lots_avant.values() for nom, lignes in file)
+
+    lots = []
+    resume = {'ajoutees': 0, 'supprimees': 0, 'modifiees': 0, 'identiques': 0}
+    for nom, etat, lignes_avant, lignes_apres in paires:
+        differences = _comparer_lignes(lignes_avant, lignes_apres, avec_couts)
+        for resultat in resume:
+            resume[resultat] += differences[resultat] if resultat == 'identiques' else len(differences[resultat])
+        if etat == 'modifie' and not (differences['ajoutees'] or differences['supprimees'] or differences['modifiees']):
+            etat = 'identique'
+        lot = {'nom': nom, 'etat': etat, 'total_ht': _delta(_total(lignes_avant), _total(lignes_apres))}
+        if avec_couts:
+            lot['total_debourse'] = _delta(_total(lignes_avant, 'debourse'), _total(lignes_apres, 'debourse'))
+        lots.append({**lot, **differences})
+
+    lignes_avant = [ligne for _, lignes in avant for ligne in lignes]
+    lignes_apres = [ligne for _, lignes in apres for ligne in lignes]
+    totaux = {'total_ht': _delta(_total(lignes_avant), _total(lignes_apres))}
+    if avec_couts:
+        totaux['total_debourse'] = _delta(_total(lignes_avant, 'debourse'), _total(lignes_apres, 'debourse'))
+
+    return {'lots': lots, 'totaux': totaux, 'resume': resume}
@@ -0,0 +1,82 @@
+"""
+Duplication ensembliste d'un devis.
+
+Les lots puis les lignes sont copiés chacun par une seule requête
+INSERT ... SELECT : aucune ligne ne transite par Python et LigneDevis.save
+n'est pas appelé. Les lignes sont rattachées à leur nouveau lot par jointure
+sur (devis, ordre), unique pour les lots d'un devis.
+
+Le devis d'origine est verrouillé et relu dans la transaction : une modification
+concurrente de ses lignes attend la fin de la copie (elle met à jour les totaux
+du devis), et les totaux recopiés correspondent aux lignes copiées.
+"""
+from django.db import connection, transaction
+
+from .models import Devis, Lot, LigneDevis
+from .numerotation import attribuer_numero
+
+
+def _colonnes_copiees(modele, exclues):
+    """
+    Retourne les colonnes concrètes d'un modèle à recopier telles quelles.
+    """
+    return [
+        champ.column for champ in modele._meta.concrete_fields
+        if not champ.primary_key and champ.name not in exclues
+    ]
+
+
+def dupliquer_devis(devis, client=None, numero=None, entreprise=''):
+    """
+    Duplique un devis, ses lots et ses lignes en une transaction.
+
+    Args:
+        devis: Devis à dupliquer
+        client: Client du nouveau devis (par défaut, celui du devis d'origine)
+        numero: Numéro du nouveau devis (par défaut, le prochain numéro attribué)
+        entreprise: Clé du compteur de numéros (voir numerotation.entreprise_utilisateur)
+
+    Returns:
+        Le nouveau devis, avec ses totaux déjà renseignés
+    """
+    with transaction.atomic():
+        devis = Devis.objects.select_for_update().get(pk=devis.pk)
+        nouveau_devis = Devis.objects.create(
+            client_id=client.pk if client is not None else devis.client_id,
+            objet=f"Copie de : {devis.objet}",
+            statut='brouillon',
+            numero=numero or attribuer_numero(entreprise),
+            date_validite=devis.date_validite,
+            commentaire=devis.commentaire,
+            conditions_paiement=devis.conditions_paiement,
+            marge_globale=devis.marge_globale,
+            total_ht=devis.total_ht,
+            total_debourse=devis.total_debourse
+        )
+
+        qn = connection.ops.quote_name
+        lot_devis = qn(Lot._meta.get_field('devis').column)
+        ligne_lot = qn(LigneDevis._meta.get_field('lot').column)
+        table_lot = qn(Lot._meta.db_table)
+        table_ligne = qn(LigneDevis._meta.db_table)
+        colonnes_lot = ', '.join(qn(c) for c in _colonnes_copiees(Lot, {'devis'}))
+        colonnes_ligne = _colonnes_copiees(LigneDevis, {'lot'})
+        liste_ligne = ', '.join(qn(c) for c in colonnes_ligne)
+        select_ligne = ', '.join(f"l.{qn(c)}" for c in colonnes_ligne)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table_lot} ({lot_devis}, {colonnes_lot}) "
+                f"SELECT %s, {colonnes_lot} FROM {table_lot} WHERE {lot_devis} = %s",
+                [nouveau_devis.pk, devis.pk]
+            )
+            cursor.execute(
+                f"INSERT INTO {table_ligne} ({ligne_lot}, {liste_ligne}) "
+                f"SELECT nl.id, {select_ligne} FROM {table_ligne} l "
+                f"JOIN {table_lot} al ON al.id = l.{ligne_lot} "
+                f"JOIN {table_lot} nl ON nl.{lot_devis} = %s AND nl.ordre = al.ordre "
+                f"WHERE al.{lot_devis} = %s",
+                [nouveau_devis.pk, devis.pk]
+            )
+
+    return nouveau_devis
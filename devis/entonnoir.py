@@ -0,0 +1,186 @@
+"""
+Historique des statuts des devis, entonnoir de conversion et délais.
+
+Chaque changement de statut (et le statut initial d'un devis créé) est ajouté à
+TransitionStatutDevis dans la même transaction que l'enregistrement du devis
+(Devis.save), avec la durée passée dans l'ancien statut et la durée écoulée
+depuis le premier statut du devis : deux bornes lues par l'index (devis, date).
+
+AgregatStatutDevis cumule ces transitions par mois, client et transition. Il
+n'est jamais recalculé : chaque transition y ajoute sa contribution, et la
+suppression d'un devis y retire celles de ses transitions. Les rapports ne lisent
+que ces cumuls, dont la taille dépend du nombre de mois et de clients, pas du
+nombre de devis.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .models import AgregatStatutDevis, TransitionStatutDevis
+
+# Étapes de l'entonnoir de conversion, dans l'ordre
+ETAPES = ('brouillon', 'envoyé', 'accepté')
+
+SECONDES_PAR_JOUR = 86400
+
+
+def mois_transition(date):
+    """
+    Retourne le mois (premier jour, fuseau local) auquel une transition est rattachée.
+    """
+    return timezone.localdate(date).replace(day=1)
+
+
+def _secondes(duree):
+    return int(duree.total_seconds()) if duree is not None else 0
+
+
+def cumuler_transitions(transitions, signe=1):
+    """
+    Ajoute (signe=1) ou retire (signe=-1) des transitions des agrégats.
+
+    Comme pour la prévision d'achats (voir prevision._appliquer), les agrégats
+    manquants sont d'abord insérés à zéro en ignorant les conflits, puis tous
+    sont verrouillés et incrémentés.
+    """
+    cumuls = defaultdict(lambda: [0, 0, 0])
+    for transition in transitions:
+        cumul = cumuls[(
+            mois_transition(transition.date), transition.client_id,
+            transition.ancien_statut, transition.nouveau_statut
+        )]
+        cumul[0] += signe
+        cumul[1] += signe * _secondes(transition.duree_statut)
+        cumul[2] += signe * _secondes(transition.duree_cycle)
+    if not cumuls:
+        return
+
+    with transaction.atomic():
+        AgregatStatutDevis.objects.bulk_create(
+            [
+                AgregatStatutDevis(mois=mois, client_id=client_id, ancien_statut=ancien, nouveau_statut=nouveau)
+                for mois, client_id, ancien, nouveau in cumuls
+            ],
+            ignore_conflicts=True
+        )
+        agregats = [
+            agregat
+            for agregat in AgregatStatutDevis.objects.select_for_update().filter(
+                mois__in={cle[0] for cle in cumuls}, client_id__in={cle[1] for cle in cumuls}
+            )
+            if (agregat.mois, agregat.client_id, agregat.ancien_statut, agregat.nouveau_statut) in cumuls
+        ]
+        for agregat in agregats:
+            nombre, duree_statut, duree_cycle = cumuls[
+                (agregat.mois, agregat.client_id, agregat.ancien_statut, agregat.nouveau_statut)
+            ]
+            agregat.nombre += nombre
+            agregat.duree_statut += duree_statut
+            agregat.duree_cycle += duree_cycle
+        AgregatStatutDevis.objects.bulk_update(agregats, ['nombre', 'duree_statut', 'duree_cycle'])
+
+
+def enregistrer_transition(devis, ancien_statut='', auteur=None):
+    """
+    Ajoute au journal le passage d'un devis à son statut actuel, et le cumule.
+    Appelé par Devis.save, dans sa transaction.
+    """
+    maintenant = timezone.now()
+    bornes = devis.transitions_statut.aggregate(premiere=Min('date'), derniere=Max('date'))
+    transition = TransitionStatutDevis.objects.create(
+        devis=devis,
+        client_id=devis.client_id,
+        ancien_statut=ancien_statut or '',
+        nouveau_statut=devis.statut,
+        date=maintenant,
+        auteur=auteur if auteur is not None and auteur.is_authenticated else None,
+        duree_statut=maintenant - bornes['derniere'] if bornes['derniere'] else None,
+        duree_cycle=maintenant - bornes['premiere'] if bornes['premiere'] else None,
+    )
+    cumuler_transitions([transition])
+    return transition
+
+
+def retirer_transitions(devis_id):
+    """
+    Retire des agrégats les transitions d'un devis (avant sa suppression).
+    """
+    cumuler_transitions(TransitionStatutDevis.objects.filter(devis_id=devis_id), signe=-1)
+
+
+def _jours(secondes, nombre):
+    return round(secondes / nombre / SECONDES_PAR_JOUR, 2) if nombre else None
+
+
+def _taux(nombre, base):
+    return round(nombre * 100 / base, 2) if base else None
+
+
+def rapport_entonnoir(debut=None, fin=None, client_id=None):
+    """
+    Entonnoir de conversion et délais entre statuts, lus depuis les agrégats.
+
+    Args:
+        debut, fin: Premier et dernier mois retenus (inclus)
+        client_id: Limite le rapport aux devis d'un client
+
+    Returns:
+        Dictionnaire {'entonnoir', 'entrees', 'delais', 'mois'} : étapes de
+        l'entonnoir avec le taux de passage depuis l'étape précédente, entrées
+        dans chaque statut sur la période, nombre et délais moyens (en jours) de
+        chaque transition, entrées par statut et par mois
+    """
+    agregats = AgregatStatutDevis.objects.all()
+    if debut is not None:
+        agregats = agregats.filter(mois__gte=debut)
+    if fin is not None:
+        agregats = agregats.filter(mois__lte=fin)
+    if client_id is not None:
+        agregats = agregats.filter(client_id=client_id)
+
+    entrees = defaultdict(int)
+    par_mois = defaultdict(lambda: defaultdict(int))
+    transitions = defaultdict(lambda: [0, 0, 0])
+    for mois, ancien, nouveau, nombre, duree_statut, duree_cycle in (
+        agregats.order_by('mois')
+        .values('mois', 'ancien_statut', 'nouveau_statut')
+        .annotate(n=Sum('nombre'), ds=Sum('duree_statut'), dc=Sum('duree_cycle'))
+        .values_list('mois', 'ancien_statut', 'nouveau_statut', 'n', 'ds', 'dc')
+    ):
+        if not nombre:
+            continue
+        entrees[nouveau] += nombre
+        par_mois[mois][nouveau] += nombre
+        if ancien:
+            cumul = transitions[(ancien, nouveau)]
+            cumul[0] += nombre
+            cumul[1] += duree_statut
+            cumul[2] += duree_cycle
+
+    entonnoir = []
+    for rang, etape in enumerate(ETAPES):
+        niveau = {'statut': etape, 'entrees': entrees.get(etape, 0)}
+        if rang:
+            niveau['taux_conversion'] = _taux(niveau['entrees'], entonnoir[-1]['entrees'])
+        entonnoir.append(niveau)
+
+    return {
+        'entonnoir': entonnoir,
+        'entrees': dict(entrees),
+        'delais': [
+            {
+                'de': ancien,
+                'vers': nouveau,
+                'nombre': nombre,
+                'duree_moyenne_jours': _jours(duree_statut, nombre),
+                'cycle_moyen_jours': _jours(duree_cycle, nombre),
+            }
+            for (ancien, nouveau), (nombre, duree_statut, duree_cycle) in sorted(transitions.items())
+        ],
+        'mois': [
+            {'mois': mois.strftime('%Y-%m'), 'entrees': dict(statuts)}
+            for mois, statuts in par_mois.items()
+        ],
+    }
@@ -0,0 +1,164 @@
+"""
+Exports CSV et XLSX des devis et des lignes de devis.
+
+Les lignes exportées sont lues par un curseur côté serveur (iterator), sous
+forme de tuples de valeurs (values_list) : aucune instance de modèle n'est
+construite et seul le paquet de lignes en cours de lecture est en mémoire.
+
+Le CSV (séparateur ';') est écrit au fil de la lecture dans une
+StreamingHttpResponse, par blocs (voir devis/flux.py). Le XLSX est écrit par
+openpyxl en mode write_only, qui sérialise chaque ligne dès son ajout, dans un
+fichier temporaire renvoyé ensuite en flux ; il utilise le paquet openpyxl
+(voir requirements.txt).
+"""
+import csv
+import tempfile
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.http import FileResponse, StreamingHttpResponse
+
+from .flux import TAILLE_CURSEUR, par_blocs
+from .models import LigneDevis
+
+FORMATS = ('csv', 'xlsx')
+
+TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+TOTAL_LIGNE = ExpressionWrapper(F('prix_unitaire') * F('quantite'), output_field=DecimalField(max_digits=20, decimal_places=4))
+TOTAL_DEBOURSE_LIGNE = ExpressionWrapper(F('debourse') * F('quantite'), output_field=DecimalField(max_digits=20, decimal_places=4))
+
+# Colonnes exportées : (en-tête, champ lu par values_list, colonne de coûts)
+COLONNES_DEVIS = (
+    ("Numéro", 'numero', False),
+    ("Objet", 'objet', False),
+    ("Client", 'client__nom', False),
+    ("Statut", 'statut', False),
+    ("Date de création", 'date_creation', False),
+    ("Date de validité", 'date_validite', False),
+    ("Date d'acceptation", 'date_acceptation', False),
+    ("Total HT", 'total_ht', False),
+    ("Total déboursé sec", 'total_debourse', True),
+)
+
+COLONNES_LIGNES = (
+    ("Devis", 'lot__devis__numero', False),
+    ("Client", 'lot__devis__client__nom', False),
+    ("Date du devis", 'lot__devis__date_creation', False),
+    ("Lot", 'lot__nom', False),
+    ("Type", 'type', False),
+    ("Code ouvrage", 'ouvrage__code', False),
+    ("Description", 'description', False),
+    ("Unité", 'unite', False),
+    ("Quantité", 'quantite', False),
+    ("Prix unitaire HT", 'prix_unitaire', False),
+    ("Total HT", 'export_total_ht', False),
+    ("Déboursé sec unitaire", 'debourse', True),
+    ("Total déboursé sec", 'export_total_debourse', True),
+)
+
+
+class ExportIndisponible(Exception):
+    """
+    Levée lorsque le format d'export demandé ne peut pas être produit.
+    """
+
+
+def _colonnes(colonnes, avec_couts):
+    return [(entete, champ) for entete, champ, cout in colonnes if avec_couts or not cout]
+
+
+def _lignes(queryset, colonnes):
+    """
+    Itère sur les valeurs des colonnes d'un queryset, par un curseur côté serveur.
+    """
+    return queryset.values_list(*(champ for _, champ in colonnes)).iterator(chunk_size=TAILLE_CURSEUR)
+
+
+class _Tampon:
+    """
+    Pseudo-fichier renvoyant ce qui y est écrit (csv.writer écrit ligne à ligne).
+    """
+    def write(self, valeur):
+        return valeur
+
+
+def _fragments_csv(entetes, lignes):
+    writer = csv.writer(_Tampon(), delimiter=';')
+    yield writer.writerow(entetes)
+    for ligne in lignes:
+        yield writer.writerow(ligne)
+
+
+def _fichier_xlsx(titre, entetes, lignes):
+    """
+    Écrit les lignes dans un classeur XLSX temporaire, rembobiné pour la lecture.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportIndisponible("L'export XLSX nécessite le paquet openpyxl")
+
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet(titre)
+    feuille.append(entetes)
+    for ligne in lignes:
+        feuille.append(ligne)
+
+    fichier = tempfile.TemporaryFile()
+    classeur.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+def _reponse(nom, titre, queryset, colonnes, format_export):
+    """
+    Retourne la réponse HTTP de l'export d'un queryset (vérifié à la création de la
+    réponse pour le XLSX, au fil de l'envoi pour le CSV).
+    """
+    entetes = [entete for entete, _ in colonnes]
+    lignes = _lignes(queryset, colonnes)
+
+    if format_export == 'xlsx':
+        return FileResponse(
+            _fichier_xlsx(titre, entetes, lignes),
+            as_attachment=True, filename=f"{nom}.xlsx", content_type=TYPE_XLSX
+        )
+
+    response = StreamingHttpResponse(
+        par_blocs(_fragments_csv(entetes, lignes)),
+        content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nom}.csv"'
+    return response
+
+
+def exporter_devis(devis, format_export='csv', avec_couts=True):
+    """
+    Exporte la liste des devis d'un queryset, dans l'ordre du queryset.
+
+    Raises:
+        ExportIndisponible: Format XLSX sans openpyxl
+    """
+    return _reponse("devis", "Devis", devis, _colonnes(COLONNES_DEVIS, avec_couts), format_export)
+
+
+def exporter_lignes(nom, lignes, format_export='csv', avec_couts=True):
+    """
+    Exporte des lignes de devis, regroupées par devis puis par lot, dans l'ordre
+    d'affichage.
+
+    Raises:
+        ExportIndisponible: Format XLSX sans openpyxl
+    """
+    lignes = lignes.annotate(
+        export_total_ht=TOTAL_LIGNE,
+        export_total_debourse=TOTAL_DEBOURSE_LIGNE,
+    ).order_by('lot__devis_id', 'lot__ordre', 'lot_id', 'ordre', 'id')
+    return _reponse(nom, "Lignes", lignes, _colonnes(COLONNES_LIGNES, avec_couts), format_export)
+
+
+def lignes_des_devis(devis):
+    """
+    Lignes de devis appartenant aux devis d'un queryset (sous-requête).
+    """
+    return LigneDevis.objects.filter(lot__devis__in=devis.order_by().values('pk'))
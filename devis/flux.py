@@ -0,0 +1,89 @@
+"""
+Rendu JSON en flux du détail d'un devis.
+
+Le document produit a la même forme que DevisDetailSerializer, mais il est écrit
+au fil de l'eau : l'en-tête du devis et les lots sont sérialisés séparément, et
+les lignes sont lues par un curseur côté serveur (iterator) en un seul parcours
+ordonné par lot. Chaque ligne est sérialisée puis écrite dans un tampon vidé par
+blocs : la mémoire utilisée ne dépend pas du nombre de lignes.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import LigneDevis
+from .serializers import DevisDetailSerializer, LigneDevisSerializer, LotDetailSerializer
+
+TAILLE_BLOC = 64 * 1024
+TAILLE_CURSEUR = 1000
+
+
+def _json(donnees):
+    return json.dumps(donnees, cls=JSONEncoder, ensure_ascii=False)
+
+
+def _ouvrir(donnees, cle):
+    """
+    Retourne le début d'un objet JSON dont la dernière clé, `cle`, est une liste
+    dont le contenu reste à écrire.
+    """
+    debut = _json(donnees)[:-1]
+    separateur = ', ' if donnees else ''
+    return f'{debut}{separateur}"{cle}": ['
+
+
+def fragments_devis(devis, context):
+    """
+    Génère le détail JSON d'un devis par fragments.
+    """
+    entete = DevisDetailSerializer(devis, context=context)
+    entete.fields.pop('lots')
+    serializer_lot = LotDetailSerializer(context=context)
+    serializer_lot.fields.pop('lignes')
+    serializer_ligne = LigneDevisSerializer(context=context)
+
+    yield _ouvrir(entete.data, 'lots')
+
+    lignes = (
+        LigneDevis.objects.filter(lot__devis=devis)
+        .order_by('lot__ordre', 'lot__nom', 'lot_id', 'ordre', 'id')
+        .iterator(chunk_size=TAILLE_CURSEUR)
+    )
+    ligne = next(lignes, None)
+
+    for rang_lot, lot in enumerate(devis.lots.order_by('ordre', 'nom', 'id')):
+        yield (', ' if rang_lot else '') + _ouvrir(serializer_lot.to_representation(lot), 'lignes')
+        rang_ligne = 0
+        while ligne is not None and ligne.lot_id == lot.id:
+            yield (', ' if rang_ligne else '') + _json(serializer_ligne.to_representation(ligne))
+            rang_ligne += 1
+            ligne = next(lignes, None)
+        yield ']}'
+
+    yield ']}'
+
+
+def par_blocs(fragments):
+    """
+    Regroupe les fragments en blocs d'environ TAILLE_BLOC octets.
+    """
+    tampon, taille = [], 0
+    for fragment in fragments:
+        tampon.append(fragment)
+        taille += len(fragment)
+        if taille >= TAILLE_BLOC:
+            yield ''.join(tampon).encode('utf-8')
+            tampon, taille = [], 0
+    if tampon:
+        yield ''.join(tampon).encode('utf-8')
+
+
+def reponse_flux_devis(devis, context):
+    """
+    Retourne une réponse HTTP écrivant le détail JSON du devis en flux.
+    """
+    return StreamingHttpResponse(
+        par_blocs(fragments_devis(devis, context)),
+        content_type='application/json'
+    )
@@ -0,0 +1,109 @@
+"""
+Historique des prix de vente pratiqués par ouvrage, conservé en instantanés.
+
+Pour chaque ouvrage, l'instantané HistoriquePrixOuvrage résume les lignes des
+devis acceptés et refusés : nombre de lignes, prix unitaire et marge minimum,
+médian et maximum. Toute modification d'une ligne de l'ouvrage dans un devis
+accepté ou refusé, ou l'entrée ou la sortie d'un devis qui le contient de ces
+statuts, invalide l'instantané (une requête UPDATE) ; les lignes des autres
+devis ne le concernent pas. Il est recalculé à la lecture suivante à partir des seules lignes de cet ouvrage.
+Comme pour les statistiques, l'invalidation incrémente la génération de
+l'instantané et un recalcul n'est enregistré que si elle n'a pas changé pendant
+le calcul.
+"""
+from statistics import median
+
+from django.db.models import F
+from django.utils import timezone
+
+from .arbre import calculer_marge
+from .models import Devis, HistoriquePrixOuvrage, LigneDevis
+
+STATUTS_HISTORIQUE = ('accepté', 'refusé')
+
+
+def _nombre(valeur):
+    """
+    Convertit une valeur (Decimal ou None) en nombre JSON arrondi à 2 décimales.
+    """
+    return round(float(valeur), 2) if valeur is not None else None
+
+
+def _resume(valeurs):
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return {"min": None, "median": None, "max": None}
+    return {"min": _nombre(valeurs[0]), "median": _nombre(median(valeurs)), "max": _nombre(valeurs[-1])}
+
+
+def calculer_historique_prix(ouvrage_id):
+    """
+    Calcule l'historique des prix d'un ouvrage, en une requête sur ses lignes.
+    """
+    lignes = {statut: [] for statut in STATUTS_HISTORIQUE}
+    for statut, prix_unitaire, debourse in (
+        LigneDevis.objects.filter(ouvrage_id=ouvrage_id, lot__devis__statut__in=STATUTS_HISTORIQUE)
+        .values_list('lot__devis__statut', 'prix_unitaire', 'debourse')
+    ):
+        lignes[statut].append((prix_unitaire, debourse))
+
+    return {
+        "ouvrage": ouvrage_id,
+        **{
+            statut: {
+                "nombre": len(valeurs),
+                "prix_unitaire": _resume(prix for prix, _ in valeurs),
+                "marge": _resume(calculer_marge(prix, debourse) for prix, debourse in valeurs),
+            }
+            for statut, valeurs in lignes.items()
+        }
+    }
+
+
+def obtenir_historique_prix(ouvrage_id):
+    """
+    Retourne l'historique des prix d'un ouvrage depuis l'instantané, en le
+    recalculant s'il est absent ou périmé.
+    """
+    instantane, _ = HistoriquePrixOuvrage.objects.get_or_create(ouvrage_id=ouvrage_id, defaults={'a_jour': False})
+    if instantane.a_jour:
+        return instantane.donnees
+
+    donnees = calculer_historique_prix(ouvrage_id)
+    HistoriquePrixOuvrage.objects.filter(pk=instantane.pk, generation=instantane.generation).update(
+        donnees=donnees, a_jour=True, date_calcul=timezone.now()
+    )
+    return donnees
+
+
+def ouvrages_des_devis(devis_ids):
+    """
+    Sous-requête des IDs d'ouvrages utilisés par les lignes des devis indiqués.
+    """
+    return (
+        LigneDevis.objects.filter(lot__devis__in=devis_ids, ouvrage__isnull=False)
+        .order_by()
+        .values('ouvrage_id')
+    )
+
+
+def devis_historises(**filtres):
+    """
+    Indique si l'un des devis correspondant aux filtres (par exemple pk=... ou
+    lots__pk__in=...) est dans un statut repris par l'historique des prix.
+    """
+    return Devis.objects.filter(statut__in=STATUTS_HISTORIQUE, **filtres).exists()
+
+
+def invalider_historique_prix(ouvrages):
+    """
+    Marque comme périmés les instantanés des ouvrages indiqués.
+
+    Args:
+        ouvrages: IDs d'ouvrages (liste, éventuellement avec des None, ou sous-requête)
+    """
+    if isinstance(ouvrages, (list, set, tuple)):
+        ouvrages = {ouvrage_id for ouvrage_id in ouvrages if ouvrage_id is not None}
+        if not ouvrages:
+            return
+    HistoriquePrixOuvrage.objects.filter(ouvrage__in=ouvrages).update(a_jour=False, generation=F('generation') + 1)
@@ -0,0 +1,340 @@
+"""
+Import d'un bordereau de quantités (DPGF) au format CSV ou XLSX dans un devis.
+
+Le fichier est lu ligne à ligne (csv.reader sur le flux téléversé, ou openpyxl
+en mode read_only pour les classeurs) : seules les valeurs utiles de chaque
+ligne sont conservées. La ligne d'en-tête est repérée parmi les premières
+lignes par le nom de ses colonnes (désignation et quantité au minimum ; code,
+unité, prix unitaire et déboursé facultatifs).
+
+Une ligne avec une désignation mais sans quantité ni unité ouvre un nouveau
+lot ; les lignes suivantes lui sont rattachées. Les codes sont rapprochés de
+Ouvrage.code en une seule requête : une ligne dont le code est connu devient
+une ligne 'ouvrage', pré-remplie comme une création unitaire, les autres des
+lignes manuelles. Les lots et les lignes valides sont insérés par bulk_create,
+par paquets de TAILLE_PAQUET lignes, au fil de la lecture et dans une seule
+transaction : seuls le paquet courant, le lot courant et les ouvrages déjà
+rencontrés sont gardés en mémoire, quelle que soit la taille du fichier. Les
+lignes invalides sont ignorées et signalées avec leur numéro dans le fichier.
+
+La lecture des fichiers XLSX utilise le paquet openpyxl (voir requirements.txt).
+"""
+import csv
+import io
+from collections import Counter
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+
+from bibliotheque.models import Ouvrage
+
+from .models import Devis, Lot, LigneDevis
+from .ordonnancement import PAS_ORDRE, cle_fin
+from .tarification import debourses_ouvrages, prix_vente_defaut
+from .totaux import quantites_inserees
+
+LIGNES_ENTETE = 20
+TAILLE_PAQUET = 500
+LOT_PAR_DEFAUT = "Lot importé"
+CENTIME = Decimal('0.01')
+MAXIMUM = Decimal('100000000')
+
+# Noms de colonnes reconnus (en minuscules, sans accents ni ponctuation)
+COLONNES = {
+    'code': {'code', 'ref', 'reference', 'article', 'codeouvrage'},
+    'description': {'designation', 'description', 'libelle', 'intitule'},
+    'unite': {'unite', 'u', 'un', 'unit'},
+    'quantite': {'quantite', 'qte', 'qt', 'quant', 'qty'},
+    'prix_unitaire': {'prixunitaire', 'prixunitaireht', 'pu', 'puht', 'prix'},
+    'debourse': {'debourse', 'deboursesec', 'ds'},
+}
+
+
+class PointVirgule(csv.excel):
+    """
+    Dialecte CSV par défaut lorsque le séparateur ne peut pas être détecté.
+    """
+    delimiter = ';'
+
+
+class FichierInvalide(Exception):
+    """
+    Levée lorsque le fichier ne peut pas être importé (format illisible,
+    en-tête introuvable, dépendance manquante).
+    """
+
+
+def _normaliser(valeur):
+    """
+    Normalise un nom de colonne : minuscules, sans accents ni ponctuation.
+    """
+    texte = unicodedata.normalize('NFKD', str(valeur or '')).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]', '', texte.lower())
+
+
+def _texte(valeur):
+    return '' if valeur is None else str(valeur).strip()
+
+
+def _decimal(valeur):
+    """
+    Convertit une cellule en Decimal à 2 décimales (virgule décimale et espaces
+    acceptés), None si elle est vide.
+
+    Raises:
+        ValueError: Valeur non numérique ou hors limites
+    """
+    if valeur is None or valeur == '':
+        return None
+    if isinstance(valeur, str):
+        valeur = valeur.replace('\xa0', '').replace(' ', '').replace(',', '.')
+        if not valeur:
+            return None
+    try:
+        nombre = Decimal(str(valeur))
+    except InvalidOperation:
+        raise ValueError("Nombre invalide")
+    if not nombre.is_finite():
+        raise ValueError("Nombre invalide")
+    if abs(nombre) >= MAXIMUM:
+        raise ValueError("Nombre trop grand")
+    return nombre.quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+
+def _lignes_csv(fichier):
+    """
+    Itère sur les lignes d'un fichier CSV (séparateur détecté, UTF-8 ou Latin-1).
+    """
+    debut = fichier.read(4096)
+    fichier.seek(0)
+    encodage = 'utf-8-sig'
+    try:
+        debut.decode(encodage)
+    except UnicodeDecodeError as e:
+        # Un caractère coupé en fin d'échantillon n'indique pas un autre encodage
+        if e.start < len(debut) - 3:
+            encodage = 'latin-1'
+    try:
+        dialecte = csv.Sniffer().sniff(debut.decode(encodage, errors='ignore'), delimiters=';,\t')
+    except csv.Error:
+        dialecte = PointVirgule
+    yield from csv.reader(io.TextIOWrapper(fichier, encoding=encodage, newline=''), dialecte)
+
+
+def _lignes_xlsx(fichier):
+    """
+    Itère sur les lignes de la première feuille d'un classeur XLSX, en lecture seule.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise FichierInvalide("L'import des fichiers XLSX nécessite le paquet openpyxl")
+
+    try:
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+    except Exception:
+        raise FichierInvalide("Le classeur XLSX est illisible")
+    try:
+        yield from classeur.worksheets[0].iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+
+def lire_lignes(fichier, nom):
+    """
+    Itère sur les lignes brutes d'un fichier selon son extension (.xlsx/.xlsm ou CSV).
+    """
+    if nom.lower().endswith(('.xlsx', '.xlsm')):
+        return _lignes_xlsx(fichier)
+    return _lignes_csv(fichier)
+
+
+def _colonnes(lignes):
+    """
+    Repère la ligne d'en-tête parmi les premières lignes.
+
+    Returns:
+        Tuple (numéro de la ligne d'en-tête, {champ: index de colonne})
+    """
+    for numero, ligne in enumerate(lignes, start=1):
+        colonnes = {}
+        for index, valeur in enumerate(ligne):
+            nom = _normaliser(valeur)
+            for champ, alias in COLONNES.items():
+                if nom in alias and champ not in colonnes:
+                    colonnes[champ] = index
+        if 'description' in colonnes and 'quantite' in colonnes:
+            return numero, colonnes
+        if numero >= LIGNES_ENTETE:
+            break
+    raise FichierInvalide(
+        "Ligne d'en-tête introuvable : les colonnes Désignation et Quantité sont requises"
+    )
+
+
+def analyser(lignes):
+    """
+    Analyse les lignes brutes d'un DPGF, au fil de la lecture.
+
+    Yields:
+        Éléments dans l'ordre du fichier : ('lot', nom), ('ligne', numéro, données)
+        ou ('erreur', numéro, {champ: [messages]}) pour une ligne invalide
+
+    Raises:
+        FichierInvalide: En-tête introuvable (à la lecture du premier élément)
+    """
+    lignes = iter(lignes)
+    numero_entete, colonnes = _colonnes(lignes)
+
+    def cellule(ligne, champ):
+        index = colonnes.get(champ)
+        return ligne[index] if index is not None and index < len(ligne) else None
+
+    for numero, ligne in enumerate(lignes, start=numero_entete + 1):
+        code = _texte(cellule(ligne, 'code'))
+        description = _texte(cellule(ligne, 'description'))
+        unite = _texte(cellule(ligne, 'unite'))
+        quantite = cellule(ligne, 'quantite')
+
+        if not any(_texte(valeur) for valeur in ligne):
+            continue
+        if _texte(quantite) == '' and not unite:
+            if description:
+                yield ('lot', f"{code} {description}".strip()[:100])
+            continue
+
+        donnees, erreurs_ligne = {'code': code, 'description': description[:255], 'unite': unite[:20]}, {}
+        for champ in ('quantite', 'prix_unitaire', 'debourse'):
+            try:
+                donnees[champ] = _decimal(cellule(ligne, champ))
+            except ValueError as e:
+                donnees[champ] = None
+                erreurs_ligne[champ] = [str(e)]
+        if not description and not code:
+            erreurs_ligne['description'] = ["Désignation requise"]
+        if donnees['quantite'] is None and 'quantite' not in erreurs_ligne:
+            erreurs_ligne['quantite'] = ["Quantité requise"]
+        elif donnees['quantite'] is not None and donnees['quantite'] < 0:
+            erreurs_ligne['quantite'] = ["La quantité doit être positive"]
+
+        if erreurs_ligne:
+            yield ('erreur', numero, erreurs_ligne)
+        else:
+            yield ('ligne', numero, donnees)
+
+
+class _Insertion:
+    """
+    Insertion par paquets des lots et des lignes d'un DPGF dans un devis verrouillé.
+    Les ouvrages sont rapprochés par code une fois par paquet (codes pas encore
+    rencontrés seulement).
+    """
+    def __init__(self, devis):
+        self.devis = devis
+        self.ordre_lot = cle_fin(devis.lots.all())
+        self.lot, self.ordre_ligne = None, 0
+        self.lots_a_creer, self.paquet = [], []
+        self.ouvrages, self.debourses = {}, {}
+        self.lots, self.nombre, self.quantites = [], 0, Counter()
+
+    def ouvrir_lot(self, nom):
+        if len(self.lots_a_creer) >= TAILLE_PAQUET:
+            self.vider()
+        self.lot = Lot(devis=self.devis, nom=nom, ordre=self.ordre_lot)
+        self.lots_a_creer.append(self.lot)
+        self.ordre_lot += PAS_ORDRE
+        self.ordre_ligne = 0
+
+    def ajouter_ligne(self, donnees):
+        if self.lot is None:
+            self.ouvrir_lot(LOT_PAR_DEFAUT)
+        self.ordre_ligne += PAS_ORDRE
+        self.paquet.append((donnees, self.lot, self.ordre_ligne))
+        if len(self.paquet) >= TAILLE_PAQUET:
+            self.vider()
+
+    def _rapprocher(self):
+        """
+        Cherche en une requête les ouvrages des codes du paquet pas encore rencontrés.
+        """
+        codes = {donnees['code'] for donnees, _, _ in self.paquet} - set(self.ouvrages)
+        codes.discard('')
+        if not codes:
+            return
+        trouves = {ouvrage.code: ouvrage for ouvrage in Ouvrage.objects.filter(code__in=codes)}
+        self.debourses.update(debourses_ouvrages(ouvrage.id for ouvrage in trouves.values()))
+        self.ouvrages.update({code: trouves.get(code) for code in codes})
+
+    def vider(self):
+        """
+        Insère les lots ouverts et le paquet de lignes courant.
+        """
+        Lot.objects.bulk_create(self.lots_a_creer)
+        self.lots.extend(lot.pk for lot in self.lots_a_creer)
+        self.lots_a_creer = []
+        if not self.paquet:
+            return
+
+        self._rapprocher()
+        nouvelles_lignes = [
+            _ligne_devis(donnees, lot, ordre, self.ouvrages, self.debourses)
+            for donnees, lot, ordre in self.paquet
+        ]
+        LigneDevis.objects.bulk_create(nouvelles_lignes)
+        for ligne in nouvelles_lignes:
+            self.quantites[ligne.ouvrage_id] += ligne.quantite
+        self.nombre += len(nouvelles_lignes)
+        self.paquet = []
+
+
+def importer_dpgf(devis, lignes):
+    """
+    Importe les lignes brutes d'un DPGF à la fin d'un devis, en une transaction.
+
+    Returns:
+        Dictionnaire {'lots': IDs des lots créés, 'lignes': nombre de lignes créées, 'erreurs': [...]}
+
+    Raises:
+        FichierInvalide: En-tête introuvable ou fichier illisible
+    """
+    erreurs = []
+    with transaction.atomic():
+        insertion = _Insertion(Devis.objects.select_for_update().get(pk=devis.pk))
+        for element in analyser(lignes):
+            if element[0] == 'lot':
+                insertion.ouvrir_lot(element[1])
+            elif element[0] == 'ligne':
+                insertion.ajouter_ligne(element[2])
+            else:
+                erreurs.append({'ligne': element[1], 'erreurs': element[2]})
+        insertion.vider()
+        quantites_inserees(devis.pk, insertion.quantites)
+
+    return {'lots': insertion.lots, 'lignes': insertion.nombre, 'erreurs': erreurs}
+
+
+def _ligne_devis(donnees, lot, ordre, ouvrages, debourses):
+    """
+    Construit (sans l'enregistrer) la ligne de devis d'une ligne du DPGF.
+    """
+    ouvrage = ouvrages.get(donnees['code'])
+    debourse = donnees['debourse']
+    if debourse is None:
+        debourse = round(debourses[ouvrage.id], 2) if ouvrage else Decimal('0')
+    prix_unitaire = donnees['prix_unitaire']
+    if prix_unitaire is None:
+        prix_unitaire = prix_vente_defaut(debourse) if ouvrage else Decimal('0')
+
+    return LigneDevis(
+        lot=lot,
+        type='ouvrage' if ouvrage else 'manuel',
+        ouvrage=ouvrage,
+        description=donnees['description'] or (ouvrage.nom if ouvrage else donnees['code']),
+        unite=donnees['unite'] or (ouvrage.unite if ouvrage else ''),
+        quantite=donnees['quantite'],
+        prix_unitaire=prix_unitaire,
+        debourse=debourse,
+        ordre=ordre,
+    )
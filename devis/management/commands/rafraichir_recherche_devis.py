@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from devis.models import Devis
+from devis.recherche import rafraichir_documents
+
+
+class Command(BaseCommand):
+    """
+    Reconstruit les documents de recherche plein texte des devis.
+
+    Exemples:
+        python manage.py rafraichir_recherche_devis
+        python manage.py rafraichir_recherche_devis --tout
+    """
+    help = "Reconstruit les documents de recherche périmés des devis (ou tous avec --tout)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tout',
+            action='store_true',
+            help="Reconstruit tous les documents, même ceux à jour",
+        )
+
+    def handle(self, *args, **options):
+        if options['tout']:
+            Devis.objects.filter(document_a_jour=True).update(document_a_jour=False)
+
+        nombre = rafraichir_documents()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} document(s) de recherche reconstruit(s)."))
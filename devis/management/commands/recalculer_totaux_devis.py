@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from devis.totaux import recalculer_totaux, totaux_divergents
+
+
+class Command(BaseCommand):
+    """
+    Recalcule et vérifie les totaux stockés sur les lots et les devis.
+
+    Exemples:
+        python manage.py recalculer_totaux_devis
+        python manage.py recalculer_totaux_devis --verifier
+        python manage.py recalculer_totaux_devis --devis 12 15
+    """
+    help = "Recalcule les totaux HT et déboursé stockés sur les lots et devis, puis les vérifie"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verifier',
+            action='store_true',
+            help="Vérifie uniquement les totaux, sans les modifier",
+        )
+        parser.add_argument(
+            '--devis',
+            nargs='+',
+            type=int,
+            help="IDs des devis à traiter (tous les devis par défaut)",
+        )
+
+    def handle(self, *args, **options):
+        devis_ids = options['devis']
+
+        if not options['verifier']:
+            with transaction.atomic():
+                recalculer_totaux(devis_ids)
+            self.stdout.write("Totaux recalculés.")
+
+        lots, devis = totaux_divergents(devis_ids)
+        nb_divergences = 0
+
+        for lot in lots:
+            nb_divergences += 1
+            self.stdout.write(self.style.WARNING(
+                f"Lot {lot['id']} (devis {lot['devis_id']}) : "
+                f"HT stocké {lot['total_ht']} / calculé {lot['calcul_ht']}, "
+                f"déboursé stocké {lot['total_debourse']} / calculé {lot['calcul_debourse']}"
+            ))
+
+        for d in devis:
+            nb_divergences += 1
+            self.stdout.write(self.style.WARNING(
+                f"Devis {d['numero']} : "
+                f"HT stocké {d['total_ht']} / calculé {d['calcul_ht']}, "
+                f"déboursé stocké {d['total_debourse']} / calculé {d['calcul_debourse']}"
+            ))
+
+        if nb_divergences:
+            raise CommandError(f"{nb_divergences} total(aux) divergent(s)")
+
+        self.stdout.write(self.style.SUCCESS("Tous les totaux sont cohérents."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from devis.models import Devis, Lot, LigneDevis
+from devis.ordonnancement import reequilibrer, verrouiller
+
+
+class Command(BaseCommand):
+    """
+    Renumérote les clés d'ordre des lots et des lignes en conservant leur ordre,
+    pour restaurer les écarts consommés par les déplacements successifs.
+    À planifier périodiquement (cron) en dehors des heures d'activité.
+
+    Exemples:
+        python manage.py reequilibrer_ordres_devis
+        python manage.py reequilibrer_ordres_devis --devis 12 15
+    """
+    help = "Renumérote les clés d'ordre des lots et lignes de devis"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--devis',
+            nargs='+',
+            type=int,
+            help="IDs des devis à traiter (tous les devis par défaut)",
+        )
+
+    def handle(self, *args, **options):
+        devis_ids = Devis.objects.values_list('id', flat=True)
+        if options['devis']:
+            devis_ids = devis_ids.filter(pk__in=options['devis'])
+
+        nb_devis = 0
+        for devis_id in devis_ids.iterator():
+            with transaction.atomic():
+                verrouiller(Devis, [devis_id])
+                reequilibrer(Lot.objects.filter(devis_id=devis_id))
+                lot_ids = list(Lot.objects.filter(devis_id=devis_id).values_list('id', flat=True))
+                verrouiller(Lot, lot_ids)
+                for lot_id in lot_ids:
+                    reequilibrer(LigneDevis.objects.filter(lot_id=lot_id))
+            nb_devis += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{nb_devis} devis renuméroté(s)."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from devis.models import Devis
+from devis.tarification import reevaluer_debourses
+
+
+class Command(BaseCommand):
+    """
+    Recalcule le déboursé des lignes 'ouvrage' des devis à partir des prix
+    actuels de la bibliothèque, et affiche l'effet sur la marge de chaque devis.
+
+    Exemples:
+        python manage.py reevaluer_debourses_devis
+        python manage.py reevaluer_debourses_devis --devis 12 15
+    """
+    help = "Met à jour le déboursé des lignes d'ouvrage des devis en brouillon depuis la bibliothèque"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--devis',
+            nargs='+',
+            type=int,
+            help="IDs des devis à traiter (tous les devis en brouillon par défaut)",
+        )
+
+    def handle(self, *args, **options):
+        devis = Devis.objects.filter(statut='brouillon')
+        if options['devis']:
+            devis = devis.filter(pk__in=options['devis'])
+
+        with transaction.atomic():
+            rapport = reevaluer_debourses(devis)
+
+        for d in rapport:
+            self.stdout.write(
+                f"Devis {d['numero']} : {d['lignes_modifiees']} ligne(s), "
+                f"déboursé {d['debourse_avant']:.2f} -> {d['debourse_apres']:.2f}, "
+                f"marge {d['marge_avant']:.2f} % -> {d['marge_apres']:.2f} %"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"{len(rapport)} devis mis à jour."))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:27
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def initialiser_totaux(apps, schema_editor):
+    """
+    Calcule les totaux des lots et devis existants à partir de leurs lignes.
+    """
+    Devis = apps.get_model('devis', 'Devis')
+    Lot = apps.get_model('devis', 'Lot')
+    LigneDevis = apps.get_model('devis', 'LigneDevis')
+    champ_total = DecimalField(max_digits=16, decimal_places=4)
+
+    def somme(lien, montant):
+        lignes = (
+            LigneDevis.objects.filter(**{lien: OuterRef('pk')})
+            .order_by()
+            .values(lien)
+            .annotate(total=Sum(ExpressionWrapper(montant, output_field=champ_total)))
+            .values('total')[:1]
+        )
+        return Coalesce(Subquery(lignes, output_field=champ_total), Value(Decimal('0')), output_field=champ_total)
+
+    ht = F('prix_unitaire') * F('quantite')
+    debourse = F('debourse') * F('quantite')
+    Lot.objects.update(total_ht=somme('lot', ht), total_debourse=somme('lot', debourse))
+    Devis.objects.update(total_ht=somme('lot__devis', ht), total_debourse=somme('lot__devis', debourse))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devis',
+            name='total_debourse',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Total déboursé sec'),
+        ),
+        migrations.AddField(
+            model_name='devis',
+            name='total_ht',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Total HT'),
+        ),
+        migrations.AddField(
+            model_name='lot',
+            name='total_debourse',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Total déboursé sec'),
+        ),
+        migrations.AddField(
+            model_name='lot',
+            name='total_ht',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Total HT'),
+        ),
+        migrations.RunPython(initialiser_totaux, migrations.RunPython.noop),
+    ]
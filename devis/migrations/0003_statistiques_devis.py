@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0002_totaux_stockes'),
+        ('tiers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiquesDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(max_length=64, unique=True, verbose_name='Clé')),
+                ('donnees', models.JSONField(default=dict, verbose_name='Données')),
+                ('a_jour', models.BooleanField(default=True, verbose_name='À jour')),
+                ('date_calcul', models.DateTimeField(auto_now=True, verbose_name='Date de calcul')),
+            ],
+            options={
+                'verbose_name': 'Statistiques de devis',
+                'verbose_name_plural': 'Statistiques de devis',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='devis',
+            index=models.Index(fields=['statut'], name='devis_devis_statut_a30d19_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devis',
+            index=models.Index(fields=['client', 'date_creation'], name='devis_devis_client__992256_idx'),
+        ),
+        migrations.AddField(
+            model_name='statistiquesdevis',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_devis', to='tiers.tiers', verbose_name='Client'),
+        ),
+    ]
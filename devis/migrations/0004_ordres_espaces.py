@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:33
+
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import F, Max
+
+PAS_ORDRE = 1024
+
+
+def espacer_ordres(apps, schema_editor):
+    """
+    Convertit les ordres denses (0, 1, 2...) en clés espacées de PAS_ORDRE,
+    conteneur par conteneur et en conservant l'ordre existant.
+    """
+    Lot = apps.get_model('devis', 'Lot')
+    LigneDevis = apps.get_model('devis', 'LigneDevis')
+
+    for modele, conteneur in ((Lot, 'devis_id'), (LigneDevis, 'lot_id')):
+        ordre_max = modele.objects.aggregate(ordre_max=Max('ordre'))['ordre_max']
+        if ordre_max is None:
+            continue
+
+        # Décaler toutes les clés au-delà des clés finales pour respecter
+        # la contrainte d'unicité (devis, ordre) des lots pendant la conversion
+        elements = list(modele.objects.order_by(conteneur, 'ordre', 'pk').values_list('pk', conteneur))
+        taille_max = max(Counter(conteneur_id for _, conteneur_id in elements).values())
+        decalage = max(ordre_max, taille_max * PAS_ORDRE) + 1
+        modele.objects.update(ordre=F('ordre') + decalage)
+
+        a_modifier = []
+        conteneur_courant, rang = None, 0
+        for pk, conteneur_id in elements:
+            if conteneur_id != conteneur_courant:
+                conteneur_courant, rang = conteneur_id, 0
+            rang += 1
+            a_modifier.append(modele(pk=pk, ordre=rang * PAS_ORDRE))
+        modele.objects.bulk_update(a_modifier, ['ordre'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0003_statistiques_devis'),
+    ]
+
+    operations = [
+        migrations.RunPython(espacer_ordres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0004_ordres_espaces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurNumeroDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entreprise', models.CharField(blank=True, default='', max_length=50, verbose_name='Entreprise')),
+                ('annee', models.PositiveSmallIntegerField(verbose_name='Année')),
+                ('dernier_numero', models.PositiveIntegerField(default=0, verbose_name='Dernier numéro attribué')),
+            ],
+            options={
+                'verbose_name': 'Compteur de numéros de devis',
+                'verbose_name_plural': 'Compteurs de numéros de devis',
+                'unique_together': {('entreprise', 'annee')},
+            },
+        ),
+    ]
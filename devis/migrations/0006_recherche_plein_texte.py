@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:44
+
+from django.db import migrations, models
+
+INDEX_RECHERCHE = 'devis_document_recherche_gin'
+
+
+def _index_recherche():
+    """
+    Index GIN sur le vecteur de recherche, avec la même expression que
+    devis.recherche.vecteur_recherche pour être utilisé par les requêtes.
+    """
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('document_recherche', config='french'), name=INDEX_RECHERCHE)
+
+
+def creer_index_recherche(apps, schema_editor):
+    """
+    Crée l'index plein texte, propre à PostgreSQL (les autres bases utilisent
+    la recherche de repli, sans index).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.add_index(apps.get_model('devis', 'Devis'), _index_recherche())
+
+
+def supprimer_index_recherche(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('devis', 'Devis'), _index_recherche())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0005_compteur_numero_devis'),
+        ('tiers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devis',
+            name='document_a_jour',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='devis',
+            name='document_recherche',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='devis',
+            index=models.Index(condition=models.Q(('document_a_jour', False)), fields=['document_a_jour'], name='devis_document_perime_idx'),
+        ),
+        migrations.RunPython(creer_index_recherche, supprimer_index_recherche),
+    ]
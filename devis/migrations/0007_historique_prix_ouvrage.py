@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliotheque', '0001_initial'),
+        ('devis', '0006_recherche_plein_texte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoriquePrixOuvrage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('donnees', models.JSONField(default=dict, verbose_name='Données')),
+                ('a_jour', models.BooleanField(default=True, verbose_name='À jour')),
+                ('date_calcul', models.DateTimeField(auto_now=True, verbose_name='Date de calcul')),
+                ('ouvrage', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='historique_prix', to='bibliotheque.ouvrage', verbose_name='Ouvrage')),
+            ],
+            options={
+                'verbose_name': "Historique de prix d'ouvrage",
+                'verbose_name_plural': "Historiques de prix d'ouvrages",
+            },
+        ),
+    ]
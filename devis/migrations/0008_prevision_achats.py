@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:50
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def initialiser_prevision(apps, schema_editor):
+    """
+    Date d'acceptation des devis déjà acceptés (à défaut, leur date de création)
+    et état initial de la prévision d'achats, en une requête groupée.
+    """
+    Devis = apps.get_model('devis', 'Devis')
+    IngredientOuvrage = apps.get_model('bibliotheque', 'IngredientOuvrage')
+    PrevisionAchat = apps.get_model('devis', 'PrevisionAchat')
+
+    Devis.objects.filter(statut='accepté', date_acceptation=None).update(date_acceptation=F('date_creation'))
+
+    quantites = defaultdict(int)
+    for date_validite, date_acceptation, element_type_id, element_id, quantite in (
+        IngredientOuvrage.objects.filter(ouvrage__lignes_devis__lot__devis__statut='accepté')
+        .values(
+            'ouvrage__lignes_devis__lot__devis__date_validite',
+            'ouvrage__lignes_devis__lot__devis__date_acceptation',
+            'element_type_id', 'element_id'
+        )
+        .annotate(quantite=Sum(ExpressionWrapper(
+            F('quantite') * F('ouvrage__lignes_devis__quantite'),
+            output_field=DecimalField(max_digits=20, decimal_places=5)
+        )))
+        .values_list(
+            'ouvrage__lignes_devis__lot__devis__date_validite',
+            'ouvrage__lignes_devis__lot__devis__date_acceptation',
+            'element_type_id', 'element_id', 'quantite'
+        )
+    ):
+        mois = (date_validite or date_acceptation).replace(day=1)
+        quantites[(mois, element_type_id, element_id)] += quantite
+
+    PrevisionAchat.objects.bulk_create(
+        [
+            PrevisionAchat(mois=mois, element_type_id=element_type_id, element_id=element_id, quantite=quantite)
+            for (mois, element_type_id, element_id), quantite in quantites.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliotheque', '0001_initial'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('devis', '0007_historique_prix_ouvrage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devis',
+            name='date_acceptation',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name="Date d'acceptation"),
+        ),
+        migrations.CreateModel(
+            name='PrevisionAchat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(verbose_name='Mois')),
+                ('element_id', models.PositiveIntegerField(verbose_name="ID de l'élément")),
+                ('quantite', models.DecimalField(decimal_places=5, default=0, max_digits=20, verbose_name='Quantité')),
+                ('element_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name="Type d'élément")),
+            ],
+            options={
+                'verbose_name': "Prévision d'achat",
+                'verbose_name_plural': "Prévisions d'achats",
+                'unique_together': {('mois', 'element_type', 'element_id')},
+            },
+        ),
+        migrations.RunPython(initialiser_prevision, migrations.RunPython.noop),
+    ]
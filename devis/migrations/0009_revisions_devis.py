@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0008_prevision_achats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevisionDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(verbose_name='Numéro de révision')),
+                ('motif', models.CharField(choices=[('envoi', 'Envoi au client'), ('manuel', 'À la demande')], default='manuel', max_length=20, verbose_name='Motif')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('statut', models.CharField(max_length=20, verbose_name='Statut du devis')),
+                ('total_ht', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Total HT')),
+                ('total_debourse', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Total déboursé sec')),
+                ('nombre_lignes', models.PositiveIntegerField(verbose_name='Nombre de lignes')),
+                ('taille', models.PositiveIntegerField(verbose_name='Taille du JSON (octets)')),
+                ('donnees', models.BinaryField(verbose_name='Détail compressé')),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions_devis', to=settings.AUTH_USER_MODEL, verbose_name='Auteur')),
+                ('devis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='devis.devis', verbose_name='Devis')),
+            ],
+            options={
+                'verbose_name': 'Révision de devis',
+                'verbose_name_plural': 'Révisions de devis',
+                'ordering': ['devis_id', 'numero'],
+                'unique_together': {('devis', 'numero')},
+            },
+        ),
+    ]
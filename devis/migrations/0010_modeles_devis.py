@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliotheque', '0001_initial'),
+        ('devis', '0009_revisions_devis'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModeleDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100, unique=True, verbose_name='Nom du modèle')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Description')),
+                ('parametres', models.JSONField(blank=True, default=dict, verbose_name='Paramètres')),
+                ('date_creation', models.DateField(auto_now_add=True, verbose_name='Date de création')),
+            ],
+            options={
+                'verbose_name': 'Modèle de devis',
+                'verbose_name_plural': 'Modèles de devis',
+                'ordering': ['nom'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ModeleLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100, verbose_name='Nom du lot')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Description')),
+                ('ordre', models.PositiveIntegerField(default=0, verbose_name="Ordre d'affichage")),
+                ('modele', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='devis.modeledevis', verbose_name='Modèle de devis')),
+            ],
+            options={
+                'verbose_name': 'Lot de modèle',
+                'verbose_name_plural': 'Lots de modèles',
+                'ordering': ['modele_id', 'ordre', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ModeleLigne',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ouvrage', 'Ouvrage de la bibliothèque'), ('manuel', 'Ligne manuelle')], default='manuel', max_length=20, verbose_name='Type de ligne')),
+                ('description', models.CharField(blank=True, default='', max_length=255, verbose_name='Description')),
+                ('quantite', models.DecimalField(decimal_places=2, default=1, max_digits=10, verbose_name='Quantité')),
+                ('parametre', models.CharField(blank=True, default='', max_length=50, verbose_name='Paramètre de quantité')),
+                ('unite', models.CharField(blank=True, default='', max_length=20, verbose_name='Unité')),
+                ('prix_unitaire', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Prix unitaire HT')),
+                ('debourse', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Déboursé sec unitaire')),
+                ('ordre', models.PositiveIntegerField(default=0, verbose_name="Ordre d'affichage")),
+                ('ouvrage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lignes_modeles', to='bibliotheque.ouvrage', verbose_name='Ouvrage')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lignes', to='devis.modelelot', verbose_name='Lot')),
+            ],
+            options={
+                'verbose_name': 'Ligne de modèle',
+                'verbose_name_plural': 'Lignes de modèles',
+                'ordering': ['lot_id', 'ordre', 'id'],
+            },
+        ),
+    ]
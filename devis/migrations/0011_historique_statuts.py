@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from collections import Counter
+from datetime import datetime, time
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def initialiser_historique(apps, schema_editor):
+    """
+    Statut actuel des devis existants, enregistré comme leur statut initial à leur
+    date de création (les changements antérieurs ne sont pas connus), et agrégats
+    correspondants.
+    """
+    Devis = apps.get_model('devis', 'Devis')
+    TransitionStatutDevis = apps.get_model('devis', 'TransitionStatutDevis')
+    AgregatStatutDevis = apps.get_model('devis', 'AgregatStatutDevis')
+
+    transitions, nombres = [], Counter()
+    for devis_id, client_id, statut, date_creation in (
+        Devis.objects.order_by('pk').values_list('pk', 'client_id', 'statut', 'date_creation').iterator(chunk_size=2000)
+    ):
+        date = timezone.make_aware(datetime.combine(date_creation, time.min)) if settings.USE_TZ \
+            else datetime.combine(date_creation, time.min)
+        transitions.append(TransitionStatutDevis(
+            devis_id=devis_id, client_id=client_id, nouveau_statut=statut, date=date
+        ))
+        nombres[(date_creation.replace(day=1), client_id, statut)] += 1
+        if len(transitions) >= 1000:
+            TransitionStatutDevis.objects.bulk_create(transitions)
+            transitions = []
+    TransitionStatutDevis.objects.bulk_create(transitions)
+
+    AgregatStatutDevis.objects.bulk_create(
+        [
+            AgregatStatutDevis(mois=mois, client_id=client_id, nouveau_statut=statut, nombre=nombre)
+            for (mois, client_id, statut), nombre in nombres.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0010_modeles_devis'),
+        ('tiers', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregatStatutDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(verbose_name='Mois')),
+                ('ancien_statut', models.CharField(blank=True, default='', max_length=20, verbose_name='Ancien statut')),
+                ('nouveau_statut', models.CharField(max_length=20, verbose_name='Nouveau statut')),
+                ('nombre', models.IntegerField(default=0, verbose_name='Nombre de transitions')),
+                ('duree_statut', models.BigIntegerField(default=0, verbose_name="Durée totale dans l'ancien statut (s)")),
+                ('duree_cycle', models.BigIntegerField(default=0, verbose_name='Durée totale depuis le premier statut (s)')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregats_statut_devis', to='tiers.tiers', verbose_name='Client')),
+            ],
+            options={
+                'verbose_name': 'Agrégat de transitions de statut',
+                'verbose_name_plural': 'Agrégats de transitions de statut',
+                'unique_together': {('mois', 'client', 'ancien_statut', 'nouveau_statut')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TransitionStatutDevis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancien_statut', models.CharField(blank=True, default='', max_length=20, verbose_name='Ancien statut')),
+                ('nouveau_statut', models.CharField(max_length=20, verbose_name='Nouveau statut')),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+                ('duree_statut', models.DurationField(blank=True, null=True, verbose_name="Durée passée dans l'ancien statut")),
+                ('duree_cycle', models.DurationField(blank=True, null=True, verbose_name='Durée depuis le premier statut')),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transitions_statut_devis', to=settings.AUTH_USER_MODEL, verbose_name='Auteur')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions_statut_devis', to='tiers.tiers', verbose_name='Client')),
+                ('devis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions_statut', to='devis.devis', verbose_name='Devis')),
+            ],
+            options={
+                'verbose_name': 'Transition de statut de devis',
+                'verbose_name_plural': 'Transitions de statut de devis',
+                'ordering': ['devis_id', 'date', 'id'],
+                'indexes': [models.Index(fields=['nouveau_statut', 'date'], name='devis_trans_nouveau_d4172b_idx'), models.Index(fields=['devis', 'date'], name='devis_trans_devis_i_99e9f6_idx')],
+            },
+        ),
+        migrations.RunPython(initialiser_historique, migrations.RunPython.noop),
+    ]
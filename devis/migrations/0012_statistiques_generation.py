@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devis', '0011_historique_statuts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistiquesdevis',
+            name='generation',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Génération'),
+        ),
+    ]
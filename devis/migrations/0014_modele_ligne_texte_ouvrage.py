@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:10
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def copier_texte_ouvrages(apps, schema_editor):
+    """
+    Recopie le nom et l'unité de l'ouvrage dans les lignes de modèle qui n'en ont
+    pas, pour qu'elles restent lisibles si l'ouvrage est supprimé.
+    """
+    Ouvrage = apps.get_model('bibliotheque', 'Ouvrage')
+    ModeleLigne = apps.get_model('devis', 'ModeleLigne')
+
+    ouvrages = Ouvrage.objects.filter(pk=OuterRef('ouvrage_id'))
+    lignes = ModeleLigne.objects.filter(ouvrage__isnull=False)
+    lignes.filter(description='').update(description=Subquery(ouvrages.values('nom')[:1]))
+    lignes.filter(unite='').update(unite=Subquery(ouvrages.values('unite')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliotheque', '0001_initial'),
+        ('devis', '0013_historique_prix_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(copier_texte_ouvrages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,216 @@
+"""
+Modèles de devis réutilisables : instanciation dans un devis et création
+depuis un devis existant.
+
+L'instanciation lit le modèle (lots puis lignes), les ouvrages référencés et
+leur déboursé sec une seule fois chacun, puis insère les lots et les lignes par
+bulk_create dans une transaction : le nombre de requêtes ne dépend pas de la
+taille du modèle (à la taille des paquets d'insertion près). Les totaux du
+devis sont ensuite recalculés comme après toute insertion en masse.
+"""
+from collections import Counter
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+
+from bibliotheque.models import Ouvrage
+
+from .models import Devis, Lot, LigneDevis, ModeleDevis, ModeleLot, ModeleLigne
+from .ordonnancement import PAS_ORDRE, cle_fin
+from .tarification import debourses_ouvrages, prix_vente_defaut
+from .totaux import lignes_inserees
+
+TAILLE_PAQUET = 500
+CENTIME = Decimal('0.01')
+# Borne exclue des quantités de ligne (LigneDevis.quantite : 10 chiffres dont 2 décimales)
+QUANTITE_MAXIMUM = Decimal('100000000')
+
+
+class ParametresInvalides(Exception):
+    """
+    Levée lorsque les paramètres de quantité fournis ne permettent pas d'instancier un modèle.
+    """
+
+
+class ModeleInvalide(Exception):
+    """
+    Levée lorsqu'une ligne du modèle ne peut plus être instanciée (ouvrage supprimé
+    sans prix ni désignation de repli).
+    """
+
+
+def valeurs_parametres(modele, parametres=None):
+    """
+    Retourne la valeur de chaque paramètre du modèle : valeur fournie, sinon valeur
+    par défaut du modèle.
+
+    Raises:
+        ParametresInvalides: Paramètre inconnu, sans valeur ou non numérique
+    """
+    parametres = parametres or {}
+    inconnus = set(parametres) - set(modele.parametres)
+    if inconnus:
+        raise ParametresInvalides(f"Paramètres inconnus : {', '.join(sorted(inconnus))}")
+
+    valeurs = {}
+    for nom, defaut in modele.parametres.items():
+        valeur = parametres.get(nom, defaut)
+        if valeur is None:
+            raise ParametresInvalides(f"Le paramètre {nom} est requis")
+        try:
+            valeurs[nom] = Decimal(str(valeur))
+        except InvalidOperation:
+            raise ParametresInvalides(f"Le paramètre {nom} doit être un nombre")
+        if not valeurs[nom].is_finite():
+            raise ParametresInvalides(f"Le paramètre {nom} doit être un nombre")
+    return valeurs
+
+
+def instancier_modele(modele, devis, parametres=None):
+    """
+    Ajoute les lots et les lignes d'un modèle à la fin d'un devis, en une transaction.
+
+    Args:
+        modele: ModeleDevis à instancier
+        devis: Devis complété
+        parametres: Valeurs des paramètres de quantité ({nom: valeur})
+
+    Returns:
+        La liste des lots créés
+
+    Raises:
+        ParametresInvalides: Voir valeurs_parametres, paramètre d'une ligne
+            absent du modèle, ou quantité calculée hors limites
+        ModeleInvalide: Voir _ligne_devis
+    """
+    valeurs = valeurs_parametres(modele, parametres)
+    lots_modele = list(modele.lots.order_by('ordre', 'id'))
+    lignes_modele = list(ModeleLigne.objects.filter(lot__modele=modele).order_by('lot_id', 'ordre', 'id'))
+
+    manquants = {ligne.parametre for ligne in lignes_modele if ligne.parametre} - set(valeurs)
+    if manquants:
+        raise ParametresInvalides(f"Paramètres non définis par le modèle : {', '.join(sorted(manquants))}")
+
+    ouvrage_ids = {ligne.ouvrage_id for ligne in lignes_modele if ligne.type == 'ouvrage' and ligne.ouvrage_id}
+    ouvrages = Ouvrage.objects.in_bulk(ouvrage_ids)
+    debourses = debourses_ouvrages(ouvrages.keys())
+
+    with transaction.atomic():
+        devis = Devis.objects.select_for_update().get(pk=devis.pk)
+
+        ordre = cle_fin(devis.lots.all())
+        nouveaux_lots = {}
+        for lot in lots_modele:
+            nouveaux_lots[lot.pk] = Lot(devis=devis, nom=lot.nom, description=lot.description, ordre=ordre)
+            ordre += PAS_ORDRE
+        Lot.objects.bulk_create(nouveaux_lots.values(), batch_size=TAILLE_PAQUET)
+
+        rangs = Counter()
+        nouvelles_lignes = []
+        for ligne in lignes_modele:
+            rangs[ligne.lot_id] += 1
+            nouvelles_lignes.append(_ligne_devis(
+                ligne, nouveaux_lots[ligne.lot_id], rangs[ligne.lot_id] * PAS_ORDRE,
+                valeurs, ouvrages, debourses
+            ))
+        LigneDevis.objects.bulk_create(nouvelles_lignes, batch_size=TAILLE_PAQUET)
+        lignes_inserees(devis.pk, nouvelles_lignes)
+
+    return list(nouveaux_lots.values())
+
+
+def _ligne_devis(ligne, lot, ordre, valeurs, ouvrages, debourses):
+    """
+    Construit (sans l'enregistrer) la ligne de devis correspondant à une ligne de modèle.
+    Une ligne 'ouvrage' dont l'ouvrage a été supprimé devient une ligne manuelle
+    reprenant la désignation, l'unité et les prix enregistrés dans le modèle.
+
+    Raises:
+        ParametresInvalides: Quantité calculée trop grande pour une ligne de devis
+        ModeleInvalide: Ouvrage supprimé et ligne sans désignation ou sans prix
+    """
+    quantite = ligne.quantite
+    if ligne.parametre:
+        quantite = quantite * valeurs[ligne.parametre]
+        if abs(quantite) >= QUANTITE_MAXIMUM:
+            raise ParametresInvalides(f"Le paramètre {ligne.parametre} donne une quantité de ligne trop grande")
+        quantite = quantite.quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+    ouvrage = ouvrages.get(ligne.ouvrage_id) if ligne.type == 'ouvrage' else None
+    if ligne.type == 'ouvrage' and ouvrage is None and (
+        not ligne.description or ligne.prix_unitaire is None or ligne.debourse is None
+    ):
+        raise ModeleInvalide(
+            f"La ligne « {ligne.description or ligne.pk} » du modèle référence un ouvrage "
+            "supprimé de la bibliothèque : renseignez sa désignation et ses prix dans le modèle"
+        )
+    debourse = ligne.debourse
+    if debourse is None:
+        debourse = round(debourses[ouvrage.id], 2) if ouvrage else Decimal('0')
+    prix_unitaire = ligne.prix_unitaire
+    if prix_unitaire is None:
+        prix_unitaire = prix_vente_defaut(debourse)
+
+    return LigneDevis(
+        lot=lot,
+        type='ouvrage' if ouvrage else 'manuel',
+        ouvrage=ouvrage,
+        description=ligne.description or (ouvrage.nom if ouvrage else ''),
+        unite=ligne.unite or (ouvrage.unite if ouvrage else ''),
+        quantite=quantite,
+        prix_unitaire=prix_unitaire,
+        debourse=debourse,
+        ordre=ordre,
+    )
+
+
+def _tarifee(ligne):
+    """
+    Indique si le prix d'une ligne de devis sera repris de la bibliothèque.
+    """
+    return ligne['type'] == 'ouvrage' and ligne['ouvrage_id'] is not None
+
+
+def creer_modele_depuis_devis(devis, nom, description=None, parametres=None):
+    """
+    Crée un modèle reprenant les lots et les lignes d'un devis, en une transaction.
+
+    Les lignes 'ouvrage' sont enregistrées sans prix ni déboursé : ils seront repris
+    de la bibliothèque à chaque instanciation. Les lignes manuelles gardent les leurs.
+    """
+    with transaction.atomic():
+        modele = ModeleDevis.objects.create(nom=nom, description=description, parametres=parametres or {})
+
+        lots = list(devis.lots.order_by('ordre', 'id').values('id', 'nom', 'description', 'ordre'))
+        lots_modele = {
+            lot['id']: ModeleLot(modele=modele, nom=lot['nom'], description=lot['description'], ordre=lot['ordre'])
+            for lot in lots
+        }
+        ModeleLot.objects.bulk_create(lots_modele.values(), batch_size=TAILLE_PAQUET)
+
+        lignes = (
+            LigneDevis.objects.filter(lot__devis=devis)
+            .order_by('lot_id', 'ordre', 'id')
+            .values('lot_id', 'type', 'ouvrage_id', 'description', 'unite', 'quantite',
+                    'prix_unitaire', 'debourse', 'ordre')
+            .iterator(chunk_size=2000)
+        )
+        ModeleLigne.objects.bulk_create(
+            (
+                ModeleLigne(
+                    lot=lots_modele[ligne['lot_id']],
+                    type=ligne['type'],
+                    ouvrage_id=ligne['ouvrage_id'],
+                    description=ligne['description'],
+                    unite=ligne['unite'],
+                    quantite=ligne['quantite'],
+                    prix_unitaire=None if _tarifee(ligne) else ligne['prix_unitaire'],
+                    debourse=None if _tarifee(ligne) else ligne['debourse'],
+                    ordre=ligne['ordre'],
+                )
+                for ligne in lignes
+            ),
+            batch_size=TAILLE_PAQUET
+        )
+
+    return modele
@@ -1,11 +1,72 @@
-from django.db import models
-from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 from tiers.models import Tiers
 from bibliotheque.models import Ouvrage
 
-class Devis(models.Model):
+# Totaux stockés, écrits uniquement par devis/totaux.py
+CHAMPS_TOTAUX = ('total_ht', 'total_debourse')
+# Document de recherche, écrit uniquement par devis/recherche.py
+CHAMPS_RECHERCHE = ('document_recherche', 'document_a_jour')
+
+def champs_hors_calcules(instance):
+    """
+    Retourne les champs écrits par la sauvegarde complète d'un lot ou d'un devis
+    existant : tous sauf les totaux stockés et le document de recherche, dont la
+    valeur en mémoire peut être antérieure à une écriture concurrente (voir
+    devis/totaux.py et devis/recherche.py).
+    """
+    return [
+        champ.name for champ in instance._meta.concrete_fields
+        if not champ.primary_key and champ.name not in CHAMPS_TOTAUX + CHAMPS_RECHERCHE
+    ]
+
+class EtatEnregistreMixin:
+    """
+    Mémorise au chargement les champs dont dépendent les données dérivées d'un
+    objet (CHAMPS_SUIVIS), pour que save et delete n'en répercutent que les
+    changements (voir devis/suivi.py).
+    """
+    CHAMPS_SUIVIS = ()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if set(cls.CHAMPS_SUIVIS).issubset(field_names):
+            instance._etat_enregistre = instance.etat_courant()
+        return instance
+    
+    def etat_courant(self):
+        """
+        Retourne les champs suivis tels qu'ils sont en mémoire.
+        """
+        return {champ: getattr(self, champ) for champ in self.CHAMPS_SUIVIS}
+    
+    def etat_en_base(self):
+        """
+        Retourne les champs suivis tels qu'ils sont en base, ou None pour un objet
+        pas encore enregistré.
+        """
+        if not self.pk:
+            return None
+        if hasattr(self, '_etat_enregistre'):
+            return self._etat_enregistre
+        return type(self)._default_manager.filter(pk=self.pk).values(*self.CHAMPS_SUIVIS).first()
+    
+    def memoriser_etat(self, avant, update_fields=None):
+        """
+        Mémorise l'état enregistré après un save (seuls les champs écrits
+        changent lorsque update_fields est donné).
+        """
+        etat = self.etat_courant()
+        if update_fields is not None and avant is not None:
+            ecrits = {self._meta.get_field(nom).attname for nom in update_fields}
+            etat = {champ: etat[champ] if champ in ecrits else avant[champ] for champ in etat}
+        self._etat_enregistre = etat
+
+class Devis(EtatEnregistreMixin, models.Model):
     """
     Modèle pour représenter un devis.
     """
@@ -16,6 +77,7 @@ class Devis(models.Model):
         ('refusé', 'Refusé'),
         ('annulé', 'Annulé'),
     ]
+    CHAMPS_SUIVIS = ('client_id', 'statut', 'numero', 'objet', 'date_validite', 'date_acceptation')
     
     client = models.ForeignKey(
         Tiers, 
@@ -41,6 +103,12 @@ class Devis(models.Model):
         blank=True,
         verbose_name="Date de validité"
     )
+    date_acceptation = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Date d'acceptation"
+    )
     commentaire = models.TextField(blank=True, null=True, verbose_name="Commentaire")
     conditions_paiement = models.TextField(
         blank=True, 
@@ -54,52 +122,78 @@ class Devis(models.Model):
         blank=True,
         verbose_name="Marge globale (%)"
     )
+    # Totaux maintenus à chaque modification de ligne (voir devis/totaux.py)
+    total_ht = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=0,
+        editable=False,
+        verbose_name="Total HT"
+    )
+    total_debourse = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=0,
+        editable=False,
+        verbose_name="Total déboursé sec"
+    )
+    # Document de recherche plein texte, reconstruit lorsqu'il est périmé (voir devis/recherche.py)
+    document_recherche = models.TextField(blank=True, default='', editable=False)
+    document_a_jour = models.BooleanField(default=False, editable=False)
     
     class Meta:
         verbose_name = "Devis"
         verbose_name_plural = "Devis"
         ordering = ['-date_creation', 'numero']
+        indexes = [
+            models.Index(fields=['statut']),
+            models.Index(fields=['client', 'date_creation']),
+            models.Index(
+                fields=['document_a_jour'],
+                condition=models.Q(document_a_jour=False),
+                name='devis_document_perime_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"Devis {self.numero} - {self.client.nom} - {self.objet}"
     
-    @property
-    def total_ht(self):
+    def save(self, *args, **kwargs):
         """
-        Calcule le montant total HT du devis en sommant les totaux des lots.
+        Surcharge de la méthode save pour répercuter les changements du devis
+        (statut, client, dates, textes) sur les statistiques, le journal des
+        statuts, l'historique des prix, la prévision d'achats, les révisions et
+        la recherche (voir devis/suivi.py ; auteur facultatif :
+        save(auteur=utilisateur)).
+        La sauvegarde complète d'un devis existant ne réécrit ni ses totaux stockés
+        ni son document de recherche.
         """
-        from django.db.models import Sum, F
-        
-        # Récupérer toutes les lignes de tous les lots de ce devis
-        lignes_query = LigneDevis.objects.filter(lot__devis=self)
-        
-        # Calculer le total HT
-        total = lignes_query.annotate(
-            total_ligne=F('prix_unitaire') * F('quantite')
-        ).aggregate(
-            total=Sum('total_ligne')
-        )['total'] or 0
+        from .suivi import devis_enregistre, preparer_devis
         
-        return total
+        auteur = kwargs.pop('auteur', None)
+        avant = self.etat_en_base()
+        champs = preparer_devis(self, avant)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | champs
+        elif not self._state.adding:
+            kwargs['update_fields'] = set(champs_hors_calcules(self)) | champs
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            devis_enregistre(self, avant, auteur=auteur)
+        self.memoriser_etat(avant, kwargs.get('update_fields'))
     
-    @property
-    def total_debourse(self):
+    def delete(self, *args, **kwargs):
         """
-        Calcule le montant total du déboursé sec du devis en sommant les déboursés des lignes.
+        Surcharge de la méthode delete pour retirer le devis, ses lots et ses
+        lignes des données dérivées (voir devis/suivi.py).
         """
-        from django.db.models import Sum, F
-        
-        # Récupérer toutes les lignes de tous les lots de ce devis
-        lignes_query = LigneDevis.objects.filter(lot__devis=self)
-        
-        # Calculer le total du déboursé
-        total = lignes_query.annotate(
-            total_debourse_ligne=F('debourse') * F('quantite')
-        ).aggregate(
-            total=Sum('total_debourse_ligne')
-        )['total'] or 0
+        from .suivi import suppression_devis
         
-        return total
+        with transaction.atomic():
+            suppression_devis(self, self.etat_en_base())
+            resultat = super().delete(*args, **kwargs)
+        self.__dict__.pop('_etat_enregistre', None)
+        return resultat
     
     @property
     def marge_totale(self):
@@ -115,10 +209,12 @@ class Devis(models.Model):
         
         return ((total_ht - total_debourse) / total_ht) * 100
 
-class Lot(models.Model):
+class Lot(EtatEnregistreMixin, models.Model):
     """
     Modèle pour représenter un lot dans un devis.
     """
+    CHAMPS_SUIVIS = ('devis_id', 'nom')
+    
     devis = models.ForeignKey(
         Devis, 
         on_delete=models.CASCADE, 
@@ -128,6 +224,21 @@ class Lot(models.Model):
     nom = models.CharField(max_length=100, verbose_name="Nom du lot")
     ordre = models.PositiveIntegerField(default=0, verbose_name="Ordre d'affichage")
     description = models.TextField(blank=True, null=True, verbose_name="Description")
+    # Totaux maintenus à chaque modification de ligne (voir devis/totaux.py)
+    total_ht = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=0,
+        editable=False,
+        verbose_name="Total HT"
+    )
+    total_debourse = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=0,
+        editable=False,
+        verbose_name="Total déboursé sec"
+    )
     
     class Meta:
         verbose_name = "Lot"
@@ -138,26 +249,6 @@ class Lot(models.Model):
     def __str__(self):
         return f"{self.nom} - {self.devis.numero}"
     
-    @property
-    def total_ht(self):
-        """
-        Calcule le montant total HT du lot.
-        """
-        total = self.lignes.aggregate(
-            total=Sum(F('prix_unitaire') * F('quantite'))
-        )['total'] or 0
-        return total
-    
-    @property
-    def total_debourse(self):
-        """
-        Calcule le montant total du déboursé sec du lot.
-        """
-        total = self.lignes.aggregate(
-            total=Sum(F('debourse') * F('quantite'))
-        )['total'] or 0
-        return total
-    
     @property
     def marge(self):
         """
@@ -170,8 +261,37 @@ class Lot(models.Model):
             return 0
         
         return ((total_ht - total_debourse) / total_ht) * 100
+    
+    def save(self, *args, **kwargs):
+        """
+        Surcharge de la méthode save pour répercuter le déplacement du lot vers un
+        autre devis et invalider le document de recherche (voir devis/suivi.py).
+        La sauvegarde complète d'un lot existant ne réécrit pas ses totaux stockés.
+        """
+        from .suivi import lot_enregistre
+        
+        avant = self.etat_en_base()
+        if kwargs.get('update_fields') is None and not self._state.adding:
+            kwargs['update_fields'] = champs_hors_calcules(self)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            lot_enregistre(self, avant)
+        self.memoriser_etat(avant, kwargs.get('update_fields'))
+    
+    def delete(self, *args, **kwargs):
+        """
+        Surcharge de la méthode delete pour retirer le lot et ses lignes,
+        supprimées en cascade, des données dérivées (voir devis/suivi.py).
+        """
+        from .suivi import suppression_lot
+        
+        with transaction.atomic():
+            suppression_lot(self, self.etat_en_base())
+            resultat = super().delete(*args, **kwargs)
+        self.__dict__.pop('_etat_enregistre', None)
+        return resultat
 
-class LigneDevis(models.Model):
+class LigneDevis(EtatEnregistreMixin, models.Model):
     """
     Modèle pour représenter une ligne dans un devis.
     Une ligne peut être soit liée à un ouvrage de la bibliothèque,
@@ -181,6 +301,7 @@ class LigneDevis(models.Model):
         ('ouvrage', 'Ouvrage de la bibliothèque'),
         ('manuel', 'Ligne manuelle'),
     ]
+    CHAMPS_SUIVIS = ('lot_id', 'ouvrage_id', 'description', 'quantite', 'prix_unitaire', 'debourse')
     
     lot = models.ForeignKey(
         Lot, 
@@ -256,29 +377,388 @@ class LigneDevis(models.Model):
     def save(self, *args, **kwargs):
         """
         Surcharge de la méthode save pour initialiser les valeurs depuis l'ouvrage
-        si le type est 'ouvrage'.
+        si le type est 'ouvrage', puis répercuter les changements de la ligne sur
+        les totaux, la prévision d'achats, l'historique des prix et la recherche
+        (voir devis/suivi.py).
         """
-        if self.type == 'ouvrage' and self.ouvrage and not self.id:
-            # Si c'est une nouvelle ligne de type 'ouvrage', on initialise les valeurs
-            # depuis l'ouvrage associé
-            self.description = self.ouvrage.nom
-            self.unite = self.ouvrage.unite
+        from .suivi import ligne_enregistree
+        
+        with transaction.atomic():
+            avant = self.etat_en_base()
             
-            # On arrondit le déboursé à 2 décimales
-            from decimal import Decimal, ROUND_HALF_UP
-            debourse = self.ouvrage.debourse_sec
-            self.debourse = round(debourse, 2)
+            if self.type == 'ouvrage' and self.ouvrage and not self.id:
+                # Si c'est une nouvelle ligne de type 'ouvrage', on initialise les valeurs
+                # depuis l'ouvrage associé : déboursé arrondi à 2 décimales et prix de vente
+                # avec une marge de 30% (tarif mémorisé pendant la requête, voir devis/tarification.py)
+                from .tarification import tarif_ouvrage
+                self.description = self.ouvrage.nom
+                self.unite = self.ouvrage.unite
+                self.debourse, self.prix_unitaire = tarif_ouvrage(self.ouvrage_id)
             
-            # Par défaut, on initialise le prix unitaire avec une marge de 30%
-            # si le déboursé est > 0, sinon on met 0
-            if self.debourse > 0:
-                # On arrondit à 2 décimales et on s'assure de ne pas dépasser 10 chiffres au total
-                prix = (self.debourse / Decimal('0.7')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                # Vérifier que le nombre ne dépasse pas 10 chiffres au total
-                if len(str(prix).replace('.', '')) > 10:
-                    prix = Decimal('9999999.99')
-                self.prix_unitaire = prix
-            else:
-                self.prix_unitaire = 0
+            super().save(*args, **kwargs)
+            ligne_enregistree(self, avant)
+        self.memoriser_etat(avant, kwargs.get('update_fields'))
+    
+    def delete(self, *args, **kwargs):
+        """
+        Surcharge de la méthode delete pour retirer la ligne des totaux, de la
+        prévision d'achats et de l'historique des prix (voir devis/suivi.py).
+        """
+        from .suivi import suppression_ligne
         
+        with transaction.atomic():
+            suppression_ligne(self, self.etat_en_base())
+            resultat = super().delete(*args, **kwargs)
+        self.__dict__.pop('_etat_enregistre', None)
+        return resultat
+
+
+class StatistiquesDevis(models.Model):
+    """
+    Instantané des statistiques de devis, global (client vide) ou par client.
+    Invalidé à chaque modification d'un devis et recalculé à la lecture suivante
+    (voir devis/statistiques.py).
+    """
+    cle = models.CharField(max_length=64, unique=True, verbose_name="Clé")
+    client = models.ForeignKey(
+        Tiers,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='statistiques_devis',
+        verbose_name="Client"
+    )
+    donnees = models.JSONField(default=dict, verbose_name="Données")
+    a_jour = models.BooleanField(default=True, verbose_name="À jour")
+    # Incrémentée à chaque invalidation : un recalcul n'est conservé que si
+    # aucune invalidation n'est survenue pendant son calcul
+    generation = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Génération")
+    date_calcul = models.DateTimeField(auto_now=True, verbose_name="Date de calcul")
+    
+    class Meta:
+        verbose_name = "Statistiques de devis"
+        verbose_name_plural = "Statistiques de devis"
+    
+    def __str__(self):
+        return f"Statistiques {self.cle} ({'à jour' if self.a_jour else 'périmées'})"
+
+
+class HistoriquePrixOuvrage(models.Model):
+    """
+    Instantané des prix de vente et marges pratiqués pour un ouvrage sur les devis
+    acceptés et refusés. Invalidé à chaque modification d'une ligne de l'ouvrage ou
+    du statut d'un devis qui le contient, et recalculé à la lecture suivante
+    (voir devis/historique_prix.py).
+    """
+    ouvrage = models.OneToOneField(
+        Ouvrage,
+        on_delete=models.CASCADE,
+        related_name='historique_prix',
+        verbose_name="Ouvrage"
+    )
+    donnees = models.JSONField(default=dict, verbose_name="Données")
+    a_jour = models.BooleanField(default=True, verbose_name="À jour")
+    # Incrémentée à chaque invalidation (voir StatistiquesDevis.generation)
+    generation = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Génération")
+    date_calcul = models.DateTimeField(auto_now=True, verbose_name="Date de calcul")
+    
+    class Meta:
+        verbose_name = "Historique de prix d'ouvrage"
+        verbose_name_plural = "Historiques de prix d'ouvrages"
+    
+    def __str__(self):
+        return f"Historique de prix {self.ouvrage_id} ({'à jour' if self.a_jour else 'périmé'})"
+
+
+class PrevisionAchat(models.Model):
+    """
+    Quantité d'un élément (fourniture ou main d'œuvre) engagée par les devis
+    acceptés pour un mois. Ajustée par différence à chaque changement de statut
+    d'un devis ou modification des lignes d'un devis accepté (voir devis/prevision.py).
+    """
+    mois = models.DateField(verbose_name="Mois")
+    element_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name="Type d'élément"
+    )
+    element_id = models.PositiveIntegerField(verbose_name="ID de l'élément")
+    element = GenericForeignKey('element_type', 'element_id')
+    quantite = models.DecimalField(
+        max_digits=20,
+        decimal_places=5,
+        default=0,
+        verbose_name="Quantité"
+    )
+    
+    class Meta:
+        verbose_name = "Prévision d'achat"
+        verbose_name_plural = "Prévisions d'achats"
+        unique_together = ('mois', 'element_type', 'element_id')
+    
+    def __str__(self):
+        return f"{self.mois:%Y-%m} : {self.element_type_id}/{self.element_id} = {self.quantite}"
+
+
+class RevisionDevis(models.Model):
+    """
+    Révision figée d'un devis : arbre complet (devis, lots, lignes, totaux) au
+    format du détail JSON, compressé. Capturée à l'envoi du devis ou à la demande,
+    et jamais modifiée ensuite (voir devis/revisions.py).
+    """
+    MOTIF_CHOICES = [
+        ('envoi', 'Envoi au client'),
+        ('manuel', 'À la demande'),
+    ]
+    
+    devis = models.ForeignKey(
+        Devis,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name="Devis"
+    )
+    numero = models.PositiveIntegerField(verbose_name="Numéro de révision")
+    motif = models.CharField(max_length=20, choices=MOTIF_CHOICES, default='manuel', verbose_name="Motif")
+    auteur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='revisions_devis',
+        verbose_name="Auteur"
+    )
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    statut = models.CharField(max_length=20, verbose_name="Statut du devis")
+    total_ht = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Total HT")
+    total_debourse = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Total déboursé sec")
+    nombre_lignes = models.PositiveIntegerField(verbose_name="Nombre de lignes")
+    taille = models.PositiveIntegerField(verbose_name="Taille du JSON (octets)")
+    donnees = models.BinaryField(verbose_name="Détail compressé")
+    
+    class Meta:
+        verbose_name = "Révision de devis"
+        verbose_name_plural = "Révisions de devis"
+        ordering = ['devis_id', 'numero']
+        unique_together = ('devis', 'numero')
+    
+    def __str__(self):
+        return f"{self.devis_id} révision {self.numero}"
+    
+    def save(self, *args, **kwargs):
+        """
+        Une révision est immuable : seule sa création est autorisée.
+        """
+        if not self._state.adding:
+            raise ValueError("Une révision de devis ne peut pas être modifiée")
         super().save(*args, **kwargs)
+
+
+class TransitionStatutDevis(models.Model):
+    """
+    Changement de statut d'un devis (ou statut initial, ancien statut vide),
+    enregistré dans la même transaction que le devis et jamais modifié ensuite.
+    Les durées sont calculées à l'enregistrement (voir devis/entonnoir.py).
+    """
+    devis = models.ForeignKey(
+        Devis,
+        on_delete=models.CASCADE,
+        related_name='transitions_statut',
+        verbose_name="Devis"
+    )
+    client = models.ForeignKey(
+        Tiers,
+        on_delete=models.CASCADE,
+        related_name='transitions_statut_devis',
+        verbose_name="Client"
+    )
+    ancien_statut = models.CharField(max_length=20, blank=True, default='', verbose_name="Ancien statut")
+    nouveau_statut = models.CharField(max_length=20, verbose_name="Nouveau statut")
+    date = models.DateTimeField(default=timezone.now, verbose_name="Date")
+    auteur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='transitions_statut_devis',
+        verbose_name="Auteur"
+    )
+    duree_statut = models.DurationField(
+        null=True,
+        blank=True,
+        verbose_name="Durée passée dans l'ancien statut"
+    )
+    duree_cycle = models.DurationField(
+        null=True,
+        blank=True,
+        verbose_name="Durée depuis le premier statut"
+    )
+    
+    class Meta:
+        verbose_name = "Transition de statut de devis"
+        verbose_name_plural = "Transitions de statut de devis"
+        ordering = ['devis_id', 'date', 'id']
+        indexes = [
+            models.Index(fields=['nouveau_statut', 'date']),
+            models.Index(fields=['devis', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.devis_id} : {self.ancien_statut or '-'} → {self.nouveau_statut} ({self.date:%Y-%m-%d})"
+    
+    def save(self, *args, **kwargs):
+        """
+        Une transition est immuable : seule sa création est autorisée.
+        """
+        if not self._state.adding:
+            raise ValueError("Une transition de statut ne peut pas être modifiée")
+        super().save(*args, **kwargs)
+
+
+class AgregatStatutDevis(models.Model):
+    """
+    Cumul des transitions de statut par mois, client et transition : nombre et
+    durées totales en secondes. Ajusté à chaque transition et à la suppression
+    d'un devis (voir devis/entonnoir.py).
+    """
+    mois = models.DateField(verbose_name="Mois")
+    client = models.ForeignKey(
+        Tiers,
+        on_delete=models.CASCADE,
+        related_name='agregats_statut_devis',
+        verbose_name="Client"
+    )
+    ancien_statut = models.CharField(max_length=20, blank=True, default='', verbose_name="Ancien statut")
+    nouveau_statut = models.CharField(max_length=20, verbose_name="Nouveau statut")
+    nombre = models.IntegerField(default=0, verbose_name="Nombre de transitions")
+    duree_statut = models.BigIntegerField(default=0, verbose_name="Durée totale dans l'ancien statut (s)")
+    duree_cycle = models.BigIntegerField(default=0, verbose_name="Durée totale depuis le premier statut (s)")
+    
+    class Meta:
+        verbose_name = "Agrégat de transitions de statut"
+        verbose_name_plural = "Agrégats de transitions de statut"
+        unique_together = ('mois', 'client', 'ancien_statut', 'nouveau_statut')
+    
+    def __str__(self):
+        return f"{self.mois:%Y-%m} {self.client_id} : {self.ancien_statut or '-'} → {self.nouveau_statut} = {self.nombre}"
+
+
+class ModeleDevis(models.Model):
+    """
+    Modèle de devis réutilisable (une rénovation de salle de bain type, une
+    toiture type...) : des lots et des lignes instanciés d'un bloc dans un devis
+    existant (voir devis/modeles_devis.py).
+    """
+    nom = models.CharField(max_length=100, unique=True, verbose_name="Nom du modèle")
+    description = models.TextField(blank=True, null=True, verbose_name="Description")
+    # Paramètres de quantité et leur valeur par défaut, par exemple {"surface": 10}
+    parametres = models.JSONField(default=dict, blank=True, verbose_name="Paramètres")
+    date_creation = models.DateField(auto_now_add=True, verbose_name="Date de création")
+    
+    class Meta:
+        verbose_name = "Modèle de devis"
+        verbose_name_plural = "Modèles de devis"
+        ordering = ['nom']
+    
+    def __str__(self):
+        return self.nom
+
+
+class ModeleLot(models.Model):
+    """
+    Lot d'un modèle de devis.
+    """
+    modele = models.ForeignKey(
+        ModeleDevis,
+        on_delete=models.CASCADE,
+        related_name='lots',
+        verbose_name="Modèle de devis"
+    )
+    nom = models.CharField(max_length=100, verbose_name="Nom du lot")
+    description = models.TextField(blank=True, null=True, verbose_name="Description")
+    ordre = models.PositiveIntegerField(default=0, verbose_name="Ordre d'affichage")
+    
+    class Meta:
+        verbose_name = "Lot de modèle"
+        verbose_name_plural = "Lots de modèles"
+        ordering = ['modele_id', 'ordre', 'id']
+    
+    def __str__(self):
+        return f"{self.nom} - {self.modele.nom}"
+
+
+class ModeleLigne(models.Model):
+    """
+    Ligne d'un modèle de devis. La quantité d'une ligne paramétrée est multipliée
+    par la valeur du paramètre à l'instanciation. Le prix et le déboursé d'une
+    ligne 'ouvrage' laissés vides sont repris de la bibliothèque.
+    """
+    lot = models.ForeignKey(
+        ModeleLot,
+        on_delete=models.CASCADE,
+        related_name='lignes',
+        verbose_name="Lot"
+    )
+    type = models.CharField(
+        max_length=20,
+        choices=LigneDevis.TYPE_CHOICES,
+        default='manuel',
+        verbose_name="Type de ligne"
+    )
+    ouvrage = models.ForeignKey(
+        Ouvrage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='lignes_modeles',
+        verbose_name="Ouvrage"
+    )
+    description = models.CharField(max_length=255, blank=True, default='', verbose_name="Description")
+    quantite = models.DecimalField(max_digits=10, decimal_places=2, default=1, verbose_name="Quantité")
+    parametre = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name="Paramètre de quantité"
+    )
+    unite = models.CharField(max_length=20, blank=True, default='', verbose_name="Unité")
+    prix_unitaire = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Prix unitaire HT"
+    )
+    debourse = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Déboursé sec unitaire"
+    )
+    ordre = models.PositiveIntegerField(default=0, verbose_name="Ordre d'affichage")
+    
+    class Meta:
+        verbose_name = "Ligne de modèle"
+        verbose_name_plural = "Lignes de modèles"
+        ordering = ['lot_id', 'ordre', 'id']
+    
+    def __str__(self):
+        return f"{self.description} ({self.quantite} {self.unite})"
+
+
+class CompteurNumeroDevis(models.Model):
+    """
+    Dernier numéro de devis attribué, par année et par entreprise
+    (entreprise vide si la numérotation est commune). Voir devis/numerotation.py.
+    """
+    entreprise = models.CharField(max_length=50, blank=True, default='', verbose_name="Entreprise")
+    annee = models.PositiveSmallIntegerField(verbose_name="Année")
+    dernier_numero = models.PositiveIntegerField(default=0, verbose_name="Dernier numéro attribué")
+    
+    class Meta:
+        verbose_name = "Compteur de numéros de devis"
+        verbose_name_plural = "Compteurs de numéros de devis"
+        unique_together = ('entreprise', 'annee')
+    
+    def __str__(self):
+        return f"{self.entreprise or 'Commun'} {self.annee} : {self.dernier_numero}"
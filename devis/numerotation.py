@@ -0,0 +1,118 @@
+"""
+Attribution des numéros de devis côté serveur.
+
+Chaque (entreprise, année) possède une ligne compteur, verrouillée par
+select_for_update le temps d'incrémenter. Appelée dans la transaction qui crée
+le devis, l'attribution est sans trou : si la création échoue, l'incrément est
+annulé avec elle. Le verrou ne porte que sur la ligne du compteur et n'est tenu
+que jusqu'à la fin de cette transaction courte. Un numéro saisi à la main ne
+peut pas suivre ce format (voir numero_reserve), et les numéros déjà pris sont
+sautés.
+
+Paramètres (settings) :
+- DEVIS_FORMAT_NUMERO : format du numéro, avec {annee}, {numero} et {entreprise}
+- DEVIS_NUMEROTATION_PAR_ENTREPRISE : un compteur par entreprise de l'utilisateur
+"""
+import re
+from string import Formatter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import CompteurNumeroDevis, Devis
+
+FORMAT_NUMERO = "DEV-{annee}-{numero:05d}"
+FORMAT_NUMERO_PAR_ENTREPRISE = "DEV-{entreprise}-{annee}-{numero:05d}"
+
+
+def numerotation_par_entreprise():
+    return getattr(settings, 'DEVIS_NUMEROTATION_PAR_ENTREPRISE', False)
+
+
+def format_numero():
+    defaut = FORMAT_NUMERO_PAR_ENTREPRISE if numerotation_par_entreprise() else FORMAT_NUMERO
+    return getattr(settings, 'DEVIS_FORMAT_NUMERO', defaut)
+
+
+def entreprise_utilisateur(user):
+    """
+    Retourne la clé d'entreprise du compteur à utiliser pour un utilisateur
+    ('' si la numérotation est commune à toutes les entreprises).
+    """
+    if not numerotation_par_entreprise():
+        return ''
+    # La clé est tronquée pour que le numéro formaté tienne dans Devis.numero
+    longueur = Devis._meta.get_field('numero').max_length - len(
+        format_numero().format(annee=timezone.localdate().year, entreprise='', numero=0)
+    )
+    longueur = min(longueur, CompteurNumeroDevis._meta.get_field('entreprise').max_length)
+    return slugify(getattr(user, 'company', '') or '').upper()[:max(longueur, 0)].strip('-')
+
+
+def motif_numero():
+    """
+    Expression régulière des numéros au format de la numérotation automatique,
+    quelles que soient l'entreprise et l'année.
+    """
+    motif = ''
+    for texte, champ, _, _ in Formatter().parse(format_numero()):
+        motif += re.escape(texte)
+        if champ in ('annee', 'numero'):
+            motif += r'\d+'
+        elif champ == 'entreprise':
+            motif += r'[A-Z0-9-]*'
+    return re.compile(motif + '$')
+
+
+def numero_reserve(numero):
+    """
+    Indique si un numéro suit le format de la numérotation automatique : un tel
+    numéro saisi à la main pourrait être attribué ensuite à un autre devis.
+    """
+    return bool(motif_numero().match(numero))
+
+
+def _premier_numero_libre(entreprise, annee):
+    """
+    Initialise un nouveau compteur après le plus grand numéro déjà présent au même
+    format (devis saisis avant la numérotation automatique).
+    """
+    prefixe = format_numero().split('{numero')[0].format(annee=annee, entreprise=entreprise)
+    motif = re.compile(re.escape(prefixe) + r'(\d+)$')
+
+    plus_grand = 0
+    for numero in Devis.objects.filter(numero__startswith=prefixe).values_list('numero', flat=True).iterator():
+        correspondance = motif.match(numero)
+        if correspondance:
+            plus_grand = max(plus_grand, int(correspondance.group(1)))
+    return plus_grand
+
+
+def attribuer_numero(entreprise='', date=None):
+    """
+    Attribue le prochain numéro de devis pour une entreprise et l'année de `date`
+    (aujourd'hui par défaut). Doit être appelée dans la transaction qui crée le devis.
+
+    Returns:
+        Le numéro formaté, par exemple DEV-2026-00042
+    """
+    annee = (date or timezone.localdate()).year
+
+    with transaction.atomic():
+        CompteurNumeroDevis.objects.get_or_create(
+            entreprise=entreprise,
+            annee=annee,
+            defaults={'dernier_numero': _premier_numero_libre(entreprise, annee)}
+        )
+        compteur = CompteurNumeroDevis.objects.select_for_update().get(entreprise=entreprise, annee=annee)
+        # Les numéros déjà pris (devis saisis avant la numérotation automatique) sont sautés
+        while True:
+            compteur.dernier_numero += 1
+            numero = format_numero().format(annee=annee, entreprise=entreprise, numero=compteur.dernier_numero)
+            if not Devis.objects.filter(numero=numero).exists():
+                break
+        compteur.save(update_fields=['dernier_numero'])
+
+    return numero
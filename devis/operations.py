@@ -0,0 +1,368 @@
+"""
+Application transactionnelle d'une suite d'opérations d'édition sur un devis.
+
+Les lots et les lignes du devis sont chargés une seule fois. Chaque opération
+(ajout, modification, suppression, déplacement) est validée et appliquée en
+mémoire, dans l'ordre reçu. Si toutes sont valides, les écritures sont
+regroupées en quelques requêtes (suppressions, bulk_update, bulk_create) dans
+une transaction, puis les totaux du devis sont recalculés. La première
+opération invalide annule l'ensemble : aucun état intermédiaire n'est écrit.
+
+Format d'une opération :
+    {"op": "add" | "update" | "delete" | "move",
+     "cible": "lot" | "ligne",
+     "id": <ID de l'élément visé>,                          (update, delete, move)
+     "ref": <référence libre de l'élément ajouté>,          (add, facultatif)
+     "donnees": {<champs du lot ou de la ligne>},           (add, update)
+     "lot": <ID du lot cible d'une ligne déplacée>,         (move, facultatif)
+     "apres": <ID du voisin précédent>,                     (add, move, facultatif)
+     "avant": <ID du voisin suivant>}                       (add, move, facultatif)
+
+Une référence ("ref") peut remplacer un ID dans toutes les opérations suivantes,
+y compris comme lot d'une ligne ajoutée ou comme voisin. Sans "apres" ni "avant",
+un ajout est placé à la fin de son conteneur.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from bibliotheque.models import Ouvrage
+
+from .historique_prix import STATUTS_HISTORIQUE, invalider_historique_prix
+from .models import Devis, Lot, LigneDevis
+from .ordonnancement import PlacementInvalide, cle_entre, placer_en_memoire
+from .prevision import ajuster_prevision_devis
+from .recherche import invalider_documents
+from .serializers import LigneDevisBulkSerializer, LotOperationSerializer
+from .tarification import debourses_ouvrages, preremplir_ligne
+from .totaux import recalculer_totaux
+
+OPERATIONS = ('add', 'update', 'delete', 'move')
+CIBLES = ('lot', 'ligne')
+
+CHAMPS_LOT = ['nom', 'description', 'ordre']
+CHAMPS_LIGNE = [
+    'lot', 'type', 'ouvrage', 'description', 'quantite',
+    'unite', 'prix_unitaire', 'debourse', 'ordre'
+]
+
+
+class OperationInvalide(Exception):
+    """
+    Levée lorsqu'une opération ne peut pas être appliquée.
+    """
+    def __init__(self, index, erreurs):
+        super().__init__(erreurs)
+        self.index = index
+        self.erreurs = erreurs
+
+
+class EditionDevis:
+    """
+    État en mémoire des lots et des lignes d'un devis pendant l'application des
+    opérations. Les éléments ajoutés portent un ID provisoire négatif jusqu'à
+    leur enregistrement.
+    """
+    def __init__(self, devis, operations):
+        self.devis = devis
+        self.lots = {lot.pk: lot for lot in Lot.objects.filter(devis=devis)}
+        self.lignes = {ligne.pk: ligne for ligne in LigneDevis.objects.filter(lot__devis=devis)}
+        self.ouvrages_initiaux = {ligne.ouvrage_id for ligne in self.lignes.values()}
+        self.quantites_initiales = self._quantites_par_ouvrage()
+        self.ordres_lots = {pk: lot.ordre for pk, lot in self.lots.items()}
+        self.lots_modifies = set()
+        self.lignes_modifiees = set()
+        self.lots_supprimes = set()
+        self.lignes_supprimees = set()
+        self.references = {}
+        self._prochain_id = -1
+        self._precharger_ouvrages(operations)
+
+    def _precharger_ouvrages(self, operations):
+        """
+        Charge en une fois les ouvrages cités par les opérations et par les lignes
+        modifiées, ainsi que le déboursé sec des ouvrages.
+        """
+        ouvrage_ids = set()
+        for operation in operations:
+            if not isinstance(operation, dict) or operation.get('cible') != 'ligne':
+                continue
+            donnees = operation.get('donnees')
+            if isinstance(donnees, dict) and donnees.get('ouvrage') is not None:
+                ouvrage_ids.add(donnees['ouvrage'])
+            if operation.get('op') == 'update':
+                ligne = self.lignes.get(self._entier(operation.get('id')))
+                if ligne and ligne.ouvrage_id:
+                    ouvrage_ids.add(ligne.ouvrage_id)
+
+        ouvrage_ids = {self._entier(ouvrage_id) for ouvrage_id in ouvrage_ids} - {None}
+        self.ouvrages = Ouvrage.objects.in_bulk(ouvrage_ids)
+        self.debourses = debourses_ouvrages(self.ouvrages.keys())
+
+    @staticmethod
+    def _entier(valeur):
+        try:
+            return int(valeur)
+        except (TypeError, ValueError):
+            return None
+
+    def _resoudre(self, valeur, cible, champ):
+        """
+        Convertit un ID ou une référence d'élément ajouté en ID (provisoire ou non).
+        """
+        if valeur is None:
+            return None
+        if isinstance(valeur, str) and valeur in self.references:
+            cible_reference, element_id = self.references[valeur]
+            if cible_reference != cible:
+                raise serializers.ValidationError({champ: [f"La référence {valeur} ne désigne pas un {cible}."]})
+            return element_id
+        element_id = self._entier(valeur)
+        if element_id is None:
+            raise serializers.ValidationError({champ: [f"Identifiant invalide : {valeur}"]})
+        return element_id
+
+    def _element(self, operation, cible):
+        """
+        Retourne le lot ou la ligne visé par l'opération.
+        """
+        elements = self.lots if cible == 'lot' else self.lignes
+        element = elements.get(self._resoudre(operation.get('id'), cible, 'id'))
+        if element is None:
+            raise serializers.ValidationError(
+                {"id": [f"L'élément {operation.get('id')} n'appartient pas à ce devis."]}
+            )
+        return element
+
+    def _nouvel_id(self, operation, cible):
+        """
+        Attribue un ID provisoire à un élément ajouté et enregistre sa référence.
+        """
+        element_id = self._prochain_id
+        self._prochain_id -= 1
+        if operation.get('ref') is not None:
+            self.references[str(operation['ref'])] = (cible, element_id)
+        return element_id
+
+    def _lignes_du_lot(self, lot_id):
+        return [ligne for ligne in self.lignes.values() if ligne.lot_id == lot_id]
+
+    def _placer(self, element, elements, operation, cible, modifies, ajout=False):
+        """
+        Calcule la clé d'ordre d'un élément ajouté ou déplacé.
+        """
+        if ajout and 'apres' not in operation and 'avant' not in operation:
+            autres = [e.ordre for e in elements if e.pk != element.pk]
+            element.ordre = cle_entre(max(autres, default=None), None)
+            modifies.add(element.pk)
+            return
+
+        modifies.update(e.pk for e in placer_en_memoire(
+            element, elements,
+            apres_id=self._resoudre(operation.get('apres'), cible, 'apres'),
+            avant_id=self._resoudre(operation.get('avant'), cible, 'avant')
+        ))
+
+    def _valider_ligne(self, donnees):
+        """
+        Valide les données complètes d'une ligne et retourne les valeurs de ses champs.
+        """
+        serializer = LigneDevisBulkSerializer(
+            data=donnees, context={'lots': self.lots.keys(), 'ouvrages': self.ouvrages}
+        )
+        serializer.is_valid(raise_exception=True)
+        valeurs = dict(serializer.validated_data)
+        valeurs['lot_id'] = valeurs.pop('lot')
+        valeurs['ouvrage_id'] = valeurs.pop('ouvrage', None)
+        return valeurs
+
+    def appliquer(self, index, operation):
+        """
+        Applique une opération à l'état en mémoire.
+
+        Raises:
+            OperationInvalide: si l'opération est mal formée ou invalide
+        """
+        if not isinstance(operation, dict):
+            raise OperationInvalide(index, {"detail": "Une opération doit être un objet"})
+        if operation.get('op') not in OPERATIONS:
+            raise OperationInvalide(index, {"op": [f"Opération invalide. Valeurs possibles : {list(OPERATIONS)}"]})
+        if operation.get('cible') not in CIBLES:
+            raise OperationInvalide(index, {"cible": [f"Cible invalide. Valeurs possibles : {list(CIBLES)}"]})
+
+        try:
+            getattr(self, f"_{operation['op']}_{operation['cible']}")(operation)
+        except PlacementInvalide as e:
+            raise OperationInvalide(index, {"detail": str(e)})
+        except serializers.ValidationError as e:
+            raise OperationInvalide(index, e.detail)
+
+    def _add_lot(self, operation):
+        serializer = LotOperationSerializer(data=operation.get('donnees') or {})
+        serializer.is_valid(raise_exception=True)
+        lot = Lot(id=self._nouvel_id(operation, 'lot'), devis=self.devis, **serializer.validated_data)
+        self._placer(lot, list(self.lots.values()), operation, 'lot', self.lots_modifies, ajout=True)
+        self.lots[lot.pk] = lot
+
+    def _update_lot(self, operation):
+        lot = self._element(operation, 'lot')
+        serializer = LotOperationSerializer(lot, data=operation.get('donnees') or {}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        for champ, valeur in serializer.validated_data.items():
+            setattr(lot, champ, valeur)
+        self.lots_modifies.add(lot.pk)
+
+    def _delete_lot(self, operation):
+        lot = self._element(operation, 'lot')
+        for ligne in self._lignes_du_lot(lot.pk):
+            self._retirer_ligne(ligne)
+        del self.lots[lot.pk]
+        self.lots_modifies.discard(lot.pk)
+        if lot.pk > 0:
+            self.lots_supprimes.add(lot.pk)
+
+    def _move_lot(self, operation):
+        lot = self._element(operation, 'lot')
+        self._placer(lot, list(self.lots.values()), operation, 'lot', self.lots_modifies)
+
+    def _add_ligne(self, operation):
+        donnees = dict(operation.get('donnees') or {})
+        if 'lot' in donnees:
+            donnees['lot'] = self._resoudre(donnees['lot'], 'lot', 'lot')
+        if donnees.get('type') == 'ouvrage':
+            ouvrage = self.ouvrages.get(self._entier(donnees.get('ouvrage')))
+            if ouvrage:
+                donnees = preremplir_ligne(donnees, ouvrage, self.debourses[ouvrage.id])
+
+        ligne = LigneDevis(id=self._nouvel_id(operation, 'ligne'), **self._valider_ligne(donnees))
+        if 'ordre' in donnees:
+            self.lignes_modifiees.add(ligne.pk)
+        else:
+            self._placer(ligne, self._lignes_du_lot(ligne.lot_id), operation, 'ligne',
+                         self.lignes_modifiees, ajout=True)
+        self.lignes[ligne.pk] = ligne
+
+    def _update_ligne(self, operation):
+        ligne = self._element(operation, 'ligne')
+        modifications = dict(operation.get('donnees') or {})
+        if 'lot' in modifications:
+            modifications['lot'] = self._resoudre(modifications['lot'], 'lot', 'lot')
+
+        donnees = {champ: getattr(ligne, champ) for champ in CHAMPS_LIGNE if champ not in ['lot', 'ouvrage']}
+        donnees.update(lot=ligne.lot_id, ouvrage=ligne.ouvrage_id)
+        donnees.update(modifications)
+        valeurs = self._valider_ligne(donnees)
+
+        change_de_lot = valeurs['lot_id'] != ligne.lot_id
+        for champ, valeur in valeurs.items():
+            setattr(ligne, champ, valeur)
+        if change_de_lot and 'ordre' not in modifications:
+            self._placer(ligne, self._lignes_du_lot(ligne.lot_id), {}, 'ligne',
+                         self.lignes_modifiees, ajout=True)
+        self.lignes_modifiees.add(ligne.pk)
+
+    def _delete_ligne(self, operation):
+        self._retirer_ligne(self._element(operation, 'ligne'))
+
+    def _retirer_ligne(self, ligne):
+        del self.lignes[ligne.pk]
+        self.lignes_modifiees.discard(ligne.pk)
+        if ligne.pk > 0:
+            self.lignes_supprimees.add(ligne.pk)
+
+    def _move_ligne(self, operation):
+        ligne = self._element(operation, 'ligne')
+        lot_id = ligne.lot_id
+        if operation.get('lot') is not None:
+            lot_id = self._resoudre(operation['lot'], 'lot', 'lot')
+            if lot_id not in self.lots:
+                raise serializers.ValidationError(
+                    {"lot": [f"Le lot avec l'ID {operation['lot']} n'appartient pas à ce devis."]}
+                )
+
+        ligne.lot_id = lot_id
+        self._placer(ligne, self._lignes_du_lot(lot_id), operation, 'ligne', self.lignes_modifiees)
+        self.lignes_modifiees.add(ligne.pk)
+
+    def enregistrer(self):
+        """
+        Écrit l'état en mémoire en base puis recalcule les totaux du devis.
+        À appeler dans une transaction.
+        """
+        if self.lignes_supprimees:
+            LigneDevis.objects.filter(pk__in=self.lignes_supprimees).delete()
+
+        # Les lots déplacés, et ceux à supprimer (supprimés à la fin, une fois les
+        # lignes qui en sortent rattachées à leur nouveau lot), sont d'abord décalés
+        # au-delà de toutes les clés, pour ne jamais violer l'unicité (devis, ordre)
+        lots_existants = [self.lots[pk] for pk in self.lots_modifies if pk > 0]
+        decales = {lot.pk for lot in lots_existants if lot.ordre != self.ordres_lots[lot.pk]}
+        decales |= self.lots_supprimes
+        if decales:
+            decalage = max([lot.ordre for lot in self.lots.values()] + list(self.ordres_lots.values())) + 1
+            Lot.objects.filter(pk__in=decales).update(ordre=F('ordre') + decalage)
+        Lot.objects.bulk_update(lots_existants, CHAMPS_LOT, batch_size=500)
+
+        # Nouveaux lots, puis rattachement des lignes aux IDs définitifs
+        nouveaux_lots = {pk: self.lots[pk] for pk in self.lots_modifies if pk < 0}
+        for lot in nouveaux_lots.values():
+            lot.pk = None
+        Lot.objects.bulk_create(nouveaux_lots.values(), batch_size=500)
+
+        lignes = [self.lignes[pk] for pk in self.lignes_modifiees]
+        for ligne in lignes:
+            if ligne.lot_id < 0:
+                ligne.lot_id = nouveaux_lots[ligne.lot_id].pk
+
+        nouvelles_lignes = {ligne.pk: ligne for ligne in lignes if ligne.pk < 0}
+        LigneDevis.objects.bulk_update([ligne for ligne in lignes if ligne.pk > 0], CHAMPS_LIGNE, batch_size=500)
+        for ligne in nouvelles_lignes.values():
+            ligne.pk = None
+        LigneDevis.objects.bulk_create(nouvelles_lignes.values(), batch_size=500)
+
+        if self.lots_supprimes:
+            Lot.objects.filter(pk__in=self.lots_supprimes).delete()
+
+        # Les références renvoient désormais aux IDs définitifs
+        crees = {('lot', pk): lot.pk for pk, lot in nouveaux_lots.items()}
+        crees.update({('ligne', pk): ligne.pk for pk, ligne in nouvelles_lignes.items()})
+        self.references = {ref: crees[element] for ref, element in self.references.items() if element in crees}
+
+        recalculer_totaux([self.devis.pk])
+        invalider_documents(pk=self.devis.pk)
+        if self.devis.statut in STATUTS_HISTORIQUE:
+            invalider_historique_prix(self.ouvrages_initiaux | {ligne.ouvrage_id for ligne in self.lignes.values()})
+        variations = self._quantites_par_ouvrage()
+        variations.subtract(self.quantites_initiales)
+        ajuster_prevision_devis(variations, pk=self.devis.pk)
+    
+    def _quantites_par_ouvrage(self):
+        """
+        Quantité cumulée des lignes en mémoire, par ouvrage.
+        """
+        quantites = Counter()
+        for ligne in self.lignes.values():
+            quantites[ligne.ouvrage_id] += ligne.quantite
+        return quantites
+
+
+def appliquer_operations(devis, operations):
+    """
+    Applique une suite d'opérations à un devis en une transaction, le devis étant
+    verrouillé le temps de l'édition.
+
+    Returns:
+        Dictionnaire {référence: ID définitif} des éléments ajoutés
+
+    Raises:
+        OperationInvalide: à la première opération invalide (rien n'est enregistré)
+    """
+    with transaction.atomic():
+        Devis.objects.select_for_update().only('pk').get(pk=devis.pk)
+        edition = EditionDevis(devis, operations)
+        for index, operation in enumerate(operations):
+            edition.appliquer(index, operation)
+        edition.enregistrer()
+    return edition.references
@@ -0,0 +1,183 @@
+"""
+Ordre d'affichage des lots et des lignes par clés espacées.
+
+Le champ `ordre` n'est plus une suite dense 0, 1, 2... mais une suite de clés
+espacées de PAS_ORDRE. Déplacer ou insérer un élément entre deux voisins lui
+attribue la clé médiane : une seule ligne est modifiée. Lorsque deux voisins
+n'ont plus d'écart, le conteneur (lots d'un devis ou lignes d'un lot) est
+renuméroté en deux requêtes. La commande reequilibrer_ordres_devis permet de
+renuméroter l'ensemble des conteneurs périodiquement.
+
+Les clés voisines sont lues puis la nouvelle clé écrite : le parent du conteneur
+(devis pour les lots, lot pour les lignes) est verrouillé au préalable (voir
+verrouiller) pour que deux déplacements concurrents dans le même conteneur ne
+calculent pas la même clé.
+"""
+from django.db.models import F, Max
+
+PAS_ORDRE = 1024
+
+
+class PlacementInvalide(Exception):
+    """
+    Levée lorsque les voisins demandés pour un déplacement ne sont pas valides.
+    """
+
+
+def verrouiller(modele, ids):
+    """
+    Verrouille (select_for_update) jusqu'à la fin de la transaction les devis ou
+    les lots dont les éléments vont être réordonnés, dans l'ordre des IDs pour
+    que deux transactions verrouillant les mêmes parents ne s'interbloquent pas.
+    """
+    list(modele.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+
+def cle_entre(precedent, suivant):
+    """
+    Retourne une clé strictement comprise entre deux clés voisines,
+    ou None s'il n'y a plus d'écart entre elles.
+
+    Args:
+        precedent: Clé de l'élément précédent (None en début de liste)
+        suivant: Clé de l'élément suivant (None en fin de liste)
+    """
+    if precedent is None and suivant is None:
+        return PAS_ORDRE
+    if suivant is None:
+        return precedent + PAS_ORDRE
+    if precedent is None:
+        precedent = -1
+    if suivant - precedent > 1:
+        return (precedent + suivant + 1) // 2
+    return None
+
+
+def cle_fin(queryset):
+    """
+    Retourne la clé permettant d'ajouter un élément à la fin du conteneur.
+    """
+    return cle_entre(queryset.aggregate(ordre_max=Max('ordre'))['ordre_max'], None)
+
+
+def appliquer_ordre(queryset, ids):
+    """
+    Réattribue des clés espacées aux éléments du conteneur, dans l'ordre des IDs
+    fournis (les éléments absents de la liste sont placés ensuite, dans leur ordre
+    actuel). Deux requêtes UPDATE, sans jamais produire de doublon de clé en cours
+    de route : les clés sont d'abord décalées au-delà de toutes les clés finales.
+    """
+    elements = {element.pk: element for element in queryset.order_by('ordre', 'pk').only('pk', 'ordre')}
+    ordonnes = [elements.pop(pk) for pk in ids if pk in elements] + list(elements.values())
+    if not ordonnes:
+        return []
+
+    decalage = max(max(element.ordre for element in ordonnes), len(ordonnes) * PAS_ORDRE) + 1
+    queryset.update(ordre=F('ordre') + decalage)
+
+    for rang, element in enumerate(ordonnes, start=1):
+        element.ordre = rang * PAS_ORDRE
+    queryset.model.objects.bulk_update(ordonnes, ['ordre'], batch_size=500)
+    return ordonnes
+
+
+def reequilibrer(queryset):
+    """
+    Renumérote les éléments d'un conteneur en conservant leur ordre actuel.
+    """
+    return appliquer_ordre(queryset, [])
+
+
+def placer(element, conteneur, apres_id=None, avant_id=None):
+    """
+    Calcule la clé d'un élément placé entre deux voisins du conteneur et l'affecte
+    à element.ordre (sans enregistrer). Renumérote le conteneur si nécessaire.
+
+    Args:
+        element: Lot ou ligne à déplacer
+        conteneur: Queryset des éléments du conteneur cible (lots d'un devis, lignes d'un lot)
+        apres_id: ID de l'élément après lequel placer `element` (None : en tête)
+        avant_id: ID de l'élément avant lequel placer `element`. Utilisé seul, il
+                  désigne la position ; avec apres_id, il vérifie que les deux voisins
+                  sont bien adjacents.
+
+    Le parent du conteneur doit être verrouillé dans la transaction courante
+    (voir verrouiller).
+
+    Raises:
+        PlacementInvalide: si un voisin n'appartient pas au conteneur ou si les
+                           voisins ne sont pas adjacents
+    """
+    autres = conteneur.exclude(pk=element.pk)
+
+    for _ in range(2):
+        if apres_id is not None:
+            precedent = autres.filter(pk=apres_id).values_list('ordre', flat=True).first()
+            if precedent is None:
+                raise PlacementInvalide(f"L'élément {apres_id} n'appartient pas au conteneur")
+            suivant = autres.filter(ordre__gt=precedent).order_by('ordre').values_list('pk', 'ordre').first()
+        elif avant_id is not None:
+            suivant = autres.filter(pk=avant_id).values_list('pk', 'ordre').first()
+            if suivant is None:
+                raise PlacementInvalide(f"L'élément {avant_id} n'appartient pas au conteneur")
+            precedent = autres.filter(ordre__lt=suivant[1]).aggregate(ordre_max=Max('ordre'))['ordre_max']
+        else:
+            precedent = None
+            suivant = autres.order_by('ordre').values_list('pk', 'ordre').first()
+
+        if avant_id is not None and (suivant is None or suivant[0] != avant_id):
+            raise PlacementInvalide(f"Les éléments {apres_id} et {avant_id} ne sont pas adjacents")
+
+        cle = cle_entre(precedent, suivant[1] if suivant else None)
+        if cle is not None:
+            element.ordre = cle
+            return cle
+
+        # Plus d'écart entre les voisins : renuméroter le conteneur (élément compris,
+        # pour que son ancienne clé ne puisse pas entrer en conflit) puis recommencer
+        reequilibrer(conteneur)
+
+    raise PlacementInvalide("Impossible de calculer une clé d'ordre")
+
+
+def placer_en_memoire(element, elements, apres_id=None, avant_id=None):
+    """
+    Équivalent de placer() sur des objets déjà chargés, sans requête : `elements`
+    contient les éléments du conteneur (l'élément déplacé peut en faire partie).
+
+    Returns:
+        Liste des éléments dont la clé a changé (l'élément seul, ou tout le
+        conteneur s'il a fallu le renuméroter)
+
+    Raises:
+        PlacementInvalide: dans les mêmes cas que placer()
+    """
+    autres = sorted((e for e in elements if e.pk != element.pk), key=lambda e: e.ordre)
+    ids = [e.pk for e in autres]
+
+    if apres_id is not None:
+        if apres_id not in ids:
+            raise PlacementInvalide(f"L'élément {apres_id} n'appartient pas au conteneur")
+        rang = ids.index(apres_id) + 1
+    elif avant_id is not None:
+        if avant_id not in ids:
+            raise PlacementInvalide(f"L'élément {avant_id} n'appartient pas au conteneur")
+        rang = ids.index(avant_id)
+    else:
+        rang = 0
+
+    if avant_id is not None and (rang >= len(ids) or ids[rang] != avant_id):
+        raise PlacementInvalide(f"Les éléments {apres_id} et {avant_id} ne sont pas adjacents")
+
+    cle = cle_entre(
+        autres[rang - 1].ordre if rang > 0 else None,
+        autres[rang].ordre if rang < len(autres) else None
+    )
+    if cle is not None:
+        element.ordre = cle
+        return [element]
+
+    autres.insert(rang, element)
+    for position, autre in enumerate(autres, start=1):
+        autre.ordre = position * PAS_ORDRE
+    return autres
@@ -8,6 +8,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.platypus.flowables import KeepTogether
 from django.conf import settings
 from decimal import Decimal
+from .arbre import ArbreDevis
 
 class DevisPDFGenerator:
     """
@@ -18,9 +19,10 @@ class DevisPDFGenerator:
         Initialisation avec un devis et les paramètres de visualisation.
         
         Args:
-            devis: Instance du modèle Devis
+            devis: Instance du modèle Devis (idéalement chargée via queryset_arbre)
             show_costs: Booléen indiquant si les coûts doivent être inclus dans le PDF
         """
+        self.arbre = ArbreDevis(devis)
         self.devis = devis
         self.show_costs = show_costs
         self.buffer = BytesIO()
@@ -173,16 +175,17 @@ class DevisPDFGenerator:
         client = self.devis.client
         
         # Récupération du contact principal pour devis s'il existe
-        contact_principal = None
-        contacts = client.contacts.filter(contact_principal_devis=True)
-        if contacts.exists():
-            contact_principal = contacts.first()
+        # (adresses et contacts sont préchargés avec l'arbre du devis)
+        contact_principal = next(
+            (contact for contact in client.contacts.all() if contact.contact_principal_devis),
+            None
+        )
         
         # Ajout des adresses du client
-        adresses = client.adresses.all()
-        if adresses.exists():
-            adresse = adresses.first()  # On prend la première adresse (ou adresse de facturation si disponible)
-            adresse_facturation = client.adresses.filter(facturation=True).first()
+        adresses = list(client.adresses.all())
+        if adresses:
+            adresse = adresses[0]  # On prend la première adresse (ou adresse de facturation si disponible)
+            adresse_facturation = next((a for a in adresses if a.facturation), None)
             if adresse_facturation:
                 adresse = adresse_facturation
             
@@ -263,7 +266,8 @@ class DevisPDFGenerator:
         elements.append(Paragraph("PRESTATIONS", self.section_style))
         
         # Parcourir chaque lot
-        for lot in self.devis.lots.all().order_by('ordre'):
+        for noeud in self.arbre.lots:
+            lot = noeud.lot
             # Titre du lot
             elements.append(Paragraph(lot.nom, ParagraphStyle(
                 'LotTitle',
@@ -289,7 +293,7 @@ class DevisPDFGenerator:
             data = [headers]
             
             # Ajouter chaque ligne
-            for ligne in lot.lignes.all().order_by('ordre'):
+            for ligne in noeud.lignes:
                 if self.show_costs:
                     row = [
                         ligne.description,
@@ -317,9 +321,9 @@ class DevisPDFGenerator:
                     "",
                     "",
                     "",
-                    self._format_currency(lot.total_debourse),
-                    self._format_percentage(lot.marge),
-                    self._format_currency(lot.total_ht)
+                    self._format_currency(noeud.total_debourse),
+                    self._format_percentage(noeud.marge),
+                    self._format_currency(noeud.total_ht)
                 ]
             else:
                 subtotal_row = [
@@ -327,7 +331,7 @@ class DevisPDFGenerator:
                     "",
                     "",
                     "",
-                    self._format_currency(lot.total_ht)
+                    self._format_currency(noeud.total_ht)
                 ]
             data.append(subtotal_row)
             
@@ -364,19 +368,20 @@ class DevisPDFGenerator:
         elements.append(Paragraph("RÉCAPITULATIF", self.section_style))
         
         # Créer les lignes du tableau des totaux
+        total_ht = self.arbre.total_ht
         if self.show_costs:
             total_data = [
-                ["Total déboursé HT", self._format_currency(self.devis.total_debourse)],
-                ["Marge moyenne", self._format_percentage(self.devis.marge_totale)],
-                ["TOTAL HT", self._format_currency(self.devis.total_ht)],
-                ["TVA (20%)", self._format_currency(self.devis.total_ht * Decimal('0.20'))],
-                ["TOTAL TTC", self._format_currency(self.devis.total_ht * Decimal('1.20'))]
+                ["Total déboursé HT", self._format_currency(self.arbre.total_debourse)],
+                ["Marge moyenne", self._format_percentage(self.arbre.marge_totale)],
+                ["TOTAL HT", self._format_currency(total_ht)],
+                ["TVA (20%)", self._format_currency(total_ht * Decimal('0.20'))],
+                ["TOTAL TTC", self._format_currency(total_ht * Decimal('1.20'))]
             ]
         else:
             total_data = [
-                ["TOTAL HT", self._format_currency(self.devis.total_ht)],
-                ["TVA (20%)", self._format_currency(self.devis.total_ht * Decimal('0.20'))],
-                ["TOTAL TTC", self._format_currency(self.devis.total_ht * Decimal('1.20'))]
+                ["TOTAL HT", self._format_currency(total_ht)],
+                ["TVA (20%)", self._format_currency(total_ht * Decimal('0.20'))],
+                ["TOTAL TTC", self._format_currency(total_ht * Decimal('1.20'))]
             ]
         
         # Créer le tableau
@@ -0,0 +1,265 @@
+"""
+Prévision des achats et heures de main d'œuvre engagés par les devis acceptés.
+
+La table PrevisionAchat cumule, par mois et par élément, quantité de ligne ×
+quantité d'ingrédient pour toutes les lignes 'ouvrage' des devis acceptés. Le
+mois d'un devis est celui de sa date de validité, ou à défaut de sa date
+d'acceptation.
+
+La table n'est jamais recalculée : chaque modification y reporte sa seule
+différence, exprimée en variation de quantité par ouvrage (voir
+ajuster_prevision) :
+- passage d'un devis au statut accepté, ou départ de ce statut (Devis.save),
+  changement de mois d'un devis accepté, suppression d'un devis ou d'un lot ;
+- création, modification ou suppression d'une ligne d'un devis accepté
+  (LigneDevis.save/delete, création en masse, opérations groupées) ;
+- modification de la composition d'un ouvrage (récepteurs des ingrédients).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save, pre_delete, pre_save
+
+from bibliotheque.models import Fourniture, IngredientOuvrage, MainOeuvre
+
+from .models import Devis, LigneDevis, PrevisionAchat
+from .quantitatif import decrire_elements
+
+STATUT_PREVISION = 'accepté'
+
+
+def mois_prevision(date_validite, date_acceptation):
+    """
+    Retourne le mois (premier jour) auquel un devis accepté est rattaché.
+    """
+    date = date_validite or date_acceptation
+    return date.replace(day=1) if date else None
+
+
+def variations_lignes(lignes, signe=1):
+    """
+    Retourne la quantité cumulée par ouvrage d'un queryset de lignes, en une requête.
+    """
+    return {
+        ouvrage_id: signe * quantite
+        for ouvrage_id, quantite in lignes.exclude(ouvrage=None).order_by()
+        .values('ouvrage_id').annotate(quantite=Sum('quantite'))
+        .values_list('ouvrage_id', 'quantite')
+    }
+
+
+def _appliquer(mois, quantites):
+    """
+    Ajoute des quantités {(element_type_id, element_id): quantité} aux prévisions d'un mois.
+
+    Les lignes manquantes sont d'abord insérées à zéro en ignorant les conflits
+    (INSERT ... ON CONFLICT DO NOTHING) : deux premiers ajouts concurrents ne
+    peuvent pas violer la contrainte d'unicité. Les lignes, toutes présentes,
+    sont ensuite verrouillées et incrémentées.
+    """
+    quantites = {cle: quantite for cle, quantite in quantites.items() if quantite}
+    if not quantites:
+        return
+
+    with transaction.atomic():
+        PrevisionAchat.objects.bulk_create(
+            [
+                PrevisionAchat(mois=mois, element_type_id=element_type_id, element_id=element_id)
+                for element_type_id, element_id in quantites
+            ],
+            ignore_conflicts=True
+        )
+        previsions = [
+            prevision
+            for prevision in PrevisionAchat.objects.select_for_update().filter(
+                mois=mois, element_id__in={element_id for _, element_id in quantites}
+            )
+            if (prevision.element_type_id, prevision.element_id) in quantites
+        ]
+        for prevision in previsions:
+            prevision.quantite += quantites[(prevision.element_type_id, prevision.element_id)]
+        PrevisionAchat.objects.bulk_update(previsions, ['quantite'])
+
+
+def ajuster_prevision(mois, variations):
+    """
+    Reporte sur les prévisions d'un mois des variations de quantité par ouvrage,
+    décomposées selon les ingrédients actuels des ouvrages (une requête).
+
+    Args:
+        mois: Mois concerné (None : aucun report)
+        variations: Dictionnaire {ouvrage_id: variation de quantité}
+    """
+    variations = {ouvrage_id: q for ouvrage_id, q in variations.items() if ouvrage_id is not None and q}
+    if mois is None or not variations:
+        return
+
+    quantites = defaultdict(int)
+    for ouvrage_id, element_type_id, element_id, quantite in (
+        IngredientOuvrage.objects.filter(ouvrage_id__in=variations)
+        .values_list('ouvrage_id', 'element_type_id', 'element_id', 'quantite')
+    ):
+        quantites[(element_type_id, element_id)] += variations[ouvrage_id] * quantite
+    _appliquer(mois, quantites)
+
+
+def ajuster_prevision_devis(variations, **filtres):
+    """
+    Reporte des variations par ouvrage sur le mois du devis correspondant aux
+    filtres (par exemple pk=... ou lots__pk=...), s'il est accepté.
+    """
+    variations = {ouvrage_id: q for ouvrage_id, q in variations.items() if ouvrage_id is not None and q}
+    if not variations:
+        return
+
+    dates = (
+        Devis.objects.filter(statut=STATUT_PREVISION, **filtres)
+        .values_list('date_validite', 'date_acceptation')
+        .first()
+    )
+    if dates:
+        ajuster_prevision(mois_prevision(*dates), variations)
+
+
+def prevision_lignes_devis(devis_id):
+    """
+    Variations par ouvrage correspondant à toutes les lignes d'un devis.
+    """
+    return variations_lignes(LigneDevis.objects.filter(lot__devis_id=devis_id))
+
+
+def lire_prevision(debut=None, fin=None):
+    """
+    Retourne les quantités prévues par mois : {mois: {(element_type_id, element_id): quantité}}.
+
+    Args:
+        debut, fin: Premier et dernier mois retenus (inclus)
+    """
+    previsions = PrevisionAchat.objects.exclude(quantite=0)
+    if debut is not None:
+        previsions = previsions.filter(mois__gte=debut)
+    if fin is not None:
+        previsions = previsions.filter(mois__lte=fin)
+
+    resultat = defaultdict(dict)
+    for mois, element_type_id, element_id, quantite in (
+        previsions.order_by('mois').values_list('mois', 'element_type_id', 'element_id', 'quantite')
+    ):
+        resultat[mois][(element_type_id, element_id)] = quantite
+    return resultat
+
+
+def rapport_prevision(debut=None, fin=None, categorie=None, avec_couts=True):
+    """
+    Rapport de prévision : total de la période et détail par mois, décrits comme
+    dans le quantitatif d'un devis (voir devis/quantitatif.py).
+
+    Args:
+        debut, fin: Premier et dernier mois retenus (inclus)
+        categorie: Ne retient que les éléments de cette catégorie (ID)
+        avec_couts: Inclut les prix unitaires et coûts de la bibliothèque
+    """
+    par_mois = lire_prevision(debut, fin)
+    totaux = defaultdict(int)
+    for quantites in par_mois.values():
+        for cle, quantite in quantites.items():
+            totaux[cle] += quantite
+    total = decrire_elements(totaux, avec_couts=avec_couts, categorie=categorie)
+
+    types = {
+        'fourniture': ContentType.objects.get_for_model(Fourniture).id,
+        'main_oeuvre': ContentType.objects.get_for_model(MainOeuvre).id,
+    }
+    mois = []
+    for premier_jour, quantites in par_mois.items():
+        elements = []
+        for element in total:
+            quantite = quantites.get((types[element['nature']], element['element_id']))
+            if quantite is None:
+                continue
+            element = {**element, 'quantite': round(quantite, 3)}
+            if avec_couts:
+                element['cout'] = round(quantite * element['prix_unitaire'], 2)
+            elements.append(element)
+        if elements:
+            mois.append({'mois': premier_jour.strftime('%Y-%m'), 'elements': elements})
+
+    rapport = {'total': total, 'mois': mois}
+    if avec_couts:
+        rapport['cout_total'] = sum((element['cout'] for element in total), Decimal('0'))
+    return rapport
+
+
+def _mois_acceptes_ouvrage(ouvrage_id):
+    """
+    Quantité cumulée des lignes de l'ouvrage dans les devis acceptés, par mois.
+    """
+    quantites = defaultdict(int)
+    for date_validite, date_acceptation, quantite in (
+        LigneDevis.objects.filter(ouvrage_id=ouvrage_id, lot__devis__statut=STATUT_PREVISION)
+        .order_by()
+        .values('lot__devis__date_validite', 'lot__devis__date_acceptation')
+        .annotate(quantite=Sum('quantite'))
+        .values_list('lot__devis__date_validite', 'lot__devis__date_acceptation', 'quantite')
+    ):
+        quantites[mois_prevision(date_validite, date_acceptation)] += quantite
+    return quantites
+
+
+def _reporter_ingredient(ingredient, signe):
+    """
+    Reporte l'ajout (signe=1) ou le retrait (signe=-1) d'un ingrédient
+    (ouvrage_id, element_type_id, element_id, quantité) sur les prévisions.
+    """
+    ouvrage_id, element_type_id, element_id, quantite = ingredient
+    for mois, quantite_lignes in _mois_acceptes_ouvrage(ouvrage_id).items():
+        if mois is not None:
+            _appliquer(mois, {(element_type_id, element_id): signe * quantite_lignes * quantite})
+
+
+def _ingredient(instance):
+    return (instance.ouvrage_id, instance.element_type_id, instance.element_id, instance.quantite)
+
+
+def memoriser_ingredient(sender, instance, **kwargs):
+    """
+    Récepteur pre_save des ingrédients : mémorise l'ingrédient tel qu'il est en base.
+    """
+    instance._ingredient_enregistre = (
+        IngredientOuvrage.objects.filter(pk=instance.pk)
+        .values_list('ouvrage_id', 'element_type_id', 'element_id', 'quantite')
+        .first()
+    ) if instance.pk else None
+
+
+def reporter_ingredient_enregistre(sender, instance, **kwargs):
+    """
+    Récepteur post_save des ingrédients : remplace l'ancien ingrédient par le nouveau.
+    """
+    avant, apres = getattr(instance, '_ingredient_enregistre', None), _ingredient(instance)
+    if avant == apres:
+        return
+    if avant is not None:
+        _reporter_ingredient(avant, -1)
+    _reporter_ingredient(apres, 1)
+    instance._ingredient_enregistre = apres
+
+
+def reporter_ingredient_supprime(sender, instance, **kwargs):
+    """
+    Récepteur pre_delete des ingrédients : appelé avant que la suppression d'un
+    ouvrage ne détache ses lignes de devis (SET_NULL).
+    """
+    _reporter_ingredient(_ingredient(instance), -1)
+
+
+def connecter_signaux():
+    """
+    Connecte les récepteurs de la prévision (appelé par DevisConfig.ready).
+    """
+    pre_save.connect(memoriser_ingredient, sender=IngredientOuvrage, dispatch_uid='devis.prevision.memoriser')
+    post_save.connect(reporter_ingredient_enregistre, sender=IngredientOuvrage, dispatch_uid='devis.prevision.enregistre')
+    pre_delete.connect(reporter_ingredient_supprime, sender=IngredientOuvrage, dispatch_uid='devis.prevision.supprime')
@@ -0,0 +1,108 @@
+"""
+Quantitatif (métré des fournitures et heures de main d'œuvre) d'un devis.
+
+Les quantités sont calculées en une seule requête groupée : jointure des lignes
+du devis avec les ingrédients de leur ouvrage, somme de quantité de la ligne ×
+quantité de l'ingrédient par élément. Seuls les noms, unités et prix des
+éléments distincts sont lus ensuite, en une requête par nature d'élément ; le
+coût ne dépend donc pas du nombre de lignes.
+"""
+import csv
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import CharField, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.http import HttpResponse
+
+from bibliotheque.models import Fourniture, IngredientOuvrage, MainOeuvre
+
+QUANTITE_TOTALE = ExpressionWrapper(
+    F('quantite') * F('ouvrage__lignes_devis__quantite'),
+    output_field=DecimalField(max_digits=20, decimal_places=5)
+)
+
+UNITE_MAIN_OEUVRE = 'h'
+
+COLONNES_CSV = ('nature', 'element_id', 'nom', 'unite', 'quantite', 'prix_unitaire', 'cout')
+
+
+def calculer_quantitatif(devis, avec_couts=True):
+    """
+    Calcule le quantitatif d'un devis.
+
+    Args:
+        devis: Devis concerné
+        avec_couts: Inclut les prix unitaires et coûts de la bibliothèque
+
+    Returns:
+        Liste d'éléments {'nature', 'element_id', 'nom', 'unite', 'quantite'
+        (et 'prix_unitaire', 'cout')}, fournitures puis main d'œuvre, par nom
+    """
+    sommes = (
+        IngredientOuvrage.objects.filter(ouvrage__lignes_devis__lot__devis=devis)
+        .order_by()
+        .values('element_type_id', 'element_id')
+        .annotate(quantite=Sum(QUANTITE_TOTALE))
+    )
+    return decrire_elements(
+        {(s['element_type_id'], s['element_id']): s['quantite'] for s in sommes},
+        avec_couts=avec_couts
+    )
+
+
+def decrire_elements(quantites, avec_couts=True, categorie=None):
+    """
+    Complète des quantités par élément avec le nom, l'unité et le prix des éléments,
+    en une requête par nature d'élément.
+
+    Args:
+        quantites: Dictionnaire {(element_type_id, element_id): quantité}
+        avec_couts: Inclut les prix unitaires et coûts de la bibliothèque
+        categorie: Ne retient que les éléments de cette catégorie (ID)
+
+    Returns:
+        Liste d'éléments, fournitures puis main d'œuvre, par nom
+    """
+    elements = []
+    for nature, modele, unite, champ_prix in (
+        ('fourniture', Fourniture, F('unite'), 'prix_achat_ht'),
+        ('main_oeuvre', MainOeuvre, Value(UNITE_MAIN_OEUVRE, output_field=CharField()), 'cout_horaire'),
+    ):
+        type_id = ContentType.objects.get_for_model(modele).id
+        ids = [element_id for element_type_id, element_id in quantites if element_type_id == type_id]
+        queryset = modele.objects.filter(id__in=ids)
+        if categorie is not None:
+            queryset = queryset.filter(categorie_id=categorie)
+        for element_id, nom, unite, prix in (
+            queryset
+            .order_by('nom', 'id')
+            .values_list('id', 'nom', unite, champ_prix)
+        ):
+            quantite = quantites[(type_id, element_id)] or Decimal('0')
+            element = {
+                'nature': nature,
+                'element_id': element_id,
+                'nom': nom,
+                'unite': unite,
+                'quantite': round(quantite, 3),
+            }
+            if avec_couts:
+                element['prix_unitaire'] = prix
+                element['cout'] = round(quantite * prix, 2)
+            elements.append(element)
+    return elements
+
+
+def reponse_csv_quantitatif(devis, elements, avec_couts=True):
+    """
+    Retourne le quantitatif au format CSV (séparateur ';'), en pièce jointe.
+    """
+    colonnes = COLONNES_CSV if avec_couts else COLONNES_CSV[:-2]
+    filename = f"quantitatif_{devis.numero}.csv".replace('/', '-').replace(' ', '_')
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    writer = csv.DictWriter(response, fieldnames=colonnes, delimiter=';')
+    writer.writeheader()
+    writer.writerows(elements)
+    return response
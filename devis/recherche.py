@@ -0,0 +1,165 @@
+"""
+Recherche plein texte dans les devis, y compris les descriptions des lignes.
+
+Chaque devis porte un document de recherche (numéro, objet, nom du client, noms
+des lots et descriptions des lignes) dans la colonne document_recherche. Une
+modification de l'un de ces textes marque le document comme périmé
+(document_a_jour=False) ; une fois la transaction validée (transaction.on_commit),
+seuls les documents des devis qu'elle a invalidés sont reconstruits. Les autres
+documents périmés (échec d'une reconstruction, traitements en masse) sont
+reconstruits par la commande rafraichir_recherche_devis. La recherche elle-même
+n'écrit rien.
+
+Sous PostgreSQL, la colonne est indexée par un index GIN sur
+to_tsvector('french', document_recherche) (voir la migration 0006) et les
+résultats sont classés par pertinence (ts_rank). Sur les autres bases, la
+recherche se replie sur des icontains, mot par mot, sur le même document.
+"""
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from rest_framework import filters
+
+from .models import Devis, Lot, LigneDevis
+
+CONFIGURATION = 'french'
+TAILLE_PAQUET = 500
+
+
+def vecteur_recherche():
+    """
+    Expression du vecteur de recherche d'un devis, identique à celle de l'index GIN.
+    """
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('document_recherche', config=CONFIGURATION)
+
+
+def invalider_documents(**filtres):
+    """
+    Marque comme périmés les documents de recherche des devis correspondant aux filtres
+    (par exemple pk=..., lots__pk=..., client=...), et planifie leur reconstruction.
+    Un document déjà périmé ne replanifie rien.
+    """
+    devis_ids = list(Devis.objects.filter(document_a_jour=True, **filtres).values_list('pk', flat=True))
+    if devis_ids:
+        Devis.objects.filter(pk__in=devis_ids).update(document_a_jour=False)
+        planifier_rafraichissement(devis_ids)
+
+
+def planifier_rafraichissement(devis_ids):
+    """
+    Reconstruit les documents périmés des devis indiqués après la validation de
+    la transaction courante (immédiatement hors transaction). Une erreur est
+    journalisée sans faire échouer la modification déjà validée.
+    """
+    devis_ids = list(devis_ids)
+    transaction.on_commit(
+        lambda: rafraichir_documents(Devis.objects.filter(pk__in=devis_ids)), robust=True
+    )
+
+
+def _documents(devis_ids):
+    """
+    Construit le document de recherche de chaque devis indiqué, en trois requêtes.
+    """
+    parties = {
+        devis_id: [numero, objet, client]
+        for devis_id, numero, objet, client in Devis.objects.filter(pk__in=devis_ids)
+        .values_list('id', 'numero', 'objet', 'client__nom')
+    }
+    for devis_id, nom in Lot.objects.filter(devis_id__in=devis_ids).order_by('ordre').values_list('devis_id', 'nom'):
+        parties[devis_id].append(nom)
+    for devis_id, description in (
+        LigneDevis.objects.filter(lot__devis_id__in=devis_ids)
+        .order_by('lot__ordre', 'ordre')
+        .values_list('lot__devis_id', 'description')
+        .iterator(chunk_size=2000)
+    ):
+        parties[devis_id].append(description)
+    return {devis_id: '\n'.join(filter(None, textes)) for devis_id, textes in parties.items()}
+
+
+def rafraichir_documents(devis=None):
+    """
+    Reconstruit les documents de recherche périmés, par paquets de TAILLE_PAQUET devis.
+
+    Args:
+        devis: Queryset de devis à considérer (tous par défaut)
+
+    Returns:
+        Nombre de documents reconstruits
+    """
+    perimes = (devis if devis is not None else Devis.objects.all()).filter(document_a_jour=False)
+    nombre = 0
+
+    while True:
+        with transaction.atomic():
+            # Les devis du paquet sont verrouillés : une modification concurrente
+            # attend la fin du paquet et invalide à nouveau le document
+            paquet = list(
+                perimes.select_for_update().order_by().values_list('pk', flat=True)[:TAILLE_PAQUET]
+            )
+            if not paquet:
+                return nombre
+            Devis.objects.bulk_update(
+                [
+                    Devis(pk=devis_id, document_recherche=document, document_a_jour=True)
+                    for devis_id, document in _documents(paquet).items()
+                ],
+                ['document_recherche', 'document_a_jour']
+            )
+        nombre += len(paquet)
+
+
+def rechercher(queryset, texte, par_pertinence=True):
+    """
+    Filtre un queryset de devis sur un texte, sans écriture : les documents sont
+    reconstruits à l'enregistrement (voir invalider_documents).
+
+    Args:
+        queryset: Devis parmi lesquels chercher
+        texte: Texte recherché (syntaxe websearch sous PostgreSQL : "mots exacts", -exclu, or)
+        par_pertinence: Trie les résultats par pertinence décroissante (PostgreSQL)
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        requete = SearchQuery(texte, config=CONFIGURATION, search_type='websearch')
+        queryset = queryset.alias(vecteur=vecteur_recherche()).filter(vecteur=requete)
+        if par_pertinence:
+            queryset = queryset.annotate(pertinence=SearchRank(vecteur_recherche(), requete))
+            queryset = queryset.order_by('-pertinence', *(queryset.query.order_by or Devis._meta.ordering))
+        return queryset
+
+    for mot in texte.split():
+        queryset = queryset.filter(document_recherche__icontains=mot)
+    return queryset
+
+
+class RechercheDevisFilter(filters.SearchFilter):
+    """
+    Filtre ?search= des devis par recherche plein texte (voir rechercher).
+    Placé après OrderingFilter : sans ?ordering= explicite, les résultats sont
+    triés par pertinence.
+    """
+    def filter_queryset(self, request, queryset, view):
+        texte = request.query_params.get(self.search_param, '').strip()
+        if not texte:
+            return queryset
+        return rechercher(queryset, texte, par_pertinence='ordering' not in request.query_params)
+
+
+def invalider_documents_client(sender, instance, created, **kwargs):
+    """
+    Récepteur post_save des tiers : le nom du client fait partie du document.
+    """
+    update_fields = kwargs.get('update_fields')
+    if not created and (update_fields is None or 'nom' in update_fields):
+        invalider_documents(client=instance)
+
+
+def connecter_signaux():
+    """
+    Connecte les récepteurs de la recherche (appelé par DevisConfig.ready).
+    """
+    from tiers.models import Tiers
+    post_save.connect(invalider_documents_client, sender=Tiers, dispatch_uid='devis.recherche.client')
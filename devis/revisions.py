@@ -0,0 +1,130 @@
+"""
+Révisions figées des devis.
+
+Une révision contient l'arbre complet du devis (en-tête, lots, lignes et
+totaux), au format du détail JSON (voir devis/flux.py), compressé par zlib au
+fil de l'eau. Elle est capturée automatiquement lorsque le devis passe au statut
+envoyé, ou à la demande, et n'est jamais modifiée ensuite.
+
+Les totaux, le statut et le nombre de lignes sont aussi stockés en colonnes :
+la liste des révisions ne décompresse rien, et la lecture d'une révision est la
+lecture d'une seule ligne de RevisionDevis, sans jointure ni accès aux tables
+vivantes des devis, lots et lignes.
+"""
+import json
+import zlib
+
+from django.db import transaction
+from django.db.models import Max
+
+from .flux import fragments_devis
+from .models import Devis, LigneDevis, RevisionDevis
+from .serializers import CHAMPS_COUTS
+
+NIVEAU_COMPRESSION = 9
+STATUT_ENVOI = 'envoyé'
+
+
+def capturer_revision(devis, motif='manuel', auteur=None):
+    """
+    Capture une nouvelle révision d'un devis.
+
+    Le devis est verrouillé le temps de la capture : les révisions sont numérotées
+    sans trou et reflètent un état cohérent des lignes et des totaux.
+    """
+    with transaction.atomic():
+        devis = Devis.objects.select_for_update().get(pk=devis.pk)
+
+        compresseur = zlib.compressobj(NIVEAU_COMPRESSION)
+        morceaux, taille = [], 0
+        for fragment in fragments_devis(devis, {}):
+            octets = fragment.encode('utf-8')
+            taille += len(octets)
+            morceaux.append(compresseur.compress(octets))
+        morceaux.append(compresseur.flush())
+
+        dernier = devis.revisions.aggregate(numero=Max('numero'))['numero'] or 0
+        return RevisionDevis.objects.create(
+            devis=devis,
+            numero=dernier + 1,
+            motif=motif,
+            auteur=auteur,
+            statut=devis.statut,
+            total_ht=devis.total_ht,
+            total_debourse=devis.total_debourse,
+            nombre_lignes=LigneDevis.objects.filter(lot__devis=devis).count(),
+            taille=taille,
+            donnees=b''.join(morceaux),
+        )
+
+
+def _sans_couts(donnees):
+    """
+    Retire récursivement les champs de coûts et de marges d'un détail JSON.
+    """
+    if isinstance(donnees, dict):
+        return {cle: _sans_couts(valeur) for cle, valeur in donnees.items() if cle not in CHAMPS_COUTS}
+    if isinstance(donnees, list):
+        return [_sans_couts(valeur) for valeur in donnees]
+    return donnees
+
+
+def lire_revision(devis_id, numero, avec_couts=True):
+    """
+    Retourne le détail JSON d'une révision (une seule ligne lue), ou None si
+    elle n'existe pas.
+    """
+    donnees = (
+        RevisionDevis.objects.filter(devis_id=devis_id, numero=numero)
+        .values_list('donnees', flat=True)
+        .first()
+    )
+    if donnees is None:
+        return None
+    detail = json.loads(zlib.decompress(bytes(donnees)))
+    return detail if avec_couts else _sans_couts(detail)
+
+
+def _differences(avant, apres, ignores=()):
+    """
+    Retourne les champs modifiés entre deux dictionnaires : {champ: {'avant', 'apres'}}.
+    """
+    return {
+        champ: {'avant': avant.get(champ), 'apres': apres.get(champ)}
+        for champ in sorted(set(avant) | set(apres))
+        if champ not in ignores and avant.get(champ) != apres.get(champ)
+    }
+
+
+def _comparer_elements(avant, apres, ignores=()):
+    """
+    Compare deux listes d'éléments (lots ou lignes) identifiés par leur ID.
+    """
+    avant = {element['id']: element for element in avant}
+    apres = {element['id']: element for element in apres}
+    modifies = []
+    for element_id in avant.keys() & apres.keys():
+        changements = _differences(avant[element_id], apres[element_id], ignores)
+        if changements:
+            modifies.append({'id': element_id, 'changements': changements})
+    return {
+        'ajoutes': [apres[element_id] for element_id in apres.keys() - avant.keys()],
+        'supprimes': [avant[element_id] for element_id in avant.keys() - apres.keys()],
+        'modifies': sorted(modifies, key=lambda element: element['id']),
+    }
+
+
+def comparer_revisions(avant, apres):
+    """
+    Compare deux détails JSON de révisions d'un même devis : champs de l'en-tête,
+    lots et lignes ajoutés, supprimés ou modifiés (identifiés par leur ID).
+    """
+    lots_avant, lots_apres = avant.get('lots', []), apres.get('lots', [])
+    return {
+        'devis': _differences(avant, apres, ignores=('lots',)),
+        'lots': _comparer_elements(lots_avant, lots_apres, ignores=('lignes',)),
+        'lignes': _comparer_elements(
+            [ligne for lot in lots_avant for ligne in lot.get('lignes', [])],
+            [ligne for lot in lots_apres for ligne in lot.get('lignes', [])],
+        ),
+    }
@@ -1,8 +1,24 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import Devis, Lot, LigneDevis
-from tiers.serializers import TiersDetailSerializer as TiersSerializer
+from .models import Devis, Lot, LigneDevis, ModeleDevis, ModeleLigne, ModeleLot, RevisionDevis, TransitionStatutDevis
+from tiers.models import Tiers
+from tiers.serializers import TiersDetailSerializer as TiersSerializer, AdresseSerializer, ContactSerializer
 from bibliotheque.serializers import OuvrageSerializer
 
+def expansion_demandee(request, champ):
+    """
+    Indique si la requête demande la version complète d'un champ imbriqué
+    (paramètre ?expand=client,...).
+    """
+    if request is None:
+        return False
+    return champ in request.query_params.get('expand', '').split(',')
+
+# Champs réservés aux utilisateurs autorisés à voir les coûts et marges
+CHAMPS_COUTS = ['debourse', 'total_debourse', 'marge', 'marge_totale', 'marge_globale']
+
 class RoleBasedSerializerMixin:
     """
     Mixin pour filtrer les champs selon le rôle de l'utilisateur.
@@ -14,10 +30,8 @@ class RoleBasedSerializerMixin:
         
         # Filtrer les champs si l'utilisateur n'a pas le rôle approprié
         if request and not self.user_can_view_costs(request.user):
-            cost_fields = ['debourse', 'total_debourse', 'marge', 'marge_totale', 'marge_globale']
-            
             # Supprimer les champs liés aux coûts
-            for field in cost_fields:
+            for field in CHAMPS_COUTS:
                 if field in self.fields:
                     self.fields.pop(field)
     
@@ -77,6 +91,25 @@ class LigneDevisCreateSerializer(serializers.ModelSerializer):
         
         return data
 
+class LigneDevisBulkSerializer(LigneDevisCreateSerializer):
+    """
+    Sérialiseur pour l'insertion en masse de lignes de devis.
+    Le lot et l'ouvrage sont validés contre les ensembles préchargés fournis
+    dans le contexte ('lots' et 'ouvrages'), sans requête par ligne.
+    """
+    lot = serializers.IntegerField()
+    ouvrage = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_lot(self, value):
+        if value not in self.context['lots']:
+            raise serializers.ValidationError(f"Le lot avec l'ID {value} n'appartient pas à ce devis.")
+        return value
+
+    def validate_ouvrage(self, value):
+        if value is not None and value not in self.context['ouvrages']:
+            raise serializers.ValidationError(f"L'ouvrage avec l'ID {value} n'existe pas.")
+        return value
+
 class LigneDevisDetailSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
     """
     Sérialiseur détaillé pour le modèle LigneDevis.
@@ -109,6 +142,15 @@ class LotSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
             'total_ht', 'total_debourse', 'marge'
         ]
 
+class LotOperationSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur des données d'un lot ajouté ou modifié par un lot d'opérations
+    (le devis et l'ordre sont fixés par l'opération elle-même).
+    """
+    class Meta:
+        model = Lot
+        fields = ['nom', 'description']
+
 class LotDetailSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
     """
     Sérialiseur détaillé pour le modèle Lot, incluant ses lignes.
@@ -142,17 +184,59 @@ class DevisSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
             'marge_globale', 'total_ht', 'total_debourse', 'marge_totale'
         ]
     
+    def validate_numero(self, value):
+        """
+        Un numéro modifié ne peut pas suivre le format de la numérotation automatique.
+        """
+        from .numerotation import numero_reserve
+        
+        if (self.instance is None or value != self.instance.numero) and numero_reserve(value):
+            raise serializers.ValidationError(
+                "Ce format de numéro est réservé à la numérotation automatique"
+            )
+        return value
+    
     def get_client_nom(self, obj):
         """
         Récupère le nom du client.
         """
         return obj.client.nom if obj.client else None
 
+class ClientDevisSerializer(serializers.ModelSerializer):
+    """
+    Représentation compacte du client d'un devis : identité, adresse de facturation
+    et contact principal devis. Utilise les adresses et contacts préchargés avec
+    l'arbre du devis (voir arbre.prefetch_arbre).
+    """
+    adresse_facturation = serializers.SerializerMethodField()
+    contact_devis = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Tiers
+        fields = ['id', 'nom', 'siret', 'tva', 'adresse_facturation', 'contact_devis']
+    
+    def get_adresse_facturation(self, obj):
+        """
+        Retourne l'adresse de facturation, ou à défaut la première adresse du client.
+        """
+        adresses = list(obj.adresses.all())
+        adresse = next((a for a in adresses if a.facturation), adresses[0] if adresses else None)
+        return AdresseSerializer(adresse).data if adresse else None
+    
+    def get_contact_devis(self, obj):
+        """
+        Retourne le contact principal pour les devis, s'il existe.
+        """
+        contact = next((c for c in obj.contacts.all() if c.contact_principal_devis), None)
+        return ContactSerializer(contact).data if contact else None
+
 class DevisDetailSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
     """
     Sérialiseur détaillé pour le modèle Devis, incluant ses lots et lignes.
+    Le client est résumé (ClientDevisSerializer) ; sa vue complète, avec son
+    historique d'activités, est fournie avec ?expand=client.
     """
-    client_details = TiersSerializer(source='client', read_only=True)
+    client_details = ClientDevisSerializer(source='client', read_only=True)
     lots = LotDetailSerializer(many=True, read_only=True)
     total_ht = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
     total_debourse = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
@@ -165,11 +249,219 @@ class DevisDetailSerializer(RoleBasedSerializerMixin, serializers.ModelSerialize
             'date_creation', 'date_validite', 'commentaire', 'conditions_paiement', 
             'marge_globale', 'lots', 'total_ht', 'total_debourse', 'marge_totale'
         ]
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expansion_demandee(self.context.get('request'), 'client'):
+            self.fields['client_details'] = TiersSerializer(source='client', read_only=True)
+
+class ApplicationMargeSerializer(serializers.Serializer):
+    """
+    Sérialiseur des paramètres d'application des marges à un devis.
+    """
+    marge = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False, allow_null=True, max_value=Decimal('99.99')
+    )
+    lots = serializers.DictField(
+        child=serializers.DecimalField(max_digits=5, decimal_places=2, max_value=Decimal('99.99')),
+        required=False
+    )
+    dry_run = serializers.BooleanField(default=False)
+
+class ScenarioSerializer(serializers.Serializer):
+    """
+    Sérialiseur d'un scénario de simulation de prix (voir devis/simulation.py).
+    """
+    nom = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    main_oeuvre = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('-100'), required=False)
+    fournitures = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('-100'), required=False)
+    categories = serializers.DictField(
+        child=serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('-100')),
+        required=False
+    )
+    marge = serializers.DecimalField(
+        max_digits=5, decimal_places=2, max_value=Decimal('99.99'), required=False, allow_null=True
+    )
+    
+    def validate_categories(self, value):
+        """
+        Convertit les IDs de catégories reçus en clés de dictionnaire en entiers.
+        """
+        try:
+            return {int(categorie_id): variation for categorie_id, variation in value.items()}
+        except ValueError:
+            raise serializers.ValidationError("Les clés doivent être des IDs de catégories")
+
+class SimulationSerializer(serializers.Serializer):
+    """
+    Sérialiseur des paramètres d'une simulation de prix.
+    """
+    scenarios = serializers.ListField(child=ScenarioSerializer(), min_length=1, max_length=200)
+
+class CalculsGroupesSerializer(serializers.Serializer):
+    """
+    Sérialiseur des paramètres des calculs de plusieurs devis.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+
+class RevisionDevisSerializer(RoleBasedSerializerMixin, serializers.ModelSerializer):
+    """
+    Sérialiseur des informations d'une révision de devis, sans son contenu.
+    """
+    total_ht = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
+    total_debourse = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
+    
+    class Meta:
+        model = RevisionDevis
+        fields = [
+            'numero', 'motif', 'auteur', 'date_creation', 'statut',
+            'total_ht', 'total_debourse', 'nombre_lignes', 'taille'
+        ]
+        read_only_fields = fields
+
+class TransitionStatutDevisSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur d'une transition du journal des statuts d'un devis.
+    """
+    class Meta:
+        model = TransitionStatutDevis
+        fields = ['id', 'ancien_statut', 'nouveau_statut', 'date', 'auteur', 'duree_statut', 'duree_cycle']
+        read_only_fields = fields
+
+class ModeleLigneSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur d'une ligne de modèle de devis.
+    """
+    class Meta:
+        model = ModeleLigne
+        fields = [
+            'id', 'type', 'ouvrage', 'description', 'quantite', 'parametre',
+            'unite', 'prix_unitaire', 'debourse', 'ordre'
+        ]
+
+class ModeleLotSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur d'un lot de modèle de devis, incluant ses lignes.
+    """
+    lignes = ModeleLigneSerializer(many=True, required=False)
+    
+    class Meta:
+        model = ModeleLot
+        fields = ['id', 'nom', 'description', 'ordre', 'lignes']
+
+class ModeleDevisSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur d'un modèle de devis.
+    """
+    nombre_lots = serializers.IntegerField(read_only=True)
+    nombre_lignes = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ModeleDevis
+        fields = ['id', 'nom', 'description', 'parametres', 'date_creation', 'nombre_lots', 'nombre_lignes']
+
+class ModeleDevisDetailSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur détaillé d'un modèle de devis. Les lots et leurs lignes sont
+    créés en masse ; s'ils sont fournis à la mise à jour, ils remplacent
+    intégralement la structure existante.
+    """
+    lots = ModeleLotSerializer(many=True, required=False)
+    
+    class Meta:
+        model = ModeleDevis
+        fields = ['id', 'nom', 'description', 'parametres', 'date_creation', 'lots']
+    
+    def validate_parametres(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Les paramètres doivent être un objet {nom: valeur par défaut}")
+        for nom, defaut in value.items():
+            if defaut is not None and not isinstance(defaut, (int, float)):
+                raise serializers.ValidationError(f"La valeur par défaut de {nom} doit être un nombre ou null")
+        return value
+    
+    def validate(self, data):
+        """
+        Vérifie que les paramètres des lignes sont définis par le modèle.
+        """
+        parametres = data.get('parametres', self.instance.parametres if self.instance else {})
+        lots = data.get('lots', [])
+        inconnus = {
+            ligne['parametre']
+            for lot in lots for ligne in lot.get('lignes', [])
+            if ligne.get('parametre') and ligne['parametre'] not in parametres
+        }
+        if inconnus:
+            raise serializers.ValidationError(
+                {"lots": [f"Paramètres non définis par le modèle : {', '.join(sorted(inconnus))}"]}
+            )
+        return data
+    
+    def _creer_lots(self, modele, lots):
+        """
+        Crée les lots et les lignes d'un modèle en deux insertions. Le nom et l'unité
+        de l'ouvrage sont recopiés dans les lignes qui n'en fournissent pas, pour
+        qu'elles restent instanciables si l'ouvrage est supprimé.
+        """
+        lots_crees = ModeleLot.objects.bulk_create([
+            ModeleLot(modele=modele, **{cle: valeur for cle, valeur in lot.items() if cle != 'lignes'})
+            for lot in lots
+        ])
+        lignes = []
+        for lot_cree, lot in zip(lots_crees, lots):
+            for ligne in lot.get('lignes', []):
+                ouvrage = ligne.get('ouvrage')
+                if ouvrage is not None:
+                    ligne = {**ligne, 'description': ligne.get('description') or ouvrage.nom,
+                             'unite': ligne.get('unite') or ouvrage.unite}
+                lignes.append(ModeleLigne(lot=lot_cree, **ligne))
+        ModeleLigne.objects.bulk_create(lignes, batch_size=500)
+    
+    def create(self, validated_data):
+        lots = validated_data.pop('lots', [])
+        with transaction.atomic():
+            modele = ModeleDevis.objects.create(**validated_data)
+            self._creer_lots(modele, lots)
+        return modele
+    
+    def update(self, instance, validated_data):
+        lots = validated_data.pop('lots', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if lots is not None:
+                instance.lots.all().delete()
+                self._creer_lots(instance, lots)
+        return instance
+
+class InstanciationModeleSerializer(serializers.Serializer):
+    """
+    Sérialiseur des paramètres d'instanciation d'un modèle dans un devis.
+    """
+    modele = serializers.PrimaryKeyRelatedField(queryset=ModeleDevis.objects.all())
+    parametres = serializers.DictField(
+        child=serializers.DecimalField(max_digits=12, decimal_places=3), required=False
+    )
+
+class ModeleDepuisDevisSerializer(serializers.Serializer):
+    """
+    Sérialiseur des paramètres de création d'un modèle à partir d'un devis.
+    """
+    nom = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    
+    def validate_nom(self, value):
+        if ModeleDevis.objects.filter(nom=value).exists():
+            raise serializers.ValidationError("Un modèle de devis porte déjà ce nom.")
+        return value
 
 class DevisCreateSerializer(serializers.ModelSerializer):
     """
     Sérialiseur pour la création d'un devis.
+    Sans numéro fourni, le prochain numéro est attribué par le serveur
+    (voir numerotation.attribuer_numero).
     """
+    numero = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    
     class Meta:
         model = Devis
         fields = [
@@ -181,7 +473,34 @@ class DevisCreateSerializer(serializers.ModelSerializer):
         """
         Validation du numéro de devis.
         """
+        from .numerotation import numero_reserve
+        
+        # Les numéros au format automatique sont réservés à la numérotation du serveur
+        if value and numero_reserve(value):
+            raise serializers.ValidationError(
+                "Ce format de numéro est réservé à la numérotation automatique"
+            )
         # Vérifie que le numéro est unique
-        if Devis.objects.filter(numero=value).exists():
+        if value and Devis.objects.filter(numero=value).exists():
             raise serializers.ValidationError("Ce numéro de devis existe déjà")
-        return value 
\ No newline at end of file
+        return value
+    
+    def create(self, validated_data):
+        """
+        Crée le devis, en lui attribuant un numéro dans la même transaction si besoin.
+        """
+        from .numerotation import attribuer_numero, entreprise_utilisateur
+        
+        try:
+            with transaction.atomic():
+                if not validated_data.get('numero'):
+                    request = self.context.get('request')
+                    validated_data['numero'] = attribuer_numero(
+                        entreprise_utilisateur(request.user) if request else ''
+                    )
+                return super().create(validated_data)
+        except IntegrityError:
+            # Numéro saisi entre-temps par une création concurrente
+            if Devis.objects.filter(numero=validated_data['numero']).exists():
+                raise serializers.ValidationError({'numero': ["Ce numéro de devis existe déjà"]})
+            raise
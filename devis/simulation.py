@@ -0,0 +1,115 @@
+"""
+Simulation de scénarios de prix sur un devis, sans aucune écriture.
+
+Le déboursé d'un devis est une combinaison linéaire des prix de la
+bibliothèque : les lignes sont donc réduites une seule fois, en deux
+agrégations SQL, à une base de quelques postes de coût (nature d'élément et
+catégorie, plus un poste 'autre' pour les lignes manuelles). Chaque scénario
+n'est ensuite qu'un produit scalaire entre cette base et ses coefficients :
+le coût d'évaluation ne dépend plus du nombre de lignes.
+
+Le déboursé stocké de chaque ligne 'ouvrage' est réparti entre les postes au
+prorata de la composition actuelle de l'ouvrage, si bien que le scénario
+neutre redonne exactement les totaux du devis.
+
+Format d'un scénario (toutes les clés sont facultatives) :
+    {"nom": "Main d'œuvre +5 %",
+     "main_oeuvre": 5,              variation en % des coûts horaires
+     "fournitures": 3,              variation en % des prix de toutes les fournitures
+     "categories": {"12": 12},      variation en % des éléments d'une catégorie
+     "marge": 25}                   marge globale en % appliquée à toutes les lignes
+"""
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .arbre import calculer_marge
+from .models import LigneDevis
+from .tarification import composition_ouvrages
+from .totaux import MONTANT_DEBOURSE, MONTANT_HT
+
+POSTE_AUTRE = ('autre', None)
+CENT = Decimal('100')
+
+
+class BaseSimulation:
+    """
+    Décomposition du déboursé d'un devis par poste de coût.
+    """
+    def __init__(self, devis):
+        sommes = list(
+            LigneDevis.objects.filter(lot__devis=devis)
+            .order_by()
+            .values('ouvrage_id')
+            .annotate(total_ht=Sum(MONTANT_HT), total_debourse=Sum(MONTANT_DEBOURSE))
+        )
+        compositions = composition_ouvrages(s['ouvrage_id'] for s in sommes if s['ouvrage_id'])
+
+        self.total_ht = Decimal('0')
+        self.total_debourse = Decimal('0')
+        self.postes = {}
+        for somme in sommes:
+            total_ht = somme['total_ht'] or Decimal('0')
+            total_debourse = somme['total_debourse'] or Decimal('0')
+            self.total_ht += total_ht
+            self.total_debourse += total_debourse
+
+            composition = compositions.get(somme['ouvrage_id']) or {}
+            cout_ouvrage = sum(composition.values(), Decimal('0'))
+            if not cout_ouvrage:
+                composition, cout_ouvrage = {POSTE_AUTRE: Decimal('1')}, Decimal('1')
+            for poste, cout in composition.items():
+                self.postes[poste] = self.postes.get(poste, Decimal('0')) + total_debourse * cout / cout_ouvrage
+
+    def coefficient(self, poste, scenario):
+        """
+        Retourne le coefficient appliqué à un poste de coût par un scénario.
+        """
+        nature, categorie_id = poste
+        coefficient = Decimal('1')
+        if nature == 'main_oeuvre':
+            coefficient *= 1 + scenario.get('main_oeuvre', 0) / CENT
+        elif nature == 'fourniture':
+            coefficient *= 1 + scenario.get('fournitures', 0) / CENT
+        if nature != 'autre' and categorie_id is not None:
+            coefficient *= 1 + scenario.get('categories', {}).get(categorie_id, 0) / CENT
+        return coefficient
+
+    def evaluer(self, scenario):
+        """
+        Évalue un scénario et retourne ses totaux et leur écart aux totaux actuels.
+        Avec une marge, les prix de vente sont déduits des déboursés simulés (sans
+        l'arrondi au centime propre à chaque ligne) ; sinon ils sont inchangés.
+        """
+        total_debourse = sum(
+            (montant * self.coefficient(poste, scenario) for poste, montant in self.postes.items()),
+            Decimal('0')
+        )
+        if scenario.get('marge') is not None:
+            total_ht = total_debourse / (1 - scenario['marge'] / CENT)
+        else:
+            total_ht = self.total_ht
+
+        return {
+            'nom': scenario.get('nom', ''),
+            'total_ht': round(total_ht, 2),
+            'total_debourse': round(total_debourse, 2),
+            'marge': round(calculer_marge(total_ht, total_debourse), 2),
+            'ecart_ht': round(total_ht - self.total_ht, 2),
+            'ecart_debourse': round(total_debourse - self.total_debourse, 2),
+        }
+
+
+def simuler(devis, scenarios):
+    """
+    Évalue une liste de scénarios sur un devis.
+
+    Returns:
+        Dictionnaire avec les totaux actuels ('reference') et le tableau des totaux
+        de chaque scénario, dans l'ordre reçu
+    """
+    base = BaseSimulation(devis)
+    return {
+        'reference': base.evaluer({'nom': 'Actuel'}),
+        'scenarios': [base.evaluer(scenario) for scenario in scenarios],
+    }
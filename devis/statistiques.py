@@ -0,0 +1,136 @@
+"""
+Statistiques des devis calculées par requêtes groupées et conservées en instantanés.
+
+Les statistiques s'appuient sur les totaux stockés des devis (voir devis/totaux.py) :
+une requête groupée par statut et une requête groupée par mois de création.
+Le résultat est conservé dans StatistiquesDevis. La création d'un devis, un
+changement de statut ou de client et toute variation des totaux invalident
+l'instantané global et celui du client, qui est recalculé à la lecture suivante.
+
+L'invalidation incrémente la génération de l'instantané, après la validation de
+la transaction qui l'a provoquée (le verrou de la ligne de l'instantané global
+n'est ainsi pas tenu pendant les transactions d'écriture) ; un recalcul n'est
+enregistré que si la génération n'a pas changé pendant son calcul.
+"""
+from django.db import transaction
+from django.db.models import Avg, Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Devis, StatistiquesDevis
+
+CLE_GLOBALE = 'global'
+
+MARGE_DEVIS = Case(
+    When(total_ht=0, then=Value(0)),
+    default=ExpressionWrapper(
+        (F('total_ht') - F('total_debourse')) * 100 / F('total_ht'),
+        output_field=DecimalField(max_digits=16, decimal_places=4)
+    ),
+    output_field=DecimalField(max_digits=16, decimal_places=4)
+)
+
+
+def _nombre(valeur):
+    """
+    Convertit un agrégat (Decimal ou None) en nombre JSON arrondi à 2 décimales.
+    """
+    return round(float(valeur or 0), 2)
+
+
+def _agregats(queryset):
+    """
+    Agrégats communs à chaque groupe : nombre de devis, montants et marge moyenne.
+    """
+    return queryset.annotate(
+        nombre=Count('id'),
+        montant_ht=Sum('total_ht'),
+        debourse=Sum('total_debourse'),
+        marge_moyenne=Avg(MARGE_DEVIS)
+    )
+
+
+def _groupe(ligne):
+    return {
+        "nombre": ligne['nombre'],
+        "montant_ht": _nombre(ligne['montant_ht']),
+        "debourse": _nombre(ligne['debourse']),
+        "marge_moyenne": _nombre(ligne['marge_moyenne']),
+    }
+
+
+def calculer_statistiques(client_id=None):
+    """
+    Calcule les statistiques des devis, éventuellement pour un seul client.
+
+    Deux requêtes : une groupée par statut, une groupée par mois de création.
+    """
+    devis = Devis.objects.order_by()
+    if client_id is not None:
+        devis = devis.filter(client_id=client_id)
+
+    par_statut = {statut: _groupe({'nombre': 0, 'montant_ht': 0, 'debourse': 0, 'marge_moyenne': 0})
+                  for statut, _ in Devis.STATUT_CHOICES}
+    for ligne in _agregats(devis.values('statut')):
+        par_statut[ligne['statut']] = _groupe(ligne)
+
+    serie_mensuelle = [
+        {"mois": ligne['mois'].strftime('%Y-%m'), **_groupe(ligne)}
+        for ligne in _agregats(devis.annotate(mois=TruncMonth('date_creation')).values('mois')).order_by('mois')
+    ]
+
+    total_devis = sum(groupe['nombre'] for groupe in par_statut.values())
+    marge_moyenne = 0
+    if total_devis:
+        marge_moyenne = round(
+            sum(groupe['marge_moyenne'] * groupe['nombre'] for groupe in par_statut.values()) / total_devis, 2
+        )
+
+    return {
+        "total_devis": total_devis,
+        "devis_par_statut": {statut: groupe['nombre'] for statut, groupe in par_statut.items()},
+        "montant_total_ht": round(sum(groupe['montant_ht'] for groupe in par_statut.values()), 2),
+        "debourse_total": round(sum(groupe['debourse'] for groupe in par_statut.values()), 2),
+        "marge_moyenne": marge_moyenne,
+        "marges_par_statut": {statut: groupe['marge_moyenne'] for statut, groupe in par_statut.items()},
+        "par_statut": par_statut,
+        "serie_mensuelle": serie_mensuelle,
+    }
+
+
+def obtenir_statistiques(client_id=None):
+    """
+    Retourne les statistiques depuis l'instantané, en le recalculant s'il est
+    absent ou périmé.
+    """
+    cle = f"client:{client_id}" if client_id is not None else CLE_GLOBALE
+    # L'instantané est créé périmé avant le calcul, pour qu'une invalidation
+    # pendant le calcul puisse l'atteindre
+    instantane, _ = StatistiquesDevis.objects.get_or_create(
+        cle=cle, defaults={'client_id': client_id, 'a_jour': False}
+    )
+    if instantane.a_jour:
+        return instantane.donnees
+
+    donnees = calculer_statistiques(client_id)
+    StatistiquesDevis.objects.filter(pk=instantane.pk, generation=instantane.generation).update(
+        donnees=donnees, a_jour=True, date_calcul=timezone.now()
+    )
+    return donnees
+
+
+def invalider_statistiques(clients=None):
+    """
+    Marque comme périmés l'instantané global et ceux des clients indiqués, une
+    fois la transaction courante validée (immédiatement hors transaction).
+
+    Args:
+        clients: IDs de clients (liste ou queryset de valeurs client_id, lu
+                 immédiatement), ou None pour tous les instantanés
+    """
+    instantanes = StatistiquesDevis.objects.all()
+    if clients is not None:
+        instantanes = instantanes.filter(Q(client__isnull=True) | Q(client__in=set(clients)))
+    transaction.on_commit(
+        lambda: instantanes.update(a_jour=False, generation=F('generation') + 1), robust=True
+    )
@@ -0,0 +1,211 @@
+"""
+Répercussion des écritures de devis, de lots et de lignes sur les données dérivées.
+
+Les méthodes save et delete de Devis, Lot et LigneDevis enregistrent l'objet puis
+appellent ces fonctions dans la même transaction, avec l'état de l'objet tel
+qu'il est en base (champs suivis, voir EtatEnregistreMixin dans devis/models.py) :
+totaux stockés (devis/totaux.py), statistiques (devis/statistiques.py),
+historique des prix (devis/historique_prix.py), prévision d'achats
+(devis/prevision.py), journal des statuts (devis/entonnoir.py), révisions
+(devis/revisions.py) et documents de recherche (devis/recherche.py).
+
+Chaque répercussion n'est appliquée que si l'un des champs dont elle dépend a
+changé : modifier le commentaire d'un devis ou l'ordre d'une ligne ne coûte que
+l'UPDATE de l'objet.
+"""
+from collections import Counter
+from datetime import date
+
+from .entonnoir import enregistrer_transition, retirer_transitions
+from .historique_prix import STATUTS_HISTORIQUE, devis_historises, invalider_historique_prix, ouvrages_des_devis
+from .models import Lot
+from .prevision import (
+    STATUT_PREVISION, ajuster_prevision, ajuster_prevision_devis, mois_prevision,
+    prevision_lignes_devis, variations_lignes,
+)
+from .recherche import invalider_documents, planifier_rafraichissement
+from .revisions import STATUT_ENVOI, capturer_revision
+from .statistiques import invalider_statistiques
+from .totaux import appliquer_delta_devis, reporter_variation_ligne
+
+# Champs d'un devis repris dans son document de recherche
+CHAMPS_DOCUMENT = ('numero', 'objet', 'client_id')
+
+
+def modifie(avant, instance, *champs):
+    """
+    Indique si l'un des champs diffère de l'état enregistré (toujours vrai pour
+    un objet pas encore enregistré).
+    """
+    return avant is None or any(avant[champ] != getattr(instance, champ) for champ in champs)
+
+
+def _mois(statut, date_validite, date_acceptation):
+    """
+    Retourne le mois de prévision d'un devis, ou None s'il n'est pas accepté.
+    """
+    return mois_prevision(date_validite, date_acceptation) if statut == STATUT_PREVISION else None
+
+
+def preparer_devis(devis, avant):
+    """
+    Complète un devis avant son enregistrement : date d'acceptation lors du
+    passage au statut accepté, document de recherche périmé lorsque le numéro,
+    l'objet ou le client change.
+
+    Returns:
+        Ensemble des champs modifiés, à ajouter aux update_fields
+    """
+    champs = set()
+    if devis.statut == STATUT_PREVISION and (modifie(avant, devis, 'statut') or not devis.date_acceptation):
+        devis.date_acceptation = date.today()
+        champs.add('date_acceptation')
+    if modifie(avant, devis, *CHAMPS_DOCUMENT):
+        devis.document_a_jour = False
+        champs.add('document_a_jour')
+    return champs
+
+
+def devis_enregistre(devis, avant, auteur=None):
+    """
+    Répercute l'enregistrement d'un devis : journal et statistiques lors d'une
+    création ou d'un changement de statut ou de client, historique des prix
+    lorsque le devis entre dans les statuts historisés ou en sort, prévision
+    d'achats lorsque son mois change, révision lors de l'envoi au client,
+    document de recherche lorsque l'un de ses textes change.
+    """
+    if modifie(avant, devis, *CHAMPS_DOCUMENT):
+        planifier_rafraichissement([devis.pk])
+    if avant is None:
+        enregistrer_transition(devis, None, auteur=auteur)
+        invalider_statistiques([devis.client_id])
+        return
+
+    statut_modifie = avant['statut'] != devis.statut
+    if statut_modifie:
+        enregistrer_transition(devis, avant['statut'], auteur=auteur)
+    # Les statistiques ne dépendent que du client, du statut, de la date
+    # de création et des totaux (invalidées par devis/totaux.py)
+    if statut_modifie or avant['client_id'] != devis.client_id:
+        invalider_statistiques({avant['client_id'], devis.client_id})
+
+    if statut_modifie and {avant['statut'], devis.statut} & set(STATUTS_HISTORIQUE):
+        invalider_historique_prix(ouvrages_des_devis([devis.pk]))
+
+    # Entrée, sortie ou changement de mois dans la prévision d'achats
+    mois_avant = _mois(avant['statut'], avant['date_validite'], avant['date_acceptation'])
+    mois_apres = _mois(devis.statut, devis.date_validite, devis.date_acceptation)
+    if mois_avant != mois_apres:
+        variations = prevision_lignes_devis(devis.pk)
+        ajuster_prevision(mois_avant, {ouvrage_id: -q for ouvrage_id, q in variations.items()})
+        ajuster_prevision(mois_apres, variations)
+
+    # L'envoi au client fige une révision du devis
+    if statut_modifie and devis.statut == STATUT_ENVOI:
+        capturer_revision(devis, motif='envoi')
+
+
+def suppression_devis(devis, avant):
+    """
+    Retire un devis des données dérivées, avant sa suppression : ses lots et
+    ses lignes sont supprimés en cascade, sans passer par Lot.delete ni
+    LigneDevis.delete.
+    """
+    if avant is not None and avant['statut'] in STATUTS_HISTORIQUE:
+        invalider_historique_prix(ouvrages_des_devis([devis.pk]))
+    if avant is not None and avant['statut'] == STATUT_PREVISION:
+        ajuster_prevision_devis(
+            {ouvrage_id: -q for ouvrage_id, q in prevision_lignes_devis(devis.pk).items()}, pk=devis.pk
+        )
+    retirer_transitions(devis.pk)
+    invalider_statistiques([avant['client_id'] if avant is not None else devis.client_id])
+
+
+def lot_enregistre(lot, avant):
+    """
+    Répercute l'enregistrement d'un lot. Un lot déplacé vers un autre devis
+    emporte ses totaux et sa part de la prévision d'achats de l'ancien devis vers
+    le nouveau, et invalide l'historique des prix de ses ouvrages. Le document de
+    recherche du devis n'est invalidé que si le nom ou le devis du lot change.
+    """
+    if avant is not None and avant['devis_id'] != lot.devis_id:
+        totaux = Lot.objects.filter(pk=lot.pk).values_list('total_ht', 'total_debourse').get()
+        appliquer_delta_devis(avant['devis_id'], -totaux[0], -totaux[1])
+        appliquer_delta_devis(lot.devis_id, *totaux)
+        variations = variations_lignes(lot.lignes.all())
+        ajuster_prevision_devis({ouvrage_id: -q for ouvrage_id, q in variations.items()}, pk=avant['devis_id'])
+        ajuster_prevision_devis(variations, pk=lot.devis_id)
+        if variations and devis_historises(pk__in=[avant['devis_id'], lot.devis_id]):
+            invalider_historique_prix(list(variations))
+        invalider_documents(pk=avant['devis_id'])
+    if modifie(avant, lot, 'devis_id', 'nom'):
+        invalider_documents(pk=lot.devis_id)
+
+
+def suppression_lot(lot, avant):
+    """
+    Retire un lot, et ses lignes supprimées en cascade, des totaux du devis, de
+    l'historique des prix et de la prévision d'achats, avant sa suppression.
+    """
+    devis_id = avant['devis_id'] if avant is not None else lot.devis_id
+    if devis_historises(pk=devis_id):
+        invalider_historique_prix(list(lot.lignes.exclude(ouvrage=None).values_list('ouvrage_id', flat=True)))
+    ajuster_prevision_devis(variations_lignes(lot.lignes.all(), -1), pk=devis_id)
+    totaux = Lot.objects.filter(pk=lot.pk).values_list('total_ht', 'total_debourse').first()
+    if totaux:
+        appliquer_delta_devis(devis_id, -totaux[0], -totaux[1])
+    invalider_documents(pk=devis_id)
+
+
+def _totaux(etat):
+    """
+    Retourne le triplet (lot, total HT, total déboursé) d'un état de ligne.
+    """
+    return (etat['lot_id'], etat['prix_unitaire'] * etat['quantite'], etat['debourse'] * etat['quantite'])
+
+
+def ligne_enregistree(ligne, avant):
+    """
+    Répercute l'enregistrement d'une ligne : totaux du lot et du devis si son
+    lot, sa quantité ou ses prix ont changé, historique des prix si son lot, son
+    ouvrage ou ses prix ont changé dans un devis accepté ou refusé, prévision d'achats si son lot, son ouvrage ou
+    sa quantité ont changé, document de recherche si sa description ou son lot
+    a changé. Une ligne déplacée vers un lot d'un autre devis est retirée de la
+    prévision de l'ancien devis et ajoutée à celle du nouveau.
+    """
+    apres = ligne.etat_courant()
+    if modifie(avant, ligne, 'lot_id', 'quantite', 'prix_unitaire', 'debourse'):
+        reporter_variation_ligne(_totaux(avant) if avant is not None else None, _totaux(apres))
+
+    ouvrages = {avant['ouvrage_id'] if avant is not None else None, ligne.ouvrage_id} - {None}
+    if ouvrages and modifie(avant, ligne, 'lot_id', 'ouvrage_id', 'prix_unitaire', 'debourse'):
+        lots = {avant['lot_id'] if avant is not None else ligne.lot_id, ligne.lot_id}
+        if devis_historises(lots__pk__in=lots):
+            invalider_historique_prix(list(ouvrages))
+
+    if modifie(avant, ligne, 'lot_id', 'ouvrage_id', 'quantite'):
+        variations = Counter({ligne.ouvrage_id: ligne.quantite})
+        if avant is not None:
+            if avant['lot_id'] == ligne.lot_id:
+                variations.subtract({avant['ouvrage_id']: avant['quantite']})
+            else:
+                ajuster_prevision_devis({avant['ouvrage_id']: -avant['quantite']}, lots__pk=avant['lot_id'])
+        ajuster_prevision_devis(variations, lots__pk=ligne.lot_id)
+
+    if modifie(avant, ligne, 'lot_id', 'description'):
+        lots = {ligne.lot_id, avant['lot_id'] if avant is not None else ligne.lot_id}
+        invalider_documents(lots__pk__in=lots)
+
+
+def suppression_ligne(ligne, avant):
+    """
+    Retire une ligne des totaux du lot et du devis, de l'historique des prix et
+    de la prévision d'achats, avant sa suppression.
+    """
+    if avant is None:
+        return
+    reporter_variation_ligne(_totaux(avant), None)
+    ajuster_prevision_devis({avant['ouvrage_id']: -avant['quantite']}, lots__pk=avant['lot_id'])
+    if avant['ouvrage_id'] is not None and devis_historises(lots__pk=avant['lot_id']):
+        invalider_historique_prix([avant['ouvrage_id']])
+    invalider_documents(lots__pk=avant['lot_id'])
@@ -0,0 +1,314 @@
+"""
+Tarification des lignes de devis à partir de la bibliothèque d'ouvrages
+et application des marges d'un devis.
+
+Le tarif d'un ouvrage (déboursé sec et prix de vente par défaut) est calculé en
+une requête sur ses ingrédients, et mémorisé le temps d'une requête HTTP ou
+d'un traitement (voir tarifs_memorises) : le pré-remplissage d'une ligne et
+LigneDevis.save le partagent au lieu de le recalculer chacun.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Least, Round
+
+from bibliotheque.models import Fourniture, MainOeuvre, IngredientOuvrage
+
+# Prix maximal représentable par un champ DecimalField(max_digits=10, decimal_places=2)
+PRIX_MAXIMUM = Decimal('9999999.99')
+
+# Tarifs mémorisés {ouvrage_id: (déboursé, prix)}, None hors d'un bloc tarifs_memorises
+_tarifs = ContextVar('tarifs_ouvrages', default=None)
+
+
+def prix_vente_defaut(debourse):
+    """
+    Calcule le prix unitaire par défaut d'une ligne : marge de 30% sur le déboursé,
+    arrondi à 2 décimales et plafonné à 10 chiffres. Retourne 0 si le déboursé est nul.
+    """
+    if debourse <= 0:
+        return Decimal('0')
+
+    prix = (Decimal(debourse) / Decimal('0.7')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if len(str(prix).replace('.', '')) > 10:
+        prix = PRIX_MAXIMUM
+    return prix
+
+
+def preremplir_ligne(ligne, ouvrage, debourse):
+    """
+    Complète les champs manquants d'une ligne 'ouvrage' (dictionnaire de données
+    reçues) à partir de l'ouvrage et de son déboursé sec, calculé par debourses_ouvrages.
+    Retourne une copie de la ligne.
+    """
+    ligne = ligne.copy()
+    debourse = round(debourse, 2)
+    if not ligne.get('description'):
+        ligne['description'] = ouvrage.nom
+    if not ligne.get('unite'):
+        ligne['unite'] = ouvrage.unite
+    if not ligne.get('debourse'):
+        ligne['debourse'] = str(debourse)
+    if not ligne.get('prix_unitaire'):
+        ligne['prix_unitaire'] = str(prix_vente_defaut(debourse))
+    return ligne
+
+
+def composition_ouvrages(ouvrage_ids):
+    """
+    Décompose le déboursé sec de plusieurs ouvrages par nature d'élément
+    ('fourniture' ou 'main_oeuvre') et par catégorie, en trois requêtes
+    (ingrédients, fournitures, main d'œuvre), quel que soit leur nombre.
+
+    Returns:
+        Dictionnaire {ouvrage_id: {(nature, categorie_id): coût non arrondi}}
+    """
+    ouvrage_ids = set(ouvrage_ids)
+    compositions = {ouvrage_id: {} for ouvrage_id in ouvrage_ids}
+    if not ouvrage_ids:
+        return compositions
+
+    type_fourniture = ContentType.objects.get_for_model(Fourniture).id
+    type_main_oeuvre = ContentType.objects.get_for_model(MainOeuvre).id
+
+    ingredients = list(
+        IngredientOuvrage.objects.filter(ouvrage_id__in=ouvrage_ids)
+        .values_list('ouvrage_id', 'element_type_id', 'element_id', 'quantite')
+    )
+    elements = {
+        type_fourniture: {
+            element_id: ('fourniture', categorie_id, prix)
+            for element_id, categorie_id, prix in Fourniture.objects.filter(
+                id__in=[i[2] for i in ingredients if i[1] == type_fourniture]
+            ).values_list('id', 'categorie_id', 'prix_achat_ht')
+        },
+        type_main_oeuvre: {
+            element_id: ('main_oeuvre', categorie_id, prix)
+            for element_id, categorie_id, prix in MainOeuvre.objects.filter(
+                id__in=[i[2] for i in ingredients if i[1] == type_main_oeuvre]
+            ).values_list('id', 'categorie_id', 'cout_horaire')
+        },
+    }
+
+    for ouvrage_id, element_type_id, element_id, quantite in ingredients:
+        element = elements.get(element_type_id, {}).get(element_id)
+        if element is not None:
+            nature, categorie_id, prix = element
+            cle = (nature, categorie_id)
+            compositions[ouvrage_id][cle] = compositions[ouvrage_id].get(cle, Decimal('0')) + quantite * prix
+
+    return compositions
+
+
+def _prix_element():
+    """
+    Expression SQL du prix de l'élément d'un ingrédient (prix d'achat d'une
+    fourniture ou coût horaire d'une main d'œuvre), lu par sous-requête.
+    """
+    champ_prix = DecimalField(max_digits=10, decimal_places=2)
+    return Case(
+        When(
+            element_type_id=ContentType.objects.get_for_model(Fourniture).id,
+            then=Subquery(Fourniture.objects.filter(pk=OuterRef('element_id')).values('prix_achat_ht')[:1])
+        ),
+        When(
+            element_type_id=ContentType.objects.get_for_model(MainOeuvre).id,
+            then=Subquery(MainOeuvre.objects.filter(pk=OuterRef('element_id')).values('cout_horaire')[:1])
+        ),
+        output_field=champ_prix
+    )
+
+
+def debourses_ouvrages(ouvrage_ids):
+    """
+    Calcule le déboursé sec de plusieurs ouvrages en une requête sur leurs
+    ingrédients, quel que soit leur nombre.
+
+    Returns:
+        Dictionnaire {ouvrage_id: déboursé sec non arrondi}
+    """
+    debourses = {ouvrage_id: Decimal('0') for ouvrage_id in set(ouvrage_ids)}
+    if not debourses:
+        return debourses
+
+    for ouvrage_id, quantite, prix in (
+        IngredientOuvrage.objects.filter(ouvrage_id__in=debourses)
+        .annotate(prix=_prix_element())
+        .values_list('ouvrage_id', 'quantite', 'prix')
+    ):
+        if prix is not None:
+            debourses[ouvrage_id] += quantite * prix
+    return debourses
+
+
+@contextmanager
+def tarifs_memorises():
+    """
+    Mémorise les tarifs d'ouvrages calculés par tarif_ouvrage jusqu'à la fin du
+    bloc. Les blocs imbriqués partagent la mémoire du bloc le plus extérieur.
+    """
+    if _tarifs.get() is not None:
+        yield
+        return
+    jeton = _tarifs.set({})
+    try:
+        yield
+    finally:
+        _tarifs.reset(jeton)
+
+
+def tarif_ouvrage(ouvrage_id):
+    """
+    Retourne le tarif d'un ouvrage : (déboursé sec arrondi à 2 décimales, prix de
+    vente par défaut). Calculé en une requête, ou lu dans la mémoire du bloc
+    tarifs_memorises en cours.
+    """
+    memoire = _tarifs.get()
+    if memoire is not None and ouvrage_id in memoire:
+        return memoire[ouvrage_id]
+
+    debourse = round(debourses_ouvrages([ouvrage_id])[ouvrage_id], 2)
+    tarif = (debourse, prix_vente_defaut(debourse))
+    if memoire is not None:
+        memoire[ouvrage_id] = tarif
+    return tarif
+
+
+def expression_prix(marge):
+    """
+    Expression SQL du prix unitaire d'une ligne donnant la marge demandée (en %)
+    sur son déboursé : debourse / (1 - marge / 100), arrondi et plafonné comme
+    prix_vente_defaut.
+    """
+    diviseur = (Decimal('100') - Decimal(marge)) / Decimal('100')
+    prix = ExpressionWrapper(
+        F('debourse') / Value(diviseur),
+        output_field=DecimalField(max_digits=16, decimal_places=4)
+    )
+    return Least(
+        Round(prix, 2),
+        Value(PRIX_MAXIMUM),
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def expression_prix_marges(marge, marges_lots=None):
+    """
+    Expression SQL du prix unitaire d'une ligne selon la marge de son lot,
+    ou à défaut la marge globale.
+
+    Args:
+        marge: Marge globale en %
+        marges_lots: Dictionnaire {lot_id: marge en %} des marges propres à certains lots
+    """
+    marges_lots = marges_lots or {}
+    if not marges_lots:
+        return expression_prix(marge)
+    return Case(
+        *[When(lot_id=lot_id, then=expression_prix(marge_lot)) for lot_id, marge_lot in marges_lots.items()],
+        default=expression_prix(marge),
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def apercu_marges(lignes, marge, marges_lots=None):
+    """
+    Calcule, sans rien modifier, l'effet de l'application des marges sur des lignes.
+
+    Returns:
+        Dictionnaire avec les totaux HT actuel et nouveau et la liste des lignes
+        dont le prix unitaire change
+    """
+    from .totaux import CHAMP_TOTAL, MONTANT_HT
+
+    lignes = lignes.annotate(nouveau_prix=expression_prix_marges(marge, marges_lots))
+    nouveau_montant = ExpressionWrapper(F('nouveau_prix') * F('quantite'), output_field=CHAMP_TOTAL)
+    totaux = lignes.aggregate(
+        total_ht_actuel=Coalesce(Sum(MONTANT_HT), Value(Decimal('0')), output_field=CHAMP_TOTAL),
+        total_ht_nouveau=Coalesce(Sum(nouveau_montant), Value(Decimal('0')), output_field=CHAMP_TOTAL),
+    )
+    modifiees = (
+        lignes.exclude(prix_unitaire=F('nouveau_prix'))
+        .order_by('lot__ordre', 'ordre', 'id')
+        .values('id', 'lot_id', 'description', 'quantite', 'debourse', 'prix_unitaire', 'nouveau_prix')
+    )
+    return dict(totaux, lignes=list(modifiees))
+
+
+def appliquer_marges(lignes, marge, marges_lots=None):
+    """
+    Recalcule le prix unitaire de toutes les lignes en une requête UPDATE.
+    Les totaux stockés doivent ensuite être recalculés (voir totaux.recalculer_totaux).
+
+    Returns:
+        Nombre de lignes mises à jour
+    """
+    return lignes.update(prix_unitaire=expression_prix_marges(marge, marges_lots))
+
+
+def reevaluer_debourses(devis, taille_lot=2000):
+    """
+    Recalcule le déboursé des lignes 'ouvrage' d'un ensemble de devis à partir des
+    prix actuels de la bibliothèque. Le déboursé de chaque ouvrage distinct n'est
+    calculé qu'une fois ; les lignes sont parcourues par paquets et seules celles
+    dont le déboursé change sont écrites (bulk_update). Les prix de vente ne sont
+    pas modifiés. À appeler dans une transaction.
+
+    Args:
+        devis: Queryset des devis à traiter
+        taille_lot: Nombre de lignes lues et écrites par paquet
+
+    Returns:
+        Liste, par devis modifié, du nombre de lignes mises à jour et du déboursé
+        et de la marge avant et après
+    """
+    from .arbre import calculer_marge
+    from .models import Devis, LigneDevis
+    from .totaux import recalculer_totaux
+
+    lignes = LigneDevis.objects.filter(lot__devis__in=devis, type='ouvrage', ouvrage__isnull=False)
+    debourses = {
+        ouvrage_id: round(debourse, 2)
+        for ouvrage_id, debourse in debourses_ouvrages(
+            lignes.order_by().values_list('ouvrage_id', flat=True).distinct()
+        ).items()
+    }
+
+    lignes_modifiees = {}
+    paquet = []
+    for ligne_id, devis_id, ouvrage_id, debourse in (
+        lignes.order_by().values_list('id', 'lot__devis_id', 'ouvrage_id', 'debourse').iterator(chunk_size=taille_lot)
+    ):
+        if debourse != debourses[ouvrage_id]:
+            paquet.append(LigneDevis(id=ligne_id, debourse=debourses[ouvrage_id]))
+            lignes_modifiees[devis_id] = lignes_modifiees.get(devis_id, 0) + 1
+        if len(paquet) >= taille_lot:
+            LigneDevis.objects.bulk_update(paquet, ['debourse'])
+            paquet = []
+    if paquet:
+        LigneDevis.objects.bulk_update(paquet, ['debourse'])
+
+    if not lignes_modifiees:
+        return []
+
+    champs = ('id', 'numero', 'total_ht', 'total_debourse')
+    avant = {d['id']: d for d in Devis.objects.filter(pk__in=lignes_modifiees).values(*champs)}
+    recalculer_totaux(list(lignes_modifiees))
+    apres = Devis.objects.filter(pk__in=lignes_modifiees).order_by('numero').values(*champs)
+
+    return [
+        {
+            'id': d['id'],
+            'numero': d['numero'],
+            'lignes_modifiees': lignes_modifiees[d['id']],
+            'total_ht': d['total_ht'],
+            'debourse_avant': avant[d['id']]['total_debourse'],
+            'debourse_apres': d['total_debourse'],
+            'marge_avant': calculer_marge(d['total_ht'], avant[d['id']]['total_debourse']),
+            'marge_apres': calculer_marge(d['total_ht'], d['total_debourse']),
+        }
+        for d in apres
+    ]
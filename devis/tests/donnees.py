@@ -0,0 +1,73 @@
+"""
+Fonctions de création des données de test des devis.
+"""
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from rest_framework.test import APIClient
+
+from authentification.models import User
+from bibliotheque.models import Categorie, Fourniture, IngredientOuvrage, MainOeuvre, Ouvrage
+from tiers.models import Tiers
+
+from ..models import Devis, LigneDevis, Lot
+from ..ordonnancement import PAS_ORDRE
+
+
+def creer_client(nom="ACME", siret="12345678900010"):
+    return Tiers.objects.create(nom=nom, siret=siret, relation='client')
+
+
+def creer_ouvrage(code='MUR01', nom="Mur", prix_fourniture='2.50', cout_horaire='40'):
+    """
+    Ouvrage de 10 kg de fourniture et 0,5 h de main d'œuvre : avec les prix par
+    défaut, 45 de déboursé sec.
+    """
+    categorie, _ = Categorie.objects.get_or_create(nom="Maçonnerie")
+    fourniture = Fourniture.objects.create(
+        nom=f"Ciment {code}", unite='kg', prix_achat_ht=Decimal(prix_fourniture), categorie=categorie
+    )
+    main_oeuvre = MainOeuvre.objects.create(
+        nom=f"Maçon {code}", cout_horaire=Decimal(cout_horaire), categorie=categorie
+    )
+    ouvrage = Ouvrage.objects.create(nom=nom, unite='m2', code=code, categorie=categorie)
+    IngredientOuvrage.objects.create(
+        ouvrage=ouvrage, element_type=ContentType.objects.get_for_model(Fourniture),
+        element_id=fourniture.id, quantite=Decimal('10')
+    )
+    IngredientOuvrage.objects.create(
+        ouvrage=ouvrage, element_type=ContentType.objects.get_for_model(MainOeuvre),
+        element_id=main_oeuvre.id, quantite=Decimal('0.5')
+    )
+    return ouvrage
+
+
+def creer_devis(client, numero, **champs):
+    champs.setdefault('objet', f"Devis {numero}")
+    return Devis.objects.create(client=client, numero=numero, **champs)
+
+
+def creer_lot(devis, nom="Gros œuvre", ordre=PAS_ORDRE):
+    return Lot.objects.create(devis=devis, nom=nom, ordre=ordre)
+
+
+def creer_ligne(lot, quantite, prix_unitaire='10', debourse='6', description="Ligne", **champs):
+    return LigneDevis.objects.create(
+        lot=lot, description=description, unite='u', quantite=Decimal(quantite),
+        prix_unitaire=Decimal(prix_unitaire), debourse=Decimal(debourse), **champs
+    )
+
+
+def creer_ligne_ouvrage(lot, ouvrage, quantite):
+    return LigneDevis.objects.create(lot=lot, type='ouvrage', ouvrage=ouvrage, quantite=Decimal(quantite))
+
+
+def client_api(email='a@b.fr', **champs):
+    """
+    Client d'API authentifié par un nouvel utilisateur.
+    """
+    utilisateur = User.objects.create(email=email, username=email, **champs)
+    api = APIClient()
+    api.force_authenticate(utilisateur)
+    api.utilisateur = utilisateur
+    return api
@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..arbre import ArbreDevis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class ArbreDevisTests(TestCase):
+    """
+    Chargement de l'arbre d'un devis en un nombre fixe de requêtes.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.devis = creer_devis(self.client_devis, 'A1')
+        self.second = creer_lot(self.devis, "Second œuvre", ordre=2048)
+        self.premier = creer_lot(self.devis, "Gros œuvre", ordre=1024)
+        creer_ligne(self.premier, '2', description="B", ordre=2)
+        creer_ligne(self.premier, '1', description="A", ordre=1)
+        creer_ligne(self.second, '3', prix_unitaire='20', debourse='10')
+
+    def requetes_chargement(self):
+        with CaptureQueriesContext(connection) as requetes:
+            ArbreDevis.charger(self.devis.pk)
+        return len(requetes)
+
+    def test_totaux_et_ordre(self):
+        arbre = ArbreDevis.charger(self.devis.pk)
+        self.assertEqual([noeud.lot.nom for noeud in arbre.lots], ["Gros œuvre", "Second œuvre"])
+        self.assertEqual([ligne.description for ligne in arbre.lots[0].lignes], ["A", "B"])
+        self.assertEqual(arbre.lots[0].total_ht, Decimal('30'))
+        self.assertEqual(arbre.total_ht, Decimal('90'))
+        self.assertEqual(arbre.total_debourse, Decimal('48'))
+
+    def test_requetes_independantes_de_la_taille(self):
+        avant = self.requetes_chargement()
+        for rang in range(5):
+            lot = creer_lot(self.devis, f"Lot {rang}", ordre=4096 + rang)
+            for _ in range(3):
+                creer_ligne(lot, '1')
+        self.assertEqual(self.requetes_chargement(), avant)
+
+    def test_endpoint_calculs(self):
+        reponse = client_api().get(f'/api/quotes/devis/{self.devis.pk}/calculations/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['total_ht'], Decimal('90'))
+        self.assertEqual([lot['nom'] for lot in reponse.data['lots']], ["Gros œuvre", "Second œuvre"])
+        self.assertEqual(reponse.data['lots'][1]['lignes'][0]['total_debourse'], Decimal('30'))
@@ -0,0 +1,67 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import calculs_groupes
+from ..ordonnancement import PAS_ORDRE
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class CalculsGroupesTests(TestCase):
+    """
+    Totaux, déboursés et marges de plusieurs devis et de leurs lots.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.devis = creer_devis(self.client_devis, 'G1', statut='envoyé')
+        lot = creer_lot(self.devis)
+        creer_ligne(lot, '3')
+        creer_ligne(lot, '1', prix_unitaire='20', debourse='10', ordre=PAS_ORDRE)
+        creer_lot(self.devis, "Vide", ordre=2 * PAS_ORDRE)
+        self.autre = creer_devis(self.client_devis, 'G2')
+        creer_ligne(creer_lot(self.autre), '2')
+        self.api = client_api()
+        self.url = '/api/quotes/devis/calculations/batch/'
+
+    def calculer(self, donnees=None, parametres=''):
+        return self.api.post(self.url + parametres, donnees or {}, format='json')
+
+    def test_calculs_par_ids(self):
+        reponse = self.calculer({'ids': [self.devis.pk, 0]})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['introuvables'], [0])
+        resultat, = reponse.data['devis']
+        self.assertEqual(
+            (resultat['numero'], resultat['total_ht'], resultat['total_debourse'], resultat['nombre_lignes']),
+            ('G1', Decimal('50'), Decimal('28'), 2)
+        )
+        self.assertEqual(resultat['marge'], Decimal('44'))
+        self.assertEqual(
+            [(lot['nom'], lot['total_ht'], lot['nombre_lignes']) for lot in resultat['lots']],
+            [("Gros œuvre", Decimal('50'), 2), ("Vide", Decimal('0'), 0)]
+        )
+
+    def test_calculs_par_filtres(self):
+        reponse = self.calculer(parametres='?statut=brouillon')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([resultat['numero'] for resultat in reponse.data['devis']], ['G2'])
+        self.assertNotIn('introuvables', reponse.data)
+
+    def test_requetes_independantes_du_nombre_de_devis(self):
+        with CaptureQueriesContext(connection) as requetes_un_devis:
+            self.calculer({'ids': [self.devis.pk]})
+        for rang in range(5):
+            creer_ligne(creer_lot(creer_devis(self.client_devis, f'G{rang + 3}')), '1')
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.calculer()
+        self.assertEqual(len(reponse.data['devis']), 7)
+        self.assertEqual(len(requetes), len(requetes_un_devis))
+
+    def test_limite(self):
+        with mock.patch.object(calculs_groupes, 'LIMITE_DEVIS', 1):
+            self.assertEqual(self.calculer().status_code, 400)
+            self.assertEqual(self.calculer({'ids': [self.autre.pk]}).status_code, 200)
+        self.assertEqual(self.calculer({'ids': ['x']}).status_code, 400)
@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from tiers.models import Adresse, Contact
+
+from .donnees import client_api, creer_client, creer_devis, creer_lot
+
+
+class ClientDuDetailTests(TestCase):
+    """
+    Client résumé dans le détail d'un devis, vue complète avec ?expand=client.
+    """
+    def setUp(self):
+        client = creer_client()
+        Adresse.objects.create(tier=client, libelle="Siège", ville="Lyon")
+        Adresse.objects.create(tier=client, libelle="Facturation", ville="Paris", facturation=True)
+        Contact.objects.create(tier=client, nom="Martin")
+        Contact.objects.create(tier=client, nom="Durand", contact_principal_devis=True)
+        self.devis = creer_devis(client, 'C1')
+        creer_lot(self.devis)
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/'
+
+    def test_client_resume(self):
+        reponse = self.api.get(self.url)
+        self.assertEqual(reponse.status_code, 200)
+        client = reponse.data['client_details']
+        self.assertEqual(
+            set(client), {'id', 'nom', 'siret', 'tva', 'adresse_facturation', 'contact_devis'}
+        )
+        self.assertEqual(client['adresse_facturation']['ville'], "Paris")
+        self.assertEqual(client['contact_devis']['nom'], "Durand")
+
+    def test_client_complet_sur_demande(self):
+        reponse = self.api.get(self.url, {'expand': 'client'})
+        self.assertEqual(reponse.status_code, 200)
+        client = reponse.data['client_details']
+        self.assertIn('activites', client)
+        self.assertEqual(len(client['adresses']), 2)
+        self.assertEqual(len(client['contacts']), 2)
+
+    def test_sans_adresse_de_facturation(self):
+        Adresse.objects.filter(facturation=True).delete()
+        Contact.objects.update(contact_principal_devis=False)
+        client = self.api.get(self.url).data['client_details']
+        self.assertEqual(client['adresse_facturation']['ville'], "Lyon")
+        self.assertIsNone(client['contact_devis'])
@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import LigneDevis
+from ..ordonnancement import PAS_ORDRE
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class ComparaisonTests(TestCase):
+    """
+    Comparaison du contenu de deux devis, ou d'un devis et de ses révisions.
+    """
+    def setUp(self):
+        client = creer_client()
+        self.devis = creer_devis(client, 'P1')
+        lot = creer_lot(self.devis, "Gros œuvre")
+        self.dalle = creer_ligne(lot, '3', description="Dalle")
+        creer_ligne(lot, '1', description="Chape", ordre=PAS_ORDRE)
+        creer_ligne(creer_lot(self.devis, "Démolition", ordre=2 * PAS_ORDRE), '1', description="Dépose")
+
+        self.copie = creer_devis(client, 'P2')
+        lot = creer_lot(self.copie, "GROS  ŒUVRE")
+        creer_ligne(lot, '5', description="dalle")
+        creer_ligne(lot, '1', description="Chape", ordre=PAS_ORDRE)
+        creer_ligne(lot, '2', description="Enduit", ordre=2 * PAS_ORDRE)
+        creer_ligne(creer_lot(self.copie, "Peinture", ordre=2 * PAS_ORDRE), '4', description="Murs")
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/diff/'
+
+    def test_comparaison_avec_une_copie(self):
+        reponse = self.api.get(self.url, {'avec': self.copie.pk})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['vers']['numero'], 'P2')
+        self.assertEqual(
+            [(lot['nom'], lot['etat']) for lot in reponse.data['lots']],
+            [("GROS  ŒUVRE", 'modifie'), ("Peinture", 'ajoute'), ("Démolition", 'supprime')]
+        )
+        gros_oeuvre = reponse.data['lots'][0]
+        self.assertEqual(gros_oeuvre['identiques'], 1)
+        self.assertEqual([ligne['description'] for ligne in gros_oeuvre['ajoutees']], ["Enduit"])
+        modifiee, = gros_oeuvre['modifiees']
+        self.assertEqual(modifiee['changements'], {'quantite': {'avant': Decimal('3'), 'apres': Decimal('5')}})
+        self.assertEqual(modifiee['total_ht']['delta'], Decimal('20'))
+        self.assertEqual(reponse.data['resume'], {'ajoutees': 2, 'supprimees': 1, 'modifiees': 1, 'identiques': 1})
+        self.assertEqual(reponse.data['totaux']['total_ht']['delta'], Decimal('70'))
+
+    def test_comparaison_avec_une_revision(self):
+        self.api.post(f'/api/quotes/devis/{self.devis.pk}/revisions/')
+        ligne = LigneDevis.objects.get(pk=self.dalle.pk)
+        ligne.prix_unitaire = Decimal('12')
+        ligne.save()
+
+        reponse = self.api.get(self.url, {'revision': 1})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['de']['revision'], 1)
+        self.assertEqual(reponse.data['resume']['modifiees'], 1)
+        self.assertEqual(reponse.data['totaux']['total_ht']['delta'], Decimal('6'))
+
+    def test_devis_ou_revision_introuvable(self):
+        self.assertEqual(self.api.get(self.url, {'avec': 0}).status_code, 404)
+        self.assertEqual(self.api.get(self.url, {'revision': 3}).status_code, 404)
+        self.assertEqual(self.api.get(self.url).data['resume']['identiques'], 3)
@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..duplication import dupliquer_devis
+from ..models import Devis, LigneDevis
+from ..totaux import totaux_divergents
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class DuplicationTests(TestCase):
+    """
+    Duplication d'un devis par copie ensembliste de ses lots et de ses lignes.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.devis = creer_devis(self.client_devis, 'D1', statut='accepté', marge_globale=Decimal('25'))
+        for rang in (1, 2):
+            lot = creer_lot(self.devis, f"Lot {rang}", ordre=rang * 1024)
+            creer_ligne(lot, '2', description=f"Ligne {rang}.1", ordre=1024)
+            creer_ligne(lot, '1', prix_unitaire='30', description=f"Ligne {rang}.2", ordre=2048)
+
+    def contenu(self, devis):
+        return list(
+            LigneDevis.objects.filter(lot__devis=devis).order_by('lot__ordre', 'ordre')
+            .values_list('lot__nom', 'lot__ordre', 'description', 'ordre', 'quantite', 'prix_unitaire')
+        )
+
+    def test_copie_des_lots_et_des_lignes(self):
+        copie = dupliquer_devis(self.devis, numero='D2')
+        self.assertEqual(self.contenu(copie), self.contenu(self.devis))
+        self.assertEqual((copie.statut, copie.objet, copie.marge_globale), ('brouillon', "Copie de : Devis D1", 25))
+        self.assertEqual(Devis.objects.get(pk=copie.pk).total_ht, Decimal('100'))
+        lots, devis = totaux_divergents()
+        self.assertEqual((list(lots), list(devis)), ([], []))
+
+    def test_requetes_independantes_de_la_taille(self):
+        def requetes():
+            with CaptureQueriesContext(connection) as capture:
+                dupliquer_devis(self.devis, numero=f"C{Devis.objects.count()}")
+            return len(capture)
+
+        avant = requetes()
+        lot = creer_lot(self.devis, "Lot 3", ordre=3072)
+        for _ in range(10):
+            creer_ligne(lot, '1')
+        self.assertEqual(requetes(), avant)
+
+    def test_endpoint_numero_et_client(self):
+        autre_client = creer_client("Durand", "98765432100010")
+        api = client_api()
+        reponse = api.post(f'/api/quotes/devis/{self.devis.pk}/duplicate/', {'client': str(autre_client.pk)}, format='json')
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.data['numero'], f"DEV-{date.today().year}-00001")
+        self.assertEqual(Devis.objects.get(pk=reponse.data['id']).client, autre_client)
+        self.assertEqual(len(reponse.data['lots']), 2)
+
+        reponse = api.post(f'/api/quotes/devis/{self.devis.pk}/duplicate/', {'client': 'inconnu'}, format='json')
+        self.assertEqual(reponse.status_code, 400)
@@ -0,0 +1,58 @@
+from django.test import TestCase
+
+from ..models import Devis
+from .donnees import client_api, creer_client, creer_devis
+
+
+class EntonnoirTests(TestCase):
+    """
+    Journal des statuts des devis et entonnoir de conversion.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.devis = [creer_devis(self.client_devis, f'E{rang}') for rang in range(3)]
+        self.api = client_api()
+
+    def changer_statut(self, devis, statut):
+        return self.api.put(f'/api/quotes/devis/{devis.pk}/change_status/', {'statut': statut}, format='json')
+
+    def entonnoir(self, **params):
+        reponse = self.api.get('/api/quotes/devis/funnel/', params)
+        self.assertEqual(reponse.status_code, 200)
+        return [(etape['statut'], etape['entrees'], etape.get('taux_conversion')) for etape in reponse.data['entonnoir']]
+
+    def test_journal_des_statuts(self):
+        self.assertEqual(self.changer_statut(self.devis[0], 'envoyé').status_code, 200)
+        self.assertEqual(self.changer_statut(self.devis[0], 'accepté').status_code, 200)
+
+        reponse = self.api.get(f'/api/quotes/devis/{self.devis[0].pk}/status_history/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            [(t['ancien_statut'], t['nouveau_statut']) for t in reponse.data],
+            [('', 'brouillon'), ('brouillon', 'envoyé'), ('envoyé', 'accepté')]
+        )
+        self.assertIsNone(reponse.data[0]['auteur'])
+        self.assertEqual(reponse.data[2]['auteur'], self.api.utilisateur.pk)
+        self.assertIsNotNone(reponse.data[2]['duree_cycle'])
+
+    def test_statut_invalide(self):
+        self.assertEqual(self.changer_statut(self.devis[0], 'perdu').status_code, 400)
+        self.assertEqual(self.api.put(f'/api/quotes/devis/{self.devis[0].pk}/change_status/', {}).status_code, 400)
+        self.assertEqual(self.devis[0].transitions_statut.count(), 1)
+
+    def test_entonnoir(self):
+        self.changer_statut(self.devis[0], 'envoyé')
+        self.changer_statut(self.devis[1], 'envoyé')
+        self.changer_statut(self.devis[0], 'accepté')
+        self.assertEqual(self.entonnoir(), [('brouillon', 3, None), ('envoyé', 2, 66.67), ('accepté', 1, 50.0)])
+
+        autre = creer_devis(creer_client("Autre", siret="98765432100010"), 'E9')
+        self.assertEqual(self.entonnoir(client=str(autre.client_id))[0], ('brouillon', 1, None))
+
+        reponse = self.api.get('/api/quotes/devis/funnel/', {'client': 'x'})
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_suppression_d_un_devis(self):
+        self.changer_statut(self.devis[0], 'envoyé')
+        Devis.objects.get(pk=self.devis[0].pk).delete()
+        self.assertEqual(self.entonnoir(), [('brouillon', 2, None), ('envoyé', 0, 0.0), ('accepté', 0, None)])
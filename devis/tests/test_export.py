@@ -0,0 +1,72 @@
+import csv
+import io
+from datetime import date
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from ..models import Devis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class ExportTests(TestCase):
+    """
+    Exports CSV et XLSX des devis et de leurs lignes.
+    """
+    def setUp(self):
+        client = creer_client()
+        self.devis = creer_devis(client, 'X1', statut='accepté')
+        lot = creer_lot(self.devis)
+        creer_ligne(lot, '3', description="Dalle")
+        creer_ligne(lot, '2', prix_unitaire='5', description="Chape", ordre=2048)
+        ancien = creer_devis(client, 'X2')
+        creer_ligne(creer_lot(ancien), '1', description="Ancienne")
+        Devis.objects.filter(pk=ancien.pk).update(date_creation=date(2020, 1, 15))
+        self.api = client_api()
+
+    def lire_csv(self, reponse):
+        self.assertEqual(reponse.status_code, 200)
+        contenu = b''.join(reponse.streaming_content).decode('utf-8')
+        return list(csv.reader(io.StringIO(contenu), delimiter=';'))
+
+    def test_export_des_lignes_d_un_devis(self):
+        reponse = self.api.get(f'/api/quotes/devis/{self.devis.pk}/export/')
+        self.assertIn('devis_X1.csv', reponse['Content-Disposition'])
+        lignes = self.lire_csv(reponse)
+        self.assertEqual(lignes[0][:4], ["Devis", "Client", "Date du devis", "Lot"])
+        self.assertEqual(
+            [(ligne[6], Decimal(ligne[10])) for ligne in lignes[1:]],
+            [("Dalle", Decimal('30')), ("Chape", Decimal('10'))]
+        )
+
+    def test_export_des_devis_filtre(self):
+        lignes = self.lire_csv(self.api.get('/api/quotes/devis/export_quotes/', {'statut': 'accepté'}))
+        self.assertEqual(lignes[0][0], "Numéro")
+        self.assertEqual([ligne[0] for ligne in lignes[1:]], ['X1'])
+        self.assertEqual(Decimal(lignes[1][7]), Decimal('40'))
+
+    def test_export_des_lignes_sur_une_periode(self):
+        url = '/api/quotes/devis/export_lines/'
+        lignes = self.lire_csv(self.api.get(url, {'debut': '2020-01-01', 'fin': '2020-12-31'}))
+        self.assertEqual([ligne[6] for ligne in lignes[1:]], ["Ancienne"])
+        self.assertEqual(len(self.lire_csv(self.api.get(url))), 4)
+        self.assertEqual(self.api.get(url, {'debut': '15/01/2020'}).status_code, 400)
+
+    def test_format_inconnu(self):
+        reponse = self.api.get(f'/api/quotes/devis/{self.devis.pk}/export/', {'export': 'pdf'})
+        self.assertEqual(reponse.status_code, 400)
+
+    @skipUnless(openpyxl, "openpyxl n'est pas installé")
+    def test_export_xlsx(self):
+        reponse = self.api.get('/api/quotes/devis/export_quotes/', {'export': 'xlsx', 'ordering': 'numero'})
+        self.assertEqual(reponse.status_code, 200)
+        classeur = openpyxl.load_workbook(io.BytesIO(b''.join(reponse.streaming_content)), read_only=True)
+        lignes = list(classeur.worksheets[0].iter_rows(values_only=True))
+        self.assertEqual(lignes[0][0], "Numéro")
+        self.assertEqual([ligne[0] for ligne in lignes[1:]], ['X1', 'X2'])
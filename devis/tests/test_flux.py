@@ -0,0 +1,42 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import flux
+from ..ordonnancement import PAS_ORDRE
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class DetailEnFluxTests(TestCase):
+    """
+    Détail d'un devis rendu en flux avec ?stream=1.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'F1')
+        premier = creer_lot(self.devis, "Gros œuvre")
+        creer_lot(self.devis, "Vide", ordre=2 * PAS_ORDRE)
+        dernier = creer_lot(self.devis, "Finitions", ordre=3 * PAS_ORDRE)
+        for rang in range(1, 4):
+            creer_ligne(premier, str(rang), description=f"Ligne « {rang} »", ordre=rang * PAS_ORDRE)
+        creer_ligne(dernier, '2', description="Peinture")
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/'
+
+    def lire_flux(self):
+        reponse = self.api.get(self.url, {'stream': '1'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return json.loads(b''.join(reponse.streaming_content))
+
+    def test_meme_document_que_le_detail(self):
+        detail = json.loads(self.api.get(self.url).content)
+        self.assertEqual(self.lire_flux(), detail)
+        self.assertEqual([len(lot['lignes']) for lot in detail['lots']], [3, 0, 1])
+
+    def test_ecriture_par_blocs(self):
+        with mock.patch.object(flux, 'TAILLE_BLOC', 16):
+            reponse = self.api.get(self.url, {'stream': '1'})
+            blocs = list(reponse.streaming_content)
+        self.assertGreater(len(blocs), 1)
+        self.assertEqual(json.loads(b''.join(blocs)), json.loads(self.api.get(self.url).content))
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..historique_prix import obtenir_historique_prix
+from ..models import Devis, HistoriquePrixOuvrage, LigneDevis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class HistoriquePrixTests(TestCase):
+    """
+    Instantané des prix pratiqués par ouvrage dans les devis acceptés et refusés.
+    """
+    def setUp(self):
+        client = creer_client()
+        self.ouvrage = creer_ouvrage()
+        self.lignes = {}
+        for numero, statut, prix in (('H1', 'accepté', '60'), ('H2', 'accepté', '80'),
+                                     ('H3', 'refusé', '90'), ('H4', 'brouillon', '50')):
+            lot = creer_lot(creer_devis(client, numero, statut=statut))
+            self.lignes[numero] = creer_ligne_ouvrage(lot, self.ouvrage, '1')
+            LigneDevis.objects.filter(pk=self.lignes[numero].pk).update(prix_unitaire=Decimal(prix))
+
+    def a_jour(self):
+        return HistoriquePrixOuvrage.objects.get(ouvrage=self.ouvrage).a_jour
+
+    def modifier_prix(self, numero, prix):
+        ligne = LigneDevis.objects.get(pk=self.lignes[numero].pk)
+        ligne.prix_unitaire = Decimal(prix)
+        ligne.save()
+
+    def test_historique(self):
+        reponse = client_api().get(f'/api/library/ouvrages/{self.ouvrage.pk}/price_history/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['accepté']['nombre'], 2)
+        self.assertEqual(reponse.data['accepté']['prix_unitaire'], {'min': 60.0, 'median': 70.0, 'max': 80.0})
+        self.assertEqual(reponse.data['refusé']['nombre'], 1)
+        self.assertEqual(reponse.data['refusé']['marge']['max'], 50.0)
+        self.assertTrue(self.a_jour())
+
+    def test_ligne_d_un_brouillon_sans_invalidation(self):
+        obtenir_historique_prix(self.ouvrage.pk)
+        self.modifier_prix('H4', '55')
+        self.assertTrue(self.a_jour())
+
+    def test_ligne_d_un_devis_accepte(self):
+        obtenir_historique_prix(self.ouvrage.pk)
+        self.modifier_prix('H1', '70')
+        self.assertFalse(self.a_jour())
+        self.assertEqual(obtenir_historique_prix(self.ouvrage.pk)['accepté']['prix_unitaire']['min'], 70.0)
+
+    def test_acceptation_d_un_brouillon(self):
+        obtenir_historique_prix(self.ouvrage.pk)
+        devis = Devis.objects.get(numero='H4')
+        devis.statut = 'accepté'
+        devis.save()
+        self.assertFalse(self.a_jour())
+        self.assertEqual(obtenir_historique_prix(self.ouvrage.pk)['accepté']['nombre'], 3)
@@ -0,0 +1,92 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from .. import import_dpgf
+from ..import_dpgf import FichierInvalide, importer_dpgf
+from ..models import Devis, LigneDevis, Lot
+from .donnees import client_api, creer_client, creer_devis, creer_lot, creer_ouvrage
+
+DPGF = """Bordereau de prix;;;;
+Code;Désignation;Unité;Quantité;PU HT
+;Gros œuvre;;;
+MUR01;;;2;
+;Ragréage;m2;10;12,50
+;Reprise;m2;abc;5
+;Finitions;;;
+;Peinture;m2;4;8
+"""
+
+
+class ImportDpgfTests(TestCase):
+    """
+    Import d'un bordereau de quantités dans un devis.
+    """
+    def setUp(self):
+        creer_ouvrage()
+        self.devis = creer_devis(creer_client(), 'I1')
+        creer_lot(self.devis, "Existant")
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/import_dpgf/'
+
+    def importer(self, contenu, nom='dpgf.csv'):
+        fichier = SimpleUploadedFile(nom, contenu.encode('utf-8'), content_type='text/csv')
+        return self.api.post(self.url, {'fichier': fichier}, format='multipart')
+
+    def lignes(self):
+        return list(
+            LigneDevis.objects.filter(lot__devis=self.devis).order_by('lot__ordre', 'ordre')
+            .values_list('lot__nom', 'type', 'description', 'quantite', 'prix_unitaire')
+        )
+
+    def test_import_csv(self):
+        reponse = self.importer(DPGF)
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual([lot['nom'] for lot in reponse.data['lots']], ["Gros œuvre", "Finitions"])
+        self.assertEqual(reponse.data['lignes_importees'], 3)
+        self.assertEqual(reponse.data['erreurs'], [{'ligne': 6, 'erreurs': {'quantite': ["Nombre invalide"]}}])
+        self.assertEqual(self.lignes(), [
+            ("Gros œuvre", 'ouvrage', "Mur", Decimal('2'), Decimal('64.29')),
+            ("Gros œuvre", 'manuel', "Ragréage", Decimal('10'), Decimal('12.50')),
+            ("Finitions", 'manuel', "Peinture", Decimal('4'), Decimal('8')),
+        ])
+        self.assertEqual(
+            list(Lot.objects.filter(devis=self.devis).order_by('ordre').values_list('nom', flat=True)),
+            ["Existant", "Gros œuvre", "Finitions"]
+        )
+        self.assertEqual(Devis.objects.get(pk=self.devis.pk).total_ht, Decimal('285.58'))
+
+    def test_en_tete_introuvable(self):
+        reponse = self.importer("Nom;Prix\nMur;12\n")
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('detail', reponse.data)
+        self.assertFalse(LigneDevis.objects.exists())
+
+    def test_fichier_absent(self):
+        self.assertEqual(self.api.post(self.url, {}, format='multipart').status_code, 400)
+
+    def test_insertion_par_paquets(self):
+        lignes = [['Désignation', 'Quantité', 'Unité']]
+        for rang_lot in range(3):
+            lignes.append([f"Lot {rang_lot}", '', ''])
+            lignes.extend([f"Ligne {rang_lot}.{rang}", '1', 'u'] for rang in range(3))
+        with mock.patch.object(import_dpgf, 'TAILLE_PAQUET', 2):
+            resultat = importer_dpgf(self.devis, lignes)
+        self.assertEqual(len(resultat['lots']), 3)
+        self.assertEqual(resultat['lignes'], 9)
+        self.assertEqual(
+            [description for _, _, description, _, _ in self.lignes()],
+            [f"Ligne {rang_lot}.{rang}" for rang_lot in range(3) for rang in range(3)]
+        )
+
+    def test_lignes_sans_lot(self):
+        resultat = importer_dpgf(self.devis, [['Désignation', 'Quantité', 'Unité'], ['Mur', '3', 'm2']])
+        self.assertEqual(Lot.objects.get(pk=resultat['lots'][0]).nom, import_dpgf.LOT_PAR_DEFAUT)
+
+    def test_en_tete_cherche_dans_les_premieres_lignes(self):
+        lignes = [['Bordereau']] * import_dpgf.LIGNES_ENTETE + [['Désignation', 'Quantité'], ['Mur', '3']]
+        with self.assertRaises(FichierInvalide):
+            importer_dpgf(self.devis, lignes)
+        self.assertEqual(Lot.objects.filter(devis=self.devis).count(), 1)
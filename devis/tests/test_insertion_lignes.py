@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import LigneDevis
+from ..ordonnancement import PAS_ORDRE
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot, creer_ouvrage
+
+
+class InsertionLignesTests(TestCase):
+    """
+    Insertion en masse de lignes dans les lots d'un devis (lines/bulk/).
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.ouvrage = creer_ouvrage()
+        self.devis = creer_devis(self.client_devis, 'I1')
+        self.lot = creer_lot(self.devis)
+        creer_ligne(self.lot, '1', ordre=PAS_ORDRE)
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/lines/bulk/'
+
+    def test_insertion_et_preremplissage(self):
+        reponse = self.api.post(self.url, {'lignes': [
+            {'lot': self.lot.pk, 'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '2'},
+            {'lot': self.lot.pk, 'type': 'manuel', 'description': "Nettoyage", 'unite': 'fft',
+             'quantite': '1', 'prix_unitaire': '50', 'debourse': '20'},
+        ]}, format='json')
+        self.assertEqual(reponse.status_code, 201)
+
+        ouvrage, manuelle = LigneDevis.objects.filter(lot=self.lot).order_by('ordre')[1:]
+        self.assertEqual((ouvrage.description, ouvrage.unite), ("Mur", 'm2'))
+        self.assertEqual((ouvrage.debourse, ouvrage.prix_unitaire), (Decimal('45.00'), Decimal('64.29')))
+        # Ajoutées à la suite des lignes existantes du lot
+        self.assertEqual([ouvrage.ordre, manuelle.ordre], [2 * PAS_ORDRE, 3 * PAS_ORDRE])
+
+        self.devis.refresh_from_db()
+        self.assertEqual(self.devis.total_ht, Decimal('10') + Decimal('128.58') + Decimal('50'))
+
+    def test_une_ligne_invalide_annule_tout(self):
+        reponse = self.api.post(self.url, {'lignes': [
+            {'lot': self.lot.pk, 'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '2'},
+            {'lot': self.lot.pk, 'type': 'manuel', 'quantite': '1'},
+        ]}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(list(reponse.data['lignes']), [1])
+        self.assertIn('description', reponse.data['lignes'][1])
+        self.assertEqual(LigneDevis.objects.filter(lot=self.lot).count(), 1)
+
+    def test_lot_d_un_autre_devis_refuse(self):
+        autre_lot = creer_lot(creer_devis(self.client_devis, 'I2'))
+        reponse = self.api.post(self.url, {'lignes': [
+            {'lot': autre_lot.pk, 'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '1'},
+        ]}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertFalse(LigneDevis.objects.filter(lot=autre_lot).exists())
+
+    def test_liste_vide(self):
+        self.assertEqual(self.api.post(self.url, {'lignes': []}, format='json').status_code, 400)
@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import Devis, LigneDevis
+from ..ordonnancement import PAS_ORDRE
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class ApplicationMargeTests(TestCase):
+    """
+    Application d'une marge globale, ou propre à certains lots, aux lignes d'un devis.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'M1')
+        self.lot = creer_lot(self.devis)
+        self.autre_lot = creer_lot(self.devis, "Second œuvre", ordre=2 * PAS_ORDRE)
+        self.ligne = creer_ligne(self.lot, '2', prix_unitaire='7', debourse='6')
+        self.autre_ligne = creer_ligne(self.autre_lot, '1', prix_unitaire='7', debourse='6')
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/apply_margin/'
+
+    def prix(self, ligne):
+        return LigneDevis.objects.get(pk=ligne.pk).prix_unitaire
+
+    def test_marge_globale(self):
+        reponse = self.api.post(self.url, {'marge': '40'}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['lignes_modifiees'], 2)
+        self.assertEqual(self.prix(self.ligne), Decimal('10'))
+        devis = Devis.objects.get(pk=self.devis.pk)
+        self.assertEqual(devis.marge_globale, Decimal('40'))
+        self.assertEqual(devis.total_ht, Decimal('30'))
+
+    def test_marge_propre_a_un_lot(self):
+        reponse = self.api.post(
+            self.url, {'marge': '40', 'lots': {str(self.autre_lot.pk): '25'}}, format='json'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.prix(self.ligne), Decimal('10'))
+        self.assertEqual(self.prix(self.autre_ligne), Decimal('8'))
+        self.assertEqual(Devis.objects.get(pk=self.devis.pk).total_ht, Decimal('28'))
+
+    def test_apercu_sans_modification(self):
+        reponse = self.api.post(self.url, {'marge': '40', 'dry_run': True}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.data['dry_run'])
+        self.assertEqual(reponse.data['total_ht_actuel'], Decimal('21'))
+        self.assertEqual(reponse.data['total_ht_nouveau'], Decimal('30'))
+        self.assertEqual(len(reponse.data['lignes']), 2)
+        self.assertEqual(self.prix(self.ligne), Decimal('7'))
+        self.assertIsNone(Devis.objects.get(pk=self.devis.pk).marge_globale)
+
+    def test_lot_d_un_autre_devis(self):
+        lot_etranger = creer_lot(creer_devis(self.devis.client, 'M2'))
+        reponse = self.api.post(self.url, {'marge': '40', 'lots': {str(lot_etranger.pk): '25'}}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('lots', reponse.data)
+        self.assertEqual(self.prix(self.ligne), Decimal('7'))
+
+    def test_marge_absente(self):
+        reponse = self.api.post(self.url, {}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('marge', reponse.data)
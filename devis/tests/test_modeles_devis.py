@@ -0,0 +1,100 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bibliotheque.models import Ouvrage
+
+from ..models import LigneDevis, ModeleDevis, ModeleLigne
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class ModelesDevisTests(TestCase):
+    """
+    Modèles de devis : création, instanciation dans un devis et création depuis un devis.
+    """
+    def setUp(self):
+        self.ouvrage = creer_ouvrage()
+        self.devis = creer_devis(creer_client(), 'T1')
+        self.api = client_api()
+
+    def creer_modele(self, ligne_ouvrage=None):
+        ligne_ouvrage = ligne_ouvrage or {}
+        reponse = self.api.post('/api/quotes/modeles/', {
+            'nom': "Salle de bain",
+            'parametres': {'surface': 10},
+            'lots': [{'nom': "Carrelage", 'ordre': 1, 'lignes': [
+                {'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '1.5', 'parametre': 'surface',
+                 'ordre': 1, **ligne_ouvrage},
+                {'type': 'manuel', 'description': "Nettoyage", 'unite': 'forfait', 'quantite': '1',
+                 'prix_unitaire': '80', 'debourse': '50', 'ordre': 2},
+            ]}],
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201)
+        return ModeleDevis.objects.get(pk=reponse.data['id'])
+
+    def appliquer(self, modele, parametres=None):
+        return self.api.post(
+            f'/api/quotes/devis/{self.devis.pk}/apply_template/',
+            {'modele': modele.pk, 'parametres': parametres or {}}, format='json'
+        )
+
+    def lignes(self):
+        return list(
+            LigneDevis.objects.filter(lot__devis=self.devis).order_by('ordre')
+            .values_list('type', 'description', 'quantite', 'prix_unitaire', 'debourse')
+        )
+
+    def test_ligne_ouvrage_reprend_la_designation(self):
+        modele = self.creer_modele()
+        ligne = ModeleLigne.objects.get(lot__modele=modele, type='ouvrage')
+        self.assertEqual((ligne.description, ligne.unite), ("Mur", 'm2'))
+        self.assertIsNone(ligne.prix_unitaire)
+
+    def test_instanciation_avec_parametres(self):
+        modele = self.creer_modele()
+        reponse = self.appliquer(modele, {'surface': '12'})
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual([lot['nom'] for lot in reponse.data['lots']], ["Carrelage"])
+        self.assertEqual(self.lignes(), [
+            ('ouvrage', "Mur", Decimal('18'), Decimal('64.29'), Decimal('45')),
+            ('manuel', "Nettoyage", Decimal('1'), Decimal('80'), Decimal('50')),
+        ])
+        self.assertEqual(reponse.data['devis']['total_ht'], '1237.22')
+
+    def test_parametre_inconnu(self):
+        reponse = self.appliquer(self.creer_modele(), {'hauteur': '2'})
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('parametres', reponse.data)
+        self.assertEqual(self.lignes(), [])
+
+    def test_ouvrage_supprime_sans_prix(self):
+        modele = self.creer_modele()
+        Ouvrage.objects.filter(pk=self.ouvrage.pk).delete()
+        reponse = self.appliquer(modele)
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('detail', reponse.data)
+        self.assertEqual(self.lignes(), [])
+
+    def test_ouvrage_supprime_avec_prix(self):
+        modele = self.creer_modele({'prix_unitaire': '70', 'debourse': '40'})
+        Ouvrage.objects.filter(pk=self.ouvrage.pk).delete()
+        self.assertEqual(self.appliquer(modele).status_code, 201)
+        self.assertEqual(self.lignes()[0], ('manuel', "Mur", Decimal('15'), Decimal('70'), Decimal('40')))
+
+    def test_modele_depuis_un_devis(self):
+        lot = creer_lot(self.devis)
+        creer_ligne_ouvrage(lot, self.ouvrage, '4')
+        creer_ligne(lot, '2', prix_unitaire='10', debourse='6', description="Évacuation", ordre=2048)
+        url = f'/api/quotes/devis/{self.devis.pk}/save_as_template/'
+
+        reponse = self.api.post(url, {'nom': "Mur standard"}, format='json')
+        self.assertEqual(reponse.status_code, 201)
+        lignes = list(
+            ModeleLigne.objects.filter(lot__modele_id=reponse.data['id']).order_by('ordre')
+            .values_list('type', 'ouvrage_id', 'description', 'prix_unitaire', 'debourse')
+        )
+        self.assertEqual(lignes, [
+            ('ouvrage', self.ouvrage.pk, "Mur", None, None),
+            ('manuel', None, "Évacuation", Decimal('10'), Decimal('6')),
+        ])
+        self.assertEqual(self.api.post(url, {'nom': "Mur standard"}, format='json').status_code, 400)
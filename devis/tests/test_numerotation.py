@@ -0,0 +1,62 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from ..models import CompteurNumeroDevis, Devis
+from ..numerotation import attribuer_numero, entreprise_utilisateur, numero_reserve
+from .donnees import client_api, creer_client, creer_devis
+
+
+class NumerotationTests(TestCase):
+    """
+    Attribution des numéros côté serveur et numéros saisis à la main.
+    """
+    def setUp(self):
+        self.annee = date.today().year
+        self.client_devis = creer_client()
+        self.api = client_api(company="Bâti Sud")
+
+    def creer(self, **donnees):
+        return self.api.post(
+            '/api/quotes/devis/', {'client': str(self.client_devis.pk), 'objet': "x", **donnees}, format='json'
+        )
+
+    def test_numeros_successifs(self):
+        self.assertEqual(attribuer_numero(), f"DEV-{self.annee}-00001")
+        self.assertEqual(attribuer_numero(), f"DEV-{self.annee}-00002")
+
+    def test_compteur_initialise_apres_les_numeros_existants(self):
+        creer_devis(self.client_devis, f"DEV-{self.annee}-00007")
+        self.assertEqual(attribuer_numero(), f"DEV-{self.annee}-00008")
+
+    def test_numero_deja_pris_saute(self):
+        self.assertEqual(attribuer_numero(), f"DEV-{self.annee}-00001")
+        creer_devis(self.client_devis, f"DEV-{self.annee}-00002")
+        self.assertEqual(attribuer_numero(), f"DEV-{self.annee}-00003")
+
+    def test_creation_attribue_un_numero(self):
+        reponse = self.creer()
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.data['numero'], f"DEV-{self.annee}-00001")
+
+    def test_numero_manuel(self):
+        self.assertEqual(self.creer(numero="MANUEL-1").status_code, 201)
+        self.assertEqual(self.creer(numero="MANUEL-1").status_code, 400)
+
+    def test_numero_manuel_au_format_automatique_refuse(self):
+        reponse = self.creer(numero=f"DEV-{self.annee}-00004")
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('numero', reponse.data)
+        self.assertEqual(self.creer().data['numero'], f"DEV-{self.annee}-00001")
+
+    @override_settings(DEVIS_NUMEROTATION_PAR_ENTREPRISE=True)
+    def test_numerotation_par_entreprise(self):
+        self.assertEqual(self.creer().data['numero'], f"DEV-BATI-SUD-{self.annee}-00001")
+        self.assertEqual(CompteurNumeroDevis.objects.get(entreprise='BATI-SUD').dernier_numero, 1)
+
+    @override_settings(DEVIS_NUMEROTATION_PAR_ENTREPRISE=True)
+    def test_cle_entreprise_tronquee(self):
+        self.api.utilisateur.company = "Société anonyme de construction, de rénovation et de travaux publics"
+        numero = attribuer_numero(entreprise_utilisateur(self.api.utilisateur))
+        self.assertLessEqual(len(numero), Devis._meta.get_field('numero').max_length)
+        self.assertTrue(numero_reserve(numero))
@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import Devis, LigneDevis, Lot
+from ..ordonnancement import PAS_ORDRE
+from ..totaux import totaux_divergents
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class OperationsTests(TestCase):
+    """
+    Application d'une suite d'opérations d'édition en une transaction.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'E1')
+        self.lot = creer_lot(self.devis)
+        self.ligne = creer_ligne(self.lot, '3', description="L1", ordre=PAS_ORDRE)
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/operations/'
+
+    def envoyer(self, operations):
+        return self.api.post(self.url, {'operations': operations}, format='json')
+
+    def test_operations_avec_references(self):
+        reponse = self.envoyer([
+            {'op': 'add', 'cible': 'lot', 'ref': 'so', 'donnees': {'nom': "Second œuvre"}},
+            {'op': 'add', 'cible': 'ligne', 'ref': 'l2', 'donnees': {
+                'lot': 'so', 'type': 'manuel', 'description': "L2", 'quantite': '2',
+                'unite': 'u', 'prix_unitaire': '5', 'debourse': '3'
+            }},
+            {'op': 'update', 'cible': 'ligne', 'id': self.ligne.pk, 'donnees': {'quantite': '4'}},
+            {'op': 'move', 'cible': 'ligne', 'id': self.ligne.pk, 'lot': 'so', 'apres': 'l2'},
+        ])
+        self.assertEqual(reponse.status_code, 200)
+        nouveau_lot = Lot.objects.get(pk=reponse.data['references']['so'])
+        self.assertEqual(nouveau_lot.devis_id, self.devis.pk)
+        self.assertEqual(
+            list(nouveau_lot.lignes.order_by('ordre').values_list('description', flat=True)), ["L2", "L1"]
+        )
+        self.assertEqual(reponse.data['references']['l2'], LigneDevis.objects.get(description="L2").pk)
+        self.assertEqual(Devis.objects.get(pk=self.devis.pk).total_ht, Decimal('50'))
+        lots, devis = totaux_divergents()
+        self.assertEqual(list(lots), [])
+        self.assertEqual(list(devis), [])
+
+    def test_suppression_d_un_lot_et_de_ses_lignes(self):
+        reponse = self.envoyer([{'op': 'delete', 'cible': 'lot', 'id': self.lot.pk}])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertFalse(Lot.objects.filter(pk=self.lot.pk).exists())
+        self.assertFalse(LigneDevis.objects.filter(pk=self.ligne.pk).exists())
+        self.assertEqual(Devis.objects.get(pk=self.devis.pk).total_ht, Decimal('0'))
+
+    def test_operation_invalide_annule_l_ensemble(self):
+        reponse = self.envoyer([
+            {'op': 'update', 'cible': 'ligne', 'id': self.ligne.pk, 'donnees': {'quantite': '9'}},
+            {'op': 'delete', 'cible': 'lot', 'id': 0},
+        ])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(reponse.data['operation'], 1)
+        self.assertEqual(LigneDevis.objects.get(pk=self.ligne.pk).quantite, Decimal('3'))
+        self.assertEqual(Devis.objects.get(pk=self.devis.pk).total_ht, Decimal('30'))
+
+    def test_operation_mal_formee(self):
+        self.assertEqual(self.envoyer([]).status_code, 400)
+        reponse = self.envoyer([{'op': 'rename', 'cible': 'lot', 'id': self.lot.pk}])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('op', reponse.data['erreurs'])
+
+    def test_element_d_un_autre_devis(self):
+        autre_lot = creer_lot(creer_devis(self.devis.client, 'E2'))
+        reponse = self.envoyer([{'op': 'delete', 'cible': 'lot', 'id': autre_lot.pk}])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertTrue(Lot.objects.filter(pk=autre_lot.pk).exists())
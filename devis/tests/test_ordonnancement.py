@@ -0,0 +1,90 @@
+from django.test import TestCase
+
+from ..models import LigneDevis, Lot
+from ..ordonnancement import PAS_ORDRE, PlacementInvalide, cle_entre, placer
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class CleEntreTests(TestCase):
+    """
+    Calcul d'une clé entre deux clés voisines.
+    """
+    def test_cles(self):
+        self.assertEqual(cle_entre(None, None), PAS_ORDRE)
+        self.assertEqual(cle_entre(PAS_ORDRE, None), 2 * PAS_ORDRE)
+        self.assertEqual(cle_entre(None, PAS_ORDRE), PAS_ORDRE // 2)
+        self.assertEqual(cle_entre(PAS_ORDRE, 2 * PAS_ORDRE), 1536)
+        self.assertIsNone(cle_entre(5, 6))
+
+
+class DeplacementTests(TestCase):
+    """
+    Déplacement des lots et des lignes entre deux voisins.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'O1')
+        self.lots = [creer_lot(self.devis, f"Lot {rang}", ordre=rang * PAS_ORDRE) for rang in (1, 2, 3)]
+        self.lignes = [creer_ligne(self.lots[0], '1', description=f"L{rang}", ordre=rang * PAS_ORDRE) for rang in (1, 2, 3)]
+        self.api = client_api()
+
+    def noms_lots(self):
+        return list(Lot.objects.filter(devis=self.devis).order_by('ordre').values_list('nom', flat=True))
+
+    def descriptions(self, lot):
+        return list(LigneDevis.objects.filter(lot=lot).order_by('ordre').values_list('description', flat=True))
+
+    def test_deplacer_un_lot_ne_modifie_que_lui(self):
+        ordres = dict(Lot.objects.values_list('pk', 'ordre'))
+        reponse = self.api.post(f'/api/quotes/lots/{self.lots[2].pk}/move/', {'apres': self.lots[0].pk}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.noms_lots(), ["Lot 1", "Lot 3", "Lot 2"])
+        modifies = {pk for pk, ordre in Lot.objects.values_list('pk', 'ordre') if ordres[pk] != ordre}
+        self.assertEqual(modifies, {self.lots[2].pk})
+
+    def test_voisins_invalides(self):
+        url = f'/api/quotes/lots/{self.lots[2].pk}/move/'
+        self.assertEqual(self.api.post(url, {'apres': 0}, format='json').status_code, 400)
+        reponse = self.api.post(url, {'apres': self.lots[0].pk, 'avant': self.lots[2].pk}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(self.noms_lots(), ["Lot 1", "Lot 2", "Lot 3"])
+
+    def test_renumerotation_quand_l_ecart_est_epuise(self):
+        Lot.objects.filter(pk=self.lots[1].pk).update(ordre=PAS_ORDRE + 1)
+        placer(self.lots[2], Lot.objects.filter(devis=self.devis), apres_id=self.lots[0].pk)
+        Lot.objects.filter(pk=self.lots[2].pk).update(ordre=self.lots[2].ordre)
+        self.assertEqual(self.noms_lots(), ["Lot 1", "Lot 3", "Lot 2"])
+        self.assertEqual(
+            sorted(Lot.objects.filter(devis=self.devis).values_list('ordre', flat=True)),
+            [PAS_ORDRE, 1536, 2 * PAS_ORDRE]
+        )
+
+    def test_placer_hors_conteneur(self):
+        autre_lot = creer_lot(creer_devis(self.devis.client, 'O2'))
+        with self.assertRaises(PlacementInvalide):
+            placer(self.lots[0], Lot.objects.filter(devis=self.devis), apres_id=autre_lot.pk)
+
+    def test_deplacer_une_ligne_vers_un_autre_lot(self):
+        reponse = self.api.post(
+            f'/api/quotes/lignes/{self.lignes[0].pk}/move/', {'lot': self.lots[1].pk, 'apres': None}, format='json'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.descriptions(self.lots[0]), ["L2", "L3"])
+        self.assertEqual(self.descriptions(self.lots[1]), ["L1"])
+        self.lots[1].refresh_from_db()
+        self.assertEqual(self.lots[1].total_ht, 10)
+
+    def test_deplacer_une_ligne_vers_le_lot_d_un_autre_devis(self):
+        autre_lot = creer_lot(creer_devis(self.devis.client, 'O2'))
+        reponse = self.api.post(
+            f'/api/quotes/lignes/{self.lignes[0].pk}/move/', {'lot': autre_lot.pk}, format='json'
+        )
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_reordonner_les_lignes(self):
+        ids = [self.lignes[2].pk, self.lignes[0].pk, self.lignes[1].pk]
+        reponse = self.api.post(
+            f'/api/quotes/devis/{self.devis.pk}/lines/reorder/', {'lot_id': self.lots[0].pk, 'ligne_ids': ids},
+            format='json'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.descriptions(self.lots[0]), ["L3", "L1", "L2"])
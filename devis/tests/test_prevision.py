@@ -0,0 +1,96 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import LigneDevis, PrevisionAchat
+from .donnees import creer_client, creer_devis, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class PrevisionTests(TestCase):
+    """
+    Prévision d'achats des devis acceptés, ajustée par différence.
+    """
+    def setUp(self):
+        self.mois = date(2026, 3, 1)
+        self.client_devis = creer_client()
+        self.ouvrage = creer_ouvrage()
+        self.devis = creer_devis(self.client_devis, 'P1', statut='accepté', date_validite=date(2026, 3, 15))
+        self.lot = creer_lot(self.devis)
+
+    def prevision(self):
+        """
+        Quantités prévues non nulles : {(mois, modèle de l'élément): quantité}.
+        """
+        return {
+            (prevision.mois, prevision.element_type.model): prevision.quantite
+            for prevision in PrevisionAchat.objects.exclude(quantite=0).select_related('element_type')
+        }
+
+    def assertPrevision(self, fourniture, main_oeuvre, mois=None):
+        attendu = {}
+        if fourniture:
+            attendu[(mois or self.mois, 'fourniture')] = Decimal(fourniture)
+        if main_oeuvre:
+            attendu[(mois or self.mois, 'mainoeuvre')] = Decimal(main_oeuvre)
+        self.assertEqual(self.prevision(), attendu)
+
+    def test_lignes_du_devis_accepte(self):
+        ligne = creer_ligne_ouvrage(self.lot, self.ouvrage, '2')
+        self.assertPrevision('20', '1')
+
+        ligne = LigneDevis.objects.get(pk=ligne.pk)
+        ligne.quantite = Decimal('3')
+        ligne.save()
+        self.assertPrevision('30', '1.5')
+
+        ligne.delete()
+        self.assertPrevision(None, None)
+
+    def test_ligne_deplacee_vers_un_brouillon(self):
+        brouillon = creer_devis(self.client_devis, 'P2')
+        lot_brouillon = creer_lot(brouillon)
+        ligne = creer_ligne_ouvrage(self.lot, self.ouvrage, '2')
+
+        ligne = LigneDevis.objects.get(pk=ligne.pk)
+        ligne.lot = lot_brouillon
+        ligne.save()
+        self.assertPrevision(None, None)
+
+        ligne.lot = self.lot
+        ligne.save()
+        self.assertPrevision('20', '1')
+
+    def test_changements_de_statut_et_de_mois(self):
+        creer_ligne_ouvrage(self.lot, self.ouvrage, '2')
+
+        self.devis.statut = 'refusé'
+        self.devis.save()
+        self.assertPrevision(None, None)
+
+        self.devis.statut = 'accepté'
+        self.devis.save()
+        self.assertPrevision('20', '1')
+
+        self.devis.date_validite = date(2026, 5, 2)
+        self.devis.save()
+        self.assertPrevision('20', '1', mois=date(2026, 5, 1))
+
+    def test_suppression_et_deplacement_de_lot(self):
+        brouillon = creer_devis(self.client_devis, 'P2')
+        autre_lot = creer_lot(self.devis, "Second œuvre", ordre=2048)
+        creer_ligne_ouvrage(self.lot, self.ouvrage, '2')
+        creer_ligne_ouvrage(autre_lot, self.ouvrage, '1')
+        self.assertPrevision('30', '1.5')
+
+        autre_lot.devis = brouillon
+        autre_lot.save()
+        self.assertPrevision('20', '1')
+
+        self.lot.delete()
+        self.assertPrevision(None, None)
+
+    def test_suppression_du_devis(self):
+        creer_ligne_ouvrage(self.lot, self.ouvrage, '2')
+        self.devis.delete()
+        self.assertPrevision(None, None)
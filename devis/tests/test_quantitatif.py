@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class QuantitatifTests(TestCase):
+    """
+    Quantités de fournitures et heures de main d'œuvre d'un devis.
+    """
+    def setUp(self):
+        client = creer_client()
+        ouvrage = creer_ouvrage()
+        self.devis = creer_devis(client, 'Q1')
+        lot = creer_lot(self.devis)
+        creer_ligne_ouvrage(lot, ouvrage, '2')
+        creer_ligne_ouvrage(creer_lot(self.devis, "Second œuvre", ordre=2048), ouvrage, '3')
+        creer_ligne(lot, '7')
+        creer_ligne_ouvrage(creer_lot(creer_devis(client, 'Q2')), ouvrage, '100')
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/takeoff/'
+
+    def test_quantites_et_couts(self):
+        reponse = self.api.get(self.url)
+        self.assertEqual(reponse.status_code, 200)
+        elements = [
+            (element['nature'], element['unite'], element['quantite'], element['cout'])
+            for element in reponse.data['elements']
+        ]
+        self.assertEqual(elements, [
+            ('fourniture', 'kg', Decimal('50'), Decimal('125')),
+            ('main_oeuvre', 'h', Decimal('2.5'), Decimal('100')),
+        ])
+        self.assertEqual(reponse.data['cout_total'], Decimal('225'))
+
+    def test_export_csv(self):
+        reponse = self.api.get(self.url, {'export': 'csv'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('quantitatif_Q1.csv', reponse['Content-Disposition'])
+        lignes = reponse.content.decode('utf-8').splitlines()
+        self.assertEqual(lignes[0], 'nature;element_id;nom;unite;quantite;prix_unitaire;cout')
+        self.assertEqual(len(lignes), 3)
+        self.assertTrue(lignes[1].startswith('fourniture;'))
+
+    def test_devis_sans_ouvrage(self):
+        devis = creer_devis(self.devis.client, 'Q3')
+        creer_ligne(creer_lot(devis), '1')
+        reponse = self.api.get(f'/api/quotes/devis/{devis.pk}/takeoff/')
+        self.assertEqual(reponse.data['elements'], [])
+        self.assertEqual(reponse.data['cout_total'], Decimal('0'))
@@ -0,0 +1,65 @@
+from django.test import TestCase
+
+from ..models import Devis, LigneDevis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class RechercheTests(TestCase):
+    """
+    Recherche ?search= sur le document de chaque devis, reconstruit à la validation
+    de la transaction qui l'a invalidé.
+    """
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_devis = creer_client("Bâtisseurs")
+            self.devis = creer_devis(self.client_devis, 'D1', objet="Maison")
+            self.ligne = creer_ligne(creer_lot(self.devis, "Charpente"), '1', description="Poutre chêne")
+            self.autre = creer_devis(creer_client("Autre", siret="98765432100010"), 'D2', objet="Garage")
+        self.api = client_api()
+
+    def rechercher(self, texte):
+        reponse = self.api.get('/api/quotes/devis/', {'search': texte})
+        self.assertEqual(reponse.status_code, 200)
+        resultats = reponse.data['results'] if isinstance(reponse.data, dict) else reponse.data
+        return sorted(devis['numero'] for devis in resultats)
+
+    def document(self, devis):
+        return Devis.objects.values_list('document_recherche', 'document_a_jour').get(pk=devis.pk)
+
+    def test_recherche_dans_les_lots_et_les_lignes(self):
+        self.assertEqual(self.rechercher("chêne"), ['D1'])
+        self.assertEqual(self.rechercher("charpente poutre"), ['D1'])
+        self.assertEqual(self.rechercher("Bâtisseurs"), ['D1'])
+        self.assertEqual(self.rechercher("garage"), ['D2'])
+        self.assertEqual(self.rechercher("sapin"), [])
+
+    def test_modification_d_une_ligne(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ligne = LigneDevis.objects.get(pk=self.ligne.pk)
+            ligne.description = "Poutre sapin"
+            ligne.save()
+        self.assertEqual(self.rechercher("sapin"), ['D1'])
+        self.assertEqual(self.rechercher("chêne"), [])
+
+    def test_seuls_les_devis_invalides_sont_reconstruits(self):
+        Devis.objects.filter(pk=self.autre.pk).update(document_a_jour=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            creer_ligne(self.ligne.lot, '1', description="Tuiles")
+        self.assertTrue(self.document(self.devis)[1])
+        self.assertIn("Tuiles", self.document(self.devis)[0])
+        self.assertFalse(self.document(self.autre)[1])
+
+    def test_commentaire_sans_invalidation(self):
+        with self.captureOnCommitCallbacks() as rappels:
+            devis = Devis.objects.get(pk=self.devis.pk)
+            devis.commentaire = "Relancer en mars"
+            devis.save()
+        self.assertEqual(rappels, [])
+        self.assertTrue(self.document(self.devis)[1])
+
+    def test_renommage_du_client(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_devis.nom = "Charpentiers"
+            self.client_devis.save()
+        self.assertEqual(self.rechercher("Charpentiers"), ['D1'])
+        self.assertEqual(self.rechercher("Bâtisseurs"), [])
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bibliotheque.models import Fourniture
+
+from ..models import LigneDevis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class ReevaluationTests(TestCase):
+    """
+    Réévaluation du déboursé des lignes 'ouvrage' aux prix actuels de la bibliothèque.
+    """
+    def setUp(self):
+        client = creer_client()
+        ouvrage = creer_ouvrage()
+        self.lignes = {}
+        for numero, statut in (('R1', 'brouillon'), ('R2', 'brouillon'), ('R3', 'envoyé')):
+            devis = creer_devis(client, numero, statut=statut)
+            self.lignes[numero] = creer_ligne_ouvrage(creer_lot(devis), ouvrage, '2')
+        # 10 kg à 3,50 et 0,5 h à 40 : 55 de déboursé au lieu de 45
+        Fourniture.objects.update(prix_achat_ht=Decimal('3.50'))
+
+    def debourse(self, numero):
+        return LigneDevis.objects.get(pk=self.lignes[numero].pk).debourse
+
+    def test_reevaluation_d_un_devis_en_brouillon(self):
+        devis = self.lignes['R1'].lot.devis
+        reponse = client_api().post(f'/api/quotes/devis/{devis.pk}/reprice/')
+        self.assertEqual(reponse.status_code, 200)
+        rapport, = reponse.data['devis']
+        self.assertEqual(rapport['lignes_modifiees'], 1)
+        self.assertEqual(rapport['debourse_avant'], Decimal('90'))
+        self.assertEqual(rapport['debourse_apres'], Decimal('110'))
+        self.assertEqual(self.debourse('R1'), Decimal('55'))
+        self.assertEqual(self.debourse('R2'), Decimal('45'))
+
+    def test_devis_envoye_non_reevalue(self):
+        devis = self.lignes['R3'].lot.devis
+        reponse = client_api().post(f'/api/quotes/devis/{devis.pk}/reprice/')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(self.debourse('R3'), Decimal('45'))
+
+    def test_reevaluation_d_une_liste_de_brouillons(self):
+        ids = [self.lignes[numero].lot.devis_id for numero in ('R2', 'R3')]
+        reponse = client_api().post('/api/quotes/devis/reprice_drafts/', {'devis': ids}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([rapport['numero'] for rapport in reponse.data['devis']], ['R2'])
+        self.assertEqual(self.debourse('R1'), Decimal('45'))
+        self.assertEqual(self.debourse('R2'), Decimal('55'))
+        self.assertEqual(self.debourse('R3'), Decimal('45'))
+
+    def test_liste_invalide(self):
+        reponse = client_api().post('/api/quotes/devis/reprice_drafts/', {'devis': ['x']}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('devis', reponse.data)
+
+    def test_tous_les_brouillons_reserve_aux_administrateurs(self):
+        reponse = client_api().post('/api/quotes/devis/reprice_drafts/', {}, format='json')
+        self.assertEqual(reponse.status_code, 403)
+        self.assertEqual(self.debourse('R1'), Decimal('45'))
+
+        reponse = client_api('admin@b.fr', is_staff=True).post('/api/quotes/devis/reprice_drafts/', {}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([rapport['numero'] for rapport in reponse.data['devis']], ['R1', 'R2'])
+        self.assertEqual(self.debourse('R3'), Decimal('45'))
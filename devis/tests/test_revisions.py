@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import Devis, LigneDevis, RevisionDevis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class RevisionsTests(TestCase):
+    """
+    Révisions figées d'un devis : capture, liste, lecture et comparaison.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'V1')
+        self.lot = creer_lot(self.devis)
+        self.ligne = creer_ligne(self.lot, '3', description="Dalle")
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/revisions/'
+
+    def envoyer(self):
+        devis = Devis.objects.get(pk=self.devis.pk)
+        devis.statut = 'envoyé'
+        devis.save()
+
+    def test_capture_a_l_envoi(self):
+        self.envoyer()
+        revision = RevisionDevis.objects.get(devis=self.devis)
+        self.assertEqual((revision.numero, revision.motif, revision.statut), (1, 'envoi', 'envoyé'))
+        self.assertEqual(revision.total_ht, Decimal('30'))
+        self.assertEqual(revision.nombre_lignes, 1)
+
+        # Un enregistrement sans changement de statut ne capture rien
+        devis = Devis.objects.get(pk=self.devis.pk)
+        devis.commentaire = "Relance"
+        devis.save()
+        self.assertEqual(RevisionDevis.objects.filter(devis=self.devis).count(), 1)
+
+    def test_capture_manuelle_et_liste(self):
+        reponse = self.api.post(self.url)
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.data['numero'], 1)
+        self.assertEqual(reponse.data['auteur'], self.api.utilisateur.pk)
+        self.envoyer()
+
+        reponse = self.api.get(self.url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([(r['numero'], r['motif']) for r in reponse.data], [(1, 'manuel'), (2, 'envoi')])
+        self.assertNotIn('donnees', reponse.data[0])
+
+    def test_lecture_figee(self):
+        self.api.post(self.url)
+        LigneDevis.objects.get(pk=self.ligne.pk).delete()
+
+        reponse = self.api.get(f'{self.url}1/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['numero'], 'V1')
+        self.assertEqual([ligne['description'] for ligne in reponse.data['lots'][0]['lignes']], ["Dalle"])
+        self.assertEqual(self.api.get(f'{self.url}2/').status_code, 404)
+
+    def test_comparaison_de_deux_revisions(self):
+        self.api.post(self.url)
+        ligne = LigneDevis.objects.get(pk=self.ligne.pk)
+        ligne.quantite = Decimal('5')
+        ligne.save()
+        creer_ligne(self.lot, '1', description="Chape", ordre=2048)
+        self.api.post(self.url)
+
+        reponse = self.api.get(f'{self.url}diff/', {'de': 1, 'a': 2})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([ligne['description'] for ligne in reponse.data['lignes']['ajoutes']], ["Chape"])
+        modifiee, = reponse.data['lignes']['modifies']
+        self.assertEqual(modifiee['id'], self.ligne.pk)
+        self.assertIn('quantite', modifiee['changements'])
+        self.assertIn('total_ht', reponse.data['devis'])
+
+        self.assertEqual(self.api.get(f'{self.url}diff/', {'de': 1}).status_code, 400)
+        self.assertEqual(self.api.get(f'{self.url}diff/', {'de': 1, 'a': 9}).status_code, 404)
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bibliotheque.models import Categorie
+
+from ..models import Devis
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_ligne_ouvrage, creer_lot, creer_ouvrage
+
+
+class SimulationTests(TestCase):
+    """
+    Scénarios de prix évalués sur un devis sans rien modifier.
+    """
+    def setUp(self):
+        self.devis = creer_devis(creer_client(), 'S1')
+        lot = creer_lot(self.devis)
+        # Déboursé : 2 × (25 de fourniture + 20 de main d'œuvre) + 6 pour la ligne manuelle
+        creer_ligne_ouvrage(lot, creer_ouvrage(), '2')
+        creer_ligne(lot, '1', prix_unitaire='10', debourse='6')
+        self.api = client_api()
+        self.url = f'/api/quotes/devis/{self.devis.pk}/simulate/'
+
+    def simuler(self, *scenarios):
+        reponse = self.api.post(self.url, {'scenarios': list(scenarios)}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.data
+
+    def test_reference_et_scenarios(self):
+        categorie = Categorie.objects.get(nom="Maçonnerie")
+        resultat = self.simuler(
+            {'nom': "Main d'œuvre", 'main_oeuvre': '10'},
+            {'nom': "Fournitures", 'fournitures': '10'},
+            {'nom': "Maçonnerie", 'categories': {str(categorie.pk): '10'}},
+            {'nom': "Marge", 'marge': '25'},
+        )
+        self.assertEqual(resultat['reference']['total_debourse'], Decimal('96'))
+        self.assertEqual(resultat['reference']['total_ht'], Decimal('138.58'))
+        self.assertEqual(
+            [scenario['total_debourse'] for scenario in resultat['scenarios']],
+            [Decimal('100'), Decimal('101'), Decimal('105'), Decimal('96')]
+        )
+        self.assertEqual(resultat['scenarios'][0]['ecart_debourse'], Decimal('4'))
+        self.assertEqual(resultat['scenarios'][0]['total_ht'], Decimal('138.58'))
+        self.assertEqual(resultat['scenarios'][3]['total_ht'], Decimal('128'))
+
+    def test_aucune_ecriture(self):
+        self.simuler({'marge': '50'})
+        devis = Devis.objects.get(pk=self.devis.pk)
+        self.assertEqual(devis.total_ht, Decimal('138.58'))
+        self.assertEqual(devis.total_debourse, Decimal('96'))
+
+    def test_scenarios_invalides(self):
+        reponse = self.api.post(self.url, {'scenarios': []}, format='json')
+        self.assertEqual(reponse.status_code, 400)
+        reponse = self.api.post(self.url, {'scenarios': [{'categories': {'x': '5'}}]}, format='json')
+        self.assertEqual(reponse.status_code, 400)
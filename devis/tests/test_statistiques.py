@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.db.models import F
+from django.test import TestCase
+
+from .. import statistiques
+from ..models import Devis, StatistiquesDevis
+from ..statistiques import CLE_GLOBALE, obtenir_statistiques
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class StatistiquesTests(TestCase):
+    """
+    Statistiques des devis par requêtes groupées, conservées en instantanés.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.autre_client = creer_client("Durand", "98765432100010")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.accepte = creer_devis(self.client_devis, 'S1', statut='accepté')
+            creer_ligne(creer_lot(self.accepte), '10', prix_unitaire='10', debourse='6')
+            brouillon = creer_devis(self.autre_client, 'S2')
+            creer_ligne(creer_lot(brouillon), '1', prix_unitaire='100', debourse='50')
+
+    def test_repartition_par_statut(self):
+        resultat = obtenir_statistiques()
+        self.assertEqual(resultat['total_devis'], 2)
+        self.assertEqual(resultat['devis_par_statut']['accepté'], 1)
+        self.assertEqual(resultat['montant_total_ht'], 200)
+        self.assertEqual(resultat['par_statut']['accepté']['marge_moyenne'], 40)
+        self.assertEqual(resultat['par_statut']['brouillon']['debourse'], 50)
+        self.assertEqual(len(resultat['serie_mensuelle']), 1)
+        self.assertEqual(resultat['serie_mensuelle'][0]['nombre'], 2)
+
+    def test_statistiques_d_un_client(self):
+        resultat = obtenir_statistiques(self.client_devis.pk)
+        self.assertEqual(resultat['total_devis'], 1)
+        self.assertEqual(resultat['montant_total_ht'], 100)
+
+    def test_instantane_relu_sans_recalcul(self):
+        obtenir_statistiques()
+        with self.assertNumQueries(1):
+            self.assertEqual(obtenir_statistiques()['total_devis'], 2)
+
+    def test_invalidation_apres_validation(self):
+        obtenir_statistiques()
+        instantane = StatistiquesDevis.objects.get(cle=CLE_GLOBALE)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            creer_ligne(self.accepte.lots.get(), '5', prix_unitaire='10', debourse='6')
+        instantane_perime = StatistiquesDevis.objects.get(cle=CLE_GLOBALE)
+        self.assertFalse(instantane_perime.a_jour)
+        self.assertEqual(instantane_perime.generation, instantane.generation + 1)
+        self.assertEqual(obtenir_statistiques()['montant_total_ht'], 250)
+
+    def test_modification_sans_incidence_conserve_l_instantane(self):
+        obtenir_statistiques()
+        devis = Devis.objects.get(pk=self.accepte.pk)
+        devis.commentaire = "Relance"
+        with self.captureOnCommitCallbacks(execute=True):
+            devis.save()
+        self.assertTrue(StatistiquesDevis.objects.get(cle=CLE_GLOBALE).a_jour)
+
+    def test_recalcul_concurrent_non_enregistre(self):
+        calculer = statistiques.calculer_statistiques
+
+        def calculer_puis_invalider(client_id=None):
+            # Invalidation survenue pendant le calcul
+            donnees = calculer(client_id)
+            StatistiquesDevis.objects.update(generation=F('generation') + 1)
+            return donnees
+
+        with mock.patch.object(statistiques, 'calculer_statistiques', calculer_puis_invalider):
+            self.assertEqual(obtenir_statistiques()['total_devis'], 2)
+        self.assertFalse(StatistiquesDevis.objects.get(cle=CLE_GLOBALE).a_jour)
+
+    def test_endpoint(self):
+        api = client_api()
+        self.assertEqual(api.get('/api/quotes/devis/stats/').data['total_devis'], 2)
+        self.assertEqual(api.get('/api/quotes/devis/stats/', {'client': 'x'}).status_code, 400)
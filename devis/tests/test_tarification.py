@@ -0,0 +1,56 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from bibliotheque.models import Fourniture
+
+from .. import tarification
+from ..models import LigneDevis
+from ..tarification import tarif_ouvrage, tarifs_memorises
+from .donnees import client_api, creer_client, creer_devis, creer_lot, creer_ouvrage
+
+
+class TarifsMemorisesTests(TestCase):
+    """
+    Tarif d'un ouvrage calculé une seule fois par requête ou par traitement.
+    """
+    def setUp(self):
+        self.ouvrage = creer_ouvrage()
+        self.lot = creer_lot(creer_devis(creer_client(), 'A1'))
+
+    def espionner(self):
+        return mock.patch.object(tarification, 'debourses_ouvrages', wraps=tarification.debourses_ouvrages)
+
+    def test_memoire_limitee_au_bloc(self):
+        with self.espionner() as calcul:
+            with tarifs_memorises():
+                self.assertEqual(tarif_ouvrage(self.ouvrage.pk), (Decimal('45'), Decimal('64.29')))
+                with tarifs_memorises():
+                    tarif_ouvrage(self.ouvrage.pk)
+                tarif_ouvrage(self.ouvrage.pk)
+            self.assertEqual(calcul.call_count, 1)
+            tarif_ouvrage(self.ouvrage.pk)
+            tarif_ouvrage(self.ouvrage.pk)
+            self.assertEqual(calcul.call_count, 3)
+
+    def test_creation_d_une_ligne_calcule_le_tarif_une_fois(self):
+        with self.espionner() as calcul:
+            reponse = client_api().post('/api/quotes/lignes/', {
+                'lot': self.lot.pk, 'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '2'
+            }, format='json')
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(calcul.call_count, 1)
+        ligne = LigneDevis.objects.get(lot=self.lot)
+        self.assertEqual((ligne.debourse, ligne.prix_unitaire), (Decimal('45'), Decimal('64.29')))
+
+    def test_prix_de_la_bibliotheque_relu_a_chaque_requete(self):
+        api = client_api()
+        donnees = {'lot': self.lot.pk, 'type': 'ouvrage', 'ouvrage': self.ouvrage.pk, 'quantite': '1'}
+        api.post('/api/quotes/lignes/', donnees, format='json')
+        Fourniture.objects.update(prix_achat_ht=Decimal('3.50'))
+        api.post('/api/quotes/lignes/', donnees, format='json')
+        self.assertEqual(
+            list(LigneDevis.objects.filter(lot=self.lot).order_by('pk').values_list('debourse', flat=True)),
+            [Decimal('45'), Decimal('55')]
+        )
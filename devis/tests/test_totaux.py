@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..models import Devis, LigneDevis, Lot
+from ..totaux import totaux_divergents
+from .donnees import client_api, creer_client, creer_devis, creer_ligne, creer_lot
+
+
+class TotauxTests(TestCase):
+    """
+    Totaux stockés des lots et des devis, comparés aux lignes par totaux_divergents.
+    """
+    def setUp(self):
+        self.client_devis = creer_client()
+        self.devis = creer_devis(self.client_devis, 'T1')
+        self.lot = creer_lot(self.devis)
+
+    def assertTotauxCoherents(self):
+        lots, devis = totaux_divergents()
+        self.assertEqual(list(lots), [])
+        self.assertEqual(list(devis), [])
+
+    def assertTotalHT(self, objet, total):
+        objet.refresh_from_db()
+        self.assertEqual(objet.total_ht, Decimal(total))
+
+    def test_creation_modification_suppression_ligne(self):
+        ligne = creer_ligne(self.lot, '3')
+        creer_ligne(self.lot, '2', prix_unitaire='5')
+        self.assertTotalHT(self.devis, '40')
+
+        ligne = LigneDevis.objects.get(pk=ligne.pk)
+        ligne.quantite = Decimal('4')
+        ligne.save()
+        self.assertTotalHT(self.devis, '50')
+        self.assertTotalHT(self.lot, '50')
+
+        ligne.delete()
+        self.assertTotalHT(self.devis, '10')
+        self.assertTotauxCoherents()
+
+    def test_deplacement_ligne_entre_devis(self):
+        autre_devis = creer_devis(self.client_devis, 'T2')
+        autre_lot = creer_lot(autre_devis, "Second œuvre")
+        ligne = creer_ligne(self.lot, '3')
+
+        ligne = LigneDevis.objects.get(pk=ligne.pk)
+        ligne.lot = autre_lot
+        ligne.save()
+        self.assertTotalHT(self.devis, '0')
+        self.assertTotalHT(autre_devis, '30')
+        self.assertTotauxCoherents()
+
+    def test_suppression_lot(self):
+        autre_lot = creer_lot(self.devis, "Second œuvre", ordre=2048)
+        creer_ligne(self.lot, '3')
+        creer_ligne(autre_lot, '1')
+
+        autre_lot.delete()
+        self.assertTotalHT(self.devis, '30')
+        self.assertTotauxCoherents()
+
+    def test_deplacement_lot_entre_devis(self):
+        autre_devis = creer_devis(self.client_devis, 'T2')
+        creer_ligne(self.lot, '3')
+
+        reponse = client_api().patch(f'/api/quotes/lots/{self.lot.pk}/', {'devis': autre_devis.pk}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTotalHT(self.devis, '0')
+        self.assertTotalHT(autre_devis, '30')
+        self.assertTotauxCoherents()
+
+    def test_sauvegarde_complete_conserve_les_totaux(self):
+        perime = Devis.objects.get(pk=self.devis.pk)
+        lot_perime = Lot.objects.get(pk=self.lot.pk)
+        creer_ligne(self.lot, '3')
+
+        perime.objet = "Objet modifié"
+        perime.save()
+        lot_perime.nom = "Nom modifié"
+        lot_perime.save()
+        self.assertTotalHT(self.devis, '30')
+        self.assertTotalHT(self.lot, '30')
+        self.assertTotauxCoherents()
+
+    def test_modification_sans_incidence_limitee_a_l_update(self):
+        creer_ligne(self.lot, '3')
+        ligne = LigneDevis.objects.get(lot=self.lot)
+        ligne.ordre = 5
+        with self.assertNumQueries(3):
+            # SAVEPOINT, UPDATE de la ligne, RELEASE SAVEPOINT
+            ligne.save()
+        self.assertTotalHT(self.devis, '30')
@@ -0,0 +1,201 @@
+"""
+Maintenance des totaux stockés sur les lots et les devis.
+
+Les colonnes total_ht et total_debourse de Lot et Devis sont mises à jour par
+différence à chaque enregistrement ou suppression d'une ligne (voir
+LigneDevis.save et LigneDevis.delete). Les traitements en masse qui ne passent
+pas par save() (bulk_create, update sur un queryset...) doivent appeler
+recalculer_totaux() sur les devis concernés.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Devis, Lot, LigneDevis
+from .statistiques import invalider_statistiques
+
+CHAMP_TOTAL = DecimalField(max_digits=16, decimal_places=4)
+
+MONTANT_HT = ExpressionWrapper(F('prix_unitaire') * F('quantite'), output_field=CHAMP_TOTAL)
+MONTANT_DEBOURSE = ExpressionWrapper(F('debourse') * F('quantite'), output_field=CHAMP_TOTAL)
+
+
+def appliquer_delta_devis(devis_id, delta_ht, delta_debourse):
+    """
+    Ajoute une variation aux totaux stockés d'un devis.
+    """
+    if not delta_ht and not delta_debourse:
+        return
+
+    Devis.objects.filter(pk=devis_id).update(
+        total_ht=F('total_ht') + delta_ht,
+        total_debourse=F('total_debourse') + delta_debourse
+    )
+    invalider_statistiques(Devis.objects.filter(pk=devis_id).values_list('client_id', flat=True))
+
+
+def appliquer_delta_lot(lot_id, delta_ht, delta_debourse):
+    """
+    Ajoute une variation aux totaux stockés d'un lot et de son devis, sans
+    invalider les statistiques (voir reporter_variation_ligne).
+
+    Returns:
+        True si les totaux ont varié
+    """
+    if not delta_ht and not delta_debourse:
+        return False
+
+    Lot.objects.filter(pk=lot_id).update(
+        total_ht=F('total_ht') + delta_ht,
+        total_debourse=F('total_debourse') + delta_debourse
+    )
+    Devis.objects.filter(lots__pk=lot_id).update(
+        total_ht=F('total_ht') + delta_ht,
+        total_debourse=F('total_debourse') + delta_debourse
+    )
+    return True
+
+
+def reporter_variation_ligne(avant, apres):
+    """
+    Reporte sur les lots (et leurs devis) la variation d'une ligne.
+
+    Args:
+        avant: Triplet (lot_id, total HT, total déboursé) enregistré en base avant
+               la modification, ou None pour une création
+        apres: Triplet après la modification, ou None pour une suppression
+
+    Une ligne déplacée d'un lot à un autre est retirée de l'ancien lot
+    et ajoutée au nouveau. Les statistiques des clients concernés sont
+    invalidées une seule fois, et seulement si un total a varié.
+    """
+    variations = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+
+    if avant is not None:
+        lot_id, total_ht, total_debourse = avant
+        variations[lot_id][0] -= Decimal(total_ht)
+        variations[lot_id][1] -= Decimal(total_debourse)
+
+    if apres is not None:
+        lot_id, total_ht, total_debourse = apres
+        variations[lot_id][0] += Decimal(total_ht)
+        variations[lot_id][1] += Decimal(total_debourse)
+
+    lots = [
+        lot_id for lot_id, (delta_ht, delta_debourse) in variations.items()
+        if appliquer_delta_lot(lot_id, delta_ht, delta_debourse)
+    ]
+    if lots:
+        invalider_statistiques(Devis.objects.filter(lots__pk__in=lots).values_list('client_id', flat=True))
+
+
+def _somme_lignes(lien, montant):
+    """
+    Sous-requête sommant un montant sur les lignes rattachées à l'objet courant.
+
+    Args:
+        lien: Chemin de la ligne vers l'objet ('lot' ou 'lot__devis')
+        montant: Expression du montant d'une ligne
+    """
+    lignes = (
+        LigneDevis.objects.filter(**{lien: OuterRef('pk')})
+        .order_by()
+        .values(lien)
+        .annotate(total=Sum(montant))
+        .values('total')[:1]
+    )
+    return Coalesce(Subquery(lignes, output_field=CHAMP_TOTAL), Value(Decimal('0')), output_field=CHAMP_TOTAL)
+
+
+def _querysets(devis_ids=None):
+    """
+    Retourne les querysets de lots et de devis à traiter.
+    """
+    lots = Lot.objects.all()
+    devis = Devis.objects.all()
+    if devis_ids is not None:
+        lots = lots.filter(devis_id__in=devis_ids)
+        devis = devis.filter(pk__in=devis_ids)
+    return lots, devis
+
+
+def recalculer_totaux(devis_ids=None):
+    """
+    Recalcule entièrement les totaux stockés à partir des lignes,
+    en une requête UPDATE pour les lots et une pour les devis.
+
+    Args:
+        devis_ids: Liste d'IDs de devis à recalculer (tous les devis si None)
+    """
+    lots, devis = _querysets(devis_ids)
+
+    lots.update(
+        total_ht=_somme_lignes('lot', MONTANT_HT),
+        total_debourse=_somme_lignes('lot', MONTANT_DEBOURSE)
+    )
+    devis.update(
+        total_ht=_somme_lignes('lot__devis', MONTANT_HT),
+        total_debourse=_somme_lignes('lot__devis', MONTANT_DEBOURSE)
+    )
+    invalider_statistiques(devis.values_list('client_id', flat=True) if devis_ids is not None else None)
+
+
+def lignes_inserees(devis_id, lignes):
+    """
+    Répercute l'insertion en masse (bulk_create) de lignes dans un devis : totaux,
+    document de recherche, historique des prix et prévision d'achats.
+    """
+    from collections import Counter
+
+    quantites = Counter()
+    for ligne in lignes:
+        quantites[ligne.ouvrage_id] += ligne.quantite
+    quantites_inserees(devis_id, quantites)
+
+
+def quantites_inserees(devis_id, quantites):
+    """
+    Comme lignes_inserees, à partir de la quantité insérée par ouvrage
+    ({ouvrage_id: quantité}, clé None pour les lignes manuelles) : les lignes
+    elles-mêmes n'ont pas à être conservées.
+    """
+    from .historique_prix import devis_historises, invalider_historique_prix
+    from .prevision import ajuster_prevision_devis
+    from .recherche import invalider_documents
+
+    recalculer_totaux([devis_id])
+    invalider_documents(pk=devis_id)
+    if devis_historises(pk=devis_id):
+        invalider_historique_prix(list(quantites))
+    ajuster_prevision_devis(quantites, pk=devis_id)
+
+
+def totaux_divergents(devis_ids=None):
+    """
+    Compare les totaux stockés aux totaux recalculés depuis les lignes.
+
+    Returns:
+        Tuple (lots, devis) de querysets de dictionnaires décrivant chaque
+        objet dont les totaux stockés ne correspondent pas aux lignes.
+    """
+    lots, devis = _querysets(devis_ids)
+
+    lots = lots.annotate(
+        calcul_ht=_somme_lignes('lot', MONTANT_HT),
+        calcul_debourse=_somme_lignes('lot', MONTANT_DEBOURSE)
+    ).exclude(
+        total_ht=F('calcul_ht'),
+        total_debourse=F('calcul_debourse')
+    ).values('id', 'devis_id', 'total_ht', 'calcul_ht', 'total_debourse', 'calcul_debourse')
+
+    devis = devis.annotate(
+        calcul_ht=_somme_lignes('lot__devis', MONTANT_HT),
+        calcul_debourse=_somme_lignes('lot__devis', MONTANT_DEBOURSE)
+    ).exclude(
+        total_ht=F('calcul_ht'),
+        total_debourse=F('calcul_debourse')
+    ).values('id', 'numero', 'total_ht', 'calcul_ht', 'total_debourse', 'calcul_debourse')
+
+    return lots, devis
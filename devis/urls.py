@@ -1,13 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
-from .views import DevisViewSet, LotViewSet, LigneDevisViewSet, DevisLineViewSet
+from .views import DevisViewSet, LotViewSet, LigneDevisViewSet, DevisLineViewSet, ModeleDevisViewSet
 
 # Créer un routeur pour enregistrer nos ViewSets
 router = DefaultRouter()
 router.register(r'devis', DevisViewSet)
 router.register(r'lots', LotViewSet)
 router.register(r'lignes', LigneDevisViewSet)
+router.register(r'modeles', ModeleDevisViewSet)
 
 # Créer un routeur imbriqué pour les lignes de devis
 devis_router = routers.NestedSimpleRouter(router, r'devis', lookup='devis')
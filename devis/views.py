@@ -1,17 +1,139 @@
+import uuid
+from django.core.exceptions import ValidationError
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Sum, Avg, Count
+from django.db import transaction
+from django.db.models import Count, Max
 from rest_framework import viewsets, status, filters, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Devis, Lot, LigneDevis
+from .models import Devis, Lot, LigneDevis, ModeleDevis, RevisionDevis
 from .serializers import (
     DevisSerializer, DevisDetailSerializer, DevisCreateSerializer,
     LotSerializer, LotDetailSerializer,
-    LigneDevisSerializer, LigneDevisDetailSerializer, LigneDevisCreateSerializer
+    LigneDevisSerializer, LigneDevisDetailSerializer, LigneDevisCreateSerializer,
+    LigneDevisBulkSerializer, ModeleDevisSerializer, ModeleDevisDetailSerializer,
+    expansion_demandee
 )
+from .arbre import ArbreDevis, queryset_arbre
+from .recherche import RechercheDevisFilter
+from .ordonnancement import PlacementInvalide, appliquer_ordre, placer, verrouiller, PAS_ORDRE
 from bibliotheque.models import Ouvrage
-from decimal import Decimal, ROUND_HALF_UP
+from tiers.models import Tiers
+from decimal import Decimal
+
+
+def _entier(valeur):
+    """
+    Convertit un identifiant reçu dans une requête en entier, ou None s'il est invalide.
+    """
+    try:
+        return int(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+def _mois_periode(params):
+    """
+    Lit les mois de début et de fin d'une période (?debut=AAAA-MM&fin=AAAA-MM).
+    Retourne un dictionnaire {debut, fin} (mois fournis seulement), ou la réponse
+    d'erreur si un mois est invalide.
+    """
+    from datetime import datetime
+    
+    mois = {}
+    for param in ('debut', 'fin'):
+        valeur = params.get(param)
+        if not valeur:
+            continue
+        try:
+            mois[param] = datetime.strptime(valeur[:7], '%Y-%m').date()
+        except ValueError:
+            return Response(
+                {"detail": f"Le paramètre {param} doit être au format AAAA-MM"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    return mois
+
+
+def _deplacer_ligne(ligne, data, lots, context):
+    """
+    Déplace une ligne entre deux voisines, dans son lot ou dans un autre lot
+    parmi ceux autorisés. Retourne la réponse HTTP de l'action.
+    """
+    lot_id = _entier(data.get('lot')) if data.get('lot') is not None else ligne.lot_id
+    if lot_id != ligne.lot_id and not lots.filter(pk=lot_id).exists():
+        return Response(
+            {"detail": f"Le lot avec l'ID {data.get('lot')} n'appartient pas au devis de la ligne"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        with transaction.atomic():
+            verrouiller(Lot, {ligne.lot_id, lot_id})
+            placer(
+                ligne, LigneDevis.objects.filter(lot_id=lot_id),
+                apres_id=_entier(data.get('apres')),
+                avant_id=_entier(data.get('avant'))
+            )
+            if lot_id != ligne.lot_id:
+                # Changement de lot : save() reporte les totaux sur les deux lots
+                ligne.lot_id = lot_id
+                ligne.save(update_fields=['lot', 'ordre'])
+            else:
+                LigneDevis.objects.filter(pk=ligne.pk).update(ordre=ligne.ordre)
+    except PlacementInvalide as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(LigneDevisSerializer(ligne, context=context).data)
+
+
+def _preremplir_ouvrage(data):
+    """
+    Complète les champs manquants d'une ligne 'ouvrage' reçue, avant validation,
+    depuis l'ouvrage et son tarif (voir tarification.tarif_ouvrage).
+    Retourne les données et la réponse d'erreur éventuelle.
+    """
+    from .tarification import preremplir_ligne, tarif_ouvrage
+    
+    if data.get('type') != 'ouvrage' or not data.get('ouvrage'):
+        return data, None
+    
+    ouvrage_id = data.get('ouvrage')
+    ouvrage = Ouvrage.objects.filter(pk=_entier(ouvrage_id)).first()
+    if ouvrage is None:
+        # Si l'ouvrage n'existe pas, on retourne une erreur claire
+        return data, Response(
+            {"ouvrage": [f"L'ouvrage avec l'ID {ouvrage_id} n'existe pas."]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return preremplir_ligne(data, ouvrage, tarif_ouvrage(ouvrage.id)[0]), None
+
+
+class TarifsMemorisesMixin:
+    """
+    Mémorise les tarifs d'ouvrages le temps d'une requête : le pré-remplissage
+    d'une ligne et LigneDevis.save calculent chaque tarif une seule fois.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        from .tarification import tarifs_memorises
+        
+        with tarifs_memorises():
+            return super().dispatch(request, *args, **kwargs)
+
+
+def _avec_historique_prix(serializer):
+    """
+    Retourne les données d'une ligne créée, complétées de l'historique des prix
+    de son ouvrage le cas échéant.
+    """
+    from .historique_prix import obtenir_historique_prix
+    
+    data = serializer.data
+    if serializer.instance.ouvrage_id:
+        data = {**data, 'historique_prix': obtenir_historique_prix(serializer.instance.ouvrage_id)}
+    return data
+
 
 class DevisViewSet(viewsets.ModelViewSet):
     """
@@ -26,16 +148,65 @@ class DevisViewSet(viewsets.ModelViewSet):
     
     Endpoints additionnels:
     - calculations: Retourne les calculs détaillés pour un devis spécifique
+    - calculations_batch: Retourne les totaux et marges de plusieurs devis et de leurs lots
+    - operations: Applique une liste d'opérations d'édition en une transaction
+    - apply_margin: Recalcule les prix de vente des lignes selon les marges
+    - reprice / reprice_drafts: Met à jour les déboursés depuis la bibliothèque
+    - simulate: Évalue des scénarios de prix sans modifier le devis
+    - takeoff / forecast: Quantitatif d'un devis et prévision d'achats des devis acceptés
+    - revisions: Liste, capture, lecture et comparaison des révisions figées
+    - diff: Compare le contenu de deux devis ou révisions, ligne à ligne
+    - apply_template / save_as_template: Instancie un modèle de devis, ou en crée un
+    - import_dpgf: Importe un bordereau de quantités CSV ou XLSX
+    - export / export_quotes / export_lines: Exports CSV ou XLSX en flux
+    - status_history / funnel: Journal des statuts, entonnoir de conversion et délais
     - stats: Retourne des statistiques globales sur les devis
     """
-    queryset = Devis.objects.all()
+    queryset = Devis.objects.select_related('client').defer('document_recherche')
     serializer_class = DevisSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['client', 'statut']
-    search_fields = ['numero', 'objet', 'client__nom']
-    ordering_fields = ['date_creation', 'numero', 'client__nom', 'statut']
+    # La recherche (?search=) porte sur le document plein texte de chaque devis,
+    # lignes comprises (voir devis/recherche.py), et trie par pertinence
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, RechercheDevisFilter]
+    filterset_fields = {
+        'client': ['exact'],
+        'statut': ['exact'],
+        'total_ht': ['gte', 'lte'],
+        'total_debourse': ['gte', 'lte'],
+    }
+    ordering_fields = ['date_creation', 'numero', 'client__nom', 'statut', 'total_ht', 'total_debourse']
     ordering = ['-date_creation']
     
+    def get_queryset(self):
+        """
+        Précharge l'arbre complet du devis (client, lots, lignes) pour les actions
+        qui le parcourent, en un nombre fixe de requêtes.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'retrieve' and self._flux_demande():
+            # Les lots et les lignes sont lus au fil de l'eau (voir devis/flux.py)
+            queryset = self._prefetch_client(queryset.prefetch_related('client__adresses', 'client__contacts'))
+        elif self.action == 'retrieve':
+            queryset = self._queryset_detail(queryset)
+        elif self.action in ['calculations', 'pdf']:
+            queryset = queryset_arbre(queryset)
+        return queryset
+    
+    def _queryset_detail(self, queryset):
+        """
+        Queryset préchargeant tout ce que lit DevisDetailSerializer.
+        """
+        return self._prefetch_client(queryset_arbre(queryset))
+    
+    def _prefetch_client(self, queryset):
+        """
+        Précharge la vue complète du client lorsqu'elle est demandée (?expand=client).
+        """
+        if not expansion_demandee(self.request, 'client'):
+            return queryset
+        return queryset.select_related('client__assigned_user').prefetch_related(
+            'client__activites__utilisateur'
+        )
+    
     def get_serializer_class(self):
         """
         Utilise le sérialiseur approprié en fonction de l'action.
@@ -46,54 +217,443 @@ class DevisViewSet(viewsets.ModelViewSet):
             return DevisCreateSerializer
         return DevisSerializer
     
+    def _flux_demande(self):
+        """
+        Indique si le détail doit être rendu en flux (paramètre ?stream=1).
+        """
+        return self.request.query_params.get('stream', '').lower() in ['1', 'true']
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retourne le détail d'un devis. Avec ?stream=1, le JSON est écrit en flux,
+        lignes lues par un curseur côté serveur, pour les devis de grande taille.
+        """
+        if not self._flux_demande():
+            return super().retrieve(request, *args, **kwargs)
+        
+        from .flux import reponse_flux_devis
+        return reponse_flux_devis(self.get_object(), self.get_serializer_context())
+    
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
         """
-        Duplique un devis existant.
+        Duplique un devis existant en une transaction, par copie ensembliste
+        des lots et des lignes. Le nouveau devis reçoit le prochain numéro attribué.
+        
+        Corps facultatif : {"client": <UUID du client du nouveau devis>}
         """
+        from .duplication import dupliquer_devis
+        from .numerotation import entreprise_utilisateur
+        
         devis = self.get_object()
         
-        # Créer un nouveau numéro de devis
-        nouveau_numero = f"{devis.numero}-COPIE"
-        
-        # Créer une copie du devis
-        nouveau_devis = Devis.objects.create(
-            client=devis.client,
-            objet=f"Copie de : {devis.objet}",
-            statut='brouillon',
-            numero=nouveau_numero,
-            date_validite=devis.date_validite,
-            commentaire=devis.commentaire,
-            conditions_paiement=devis.conditions_paiement,
-            marge_globale=devis.marge_globale
+        # Client cible facultatif
+        client = None
+        client_id = request.data.get('client')
+        if client_id:
+            try:
+                client = Tiers.objects.get(pk=client_id, is_deleted=False)
+            except (Tiers.DoesNotExist, ValidationError, ValueError):
+                return Response(
+                    {"client": [f"Le client avec l'ID {client_id} n'existe pas."]}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        nouveau_devis = dupliquer_devis(
+            devis, client=client, entreprise=entreprise_utilisateur(request.user)
         )
         
-        # Copier les lots et leurs lignes
-        for lot in devis.lots.all():
-            nouveau_lot = Lot.objects.create(
-                devis=nouveau_devis,
-                nom=lot.nom,
-                ordre=lot.ordre,
-                description=lot.description
+        # Retourner le nouveau devis, chargé en un nombre fixe de requêtes
+        nouveau_devis = self._queryset_detail(Devis.objects.all()).get(pk=nouveau_devis.pk)
+        serializer = DevisDetailSerializer(nouveau_devis, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def operations(self, request, pk=None):
+        """
+        Applique en une transaction une liste ordonnée d'opérations d'édition
+        (ajout, modification, suppression, déplacement de lots et de lignes),
+        puis retourne les totaux recalculés du devis et de ses lots.
+        
+        Corps attendu : {"operations": [
+            {"op": "add", "cible": "lot", "ref": "gros-oeuvre", "donnees": {"nom": "Gros œuvre"}},
+            {"op": "add", "cible": "ligne", "donnees": {"lot": "gros-oeuvre", "type": "ouvrage", "ouvrage": 4, "quantite": "12"}},
+            {"op": "update", "cible": "ligne", "id": 18, "donnees": {"quantite": "3"}},
+            {"op": "move", "cible": "ligne", "id": 19, "lot": 2, "apres": 21},
+            {"op": "delete", "cible": "lot", "id": 3}
+        ]}
+        
+        Le format complet est décrit dans devis/operations.py. Si une opération est
+        invalide, rien n'est enregistré et l'erreur indique son index.
+        """
+        from .operations import OperationInvalide, appliquer_operations
+        
+        devis = self.get_object()
+        
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {"detail": "La liste des opérations est requise"}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Copier les lignes du lot
-            for ligne in lot.lignes.all():
-                LigneDevis.objects.create(
-                    lot=nouveau_lot,
-                    type=ligne.type,
-                    ouvrage=ligne.ouvrage,
-                    description=ligne.description,
-                    quantite=ligne.quantite,
-                    unite=ligne.unite,
-                    prix_unitaire=ligne.prix_unitaire,
-                    debourse=ligne.debourse,
-                    ordre=ligne.ordre
+        
+        try:
+            references = appliquer_operations(devis, operations)
+        except OperationInvalide as e:
+            return Response(
+                {"operation": e.index, "erreurs": e.erreurs}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        devis.refresh_from_db()
+        context = self.get_serializer_context()
+        return Response({
+            "devis": DevisSerializer(devis, context=context).data,
+            "lots": LotSerializer(devis.lots.order_by('ordre'), many=True, context=context).data,
+            "references": references
+        })
+    
+    @action(detail=True, methods=['post'])
+    def apply_margin(self, request, pk=None):
+        """
+        Recalcule le prix unitaire de toutes les lignes du devis à partir de leur
+        déboursé et de la marge globale, ou de la marge propre à certains lots,
+        en une seule requête UPDATE.
+        
+        Corps attendu : {"marge": <marge globale en %, par défaut marge_globale du devis>,
+                         "lots": {"<ID du lot>": <marge du lot en %>, ...},
+                         "dry_run": <true pour obtenir l'aperçu sans rien modifier>}
+        
+        Une marge fournie devient la marge globale du devis.
+        """
+        from .historique_prix import STATUTS_HISTORIQUE, invalider_historique_prix, ouvrages_des_devis
+        from .serializers import ApplicationMargeSerializer
+        from .tarification import apercu_marges, appliquer_marges
+        from .totaux import recalculer_totaux
+        
+        devis = self.get_object()
+        
+        if not self.user_can_view_costs(request.user):
+            return Response(
+                {"detail": "Vous n'êtes pas autorisé à modifier les marges"}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = ApplicationMargeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        marge = serializer.validated_data.get('marge')
+        if marge is None:
+            marge = devis.marge_globale
+        if marge is None:
+            return Response(
+                {"marge": ["Aucune marge fournie et le devis n'a pas de marge globale"]}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        marges_lots = {_entier(lot_id): valeur for lot_id, valeur in serializer.validated_data.get('lots', {}).items()}
+        lots_inconnus = set(marges_lots) - set(devis.lots.values_list('id', flat=True))
+        if lots_inconnus:
+            return Response(
+                {"lots": [f"Les lots {sorted(lots_inconnus, key=str)} n'appartiennent pas à ce devis"]}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        lignes = LigneDevis.objects.filter(lot__devis=devis)
+        
+        if serializer.validated_data['dry_run']:
+            apercu = apercu_marges(lignes, marge, marges_lots)
+            apercu.update(dry_run=True, marge=marge, lots=marges_lots)
+            return Response(apercu)
+        
+        with transaction.atomic():
+            lignes_modifiees = appliquer_marges(lignes, marge, marges_lots)
+            if devis.statut in STATUTS_HISTORIQUE:
+                invalider_historique_prix(ouvrages_des_devis([devis.id]))
+            if serializer.validated_data.get('marge') is not None:
+                Devis.objects.filter(pk=devis.pk).update(marge_globale=marge)
+            recalculer_totaux([devis.id])
+        
+        devis.refresh_from_db()
+        return Response({
+            "devis": DevisSerializer(devis, context=self.get_serializer_context()).data,
+            "lignes_modifiees": lignes_modifiees
+        })
+    
+    @action(detail=True, methods=['post'])
+    def reprice(self, request, pk=None):
+        """
+        Met à jour le déboursé des lignes 'ouvrage' d'un devis en brouillon
+        à partir des prix actuels de la bibliothèque, et retourne l'effet sur sa marge.
+        """
+        from .tarification import reevaluer_debourses
+        
+        devis = self.get_object()
+        if devis.statut != 'brouillon':
+            return Response(
+                {"detail": "Seuls les devis en brouillon peuvent être réévalués"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            rapport = reevaluer_debourses(Devis.objects.filter(pk=devis.pk))
+        
+        return Response({"devis": rapport})
+    
+    @action(detail=False, methods=['post'])
+    def reprice_drafts(self, request):
+        """
+        Met à jour en une passe le déboursé des lignes 'ouvrage' des devis en
+        brouillon indiqués, et retourne l'effet sur la marge de chaque devis modifié.
+        
+        Corps attendu : {"devis": [<ID>, ...]}
+        
+        Sans liste, tous les devis en brouillon sont réévalués : réservé aux
+        administrateurs (les traitements volumineux passent par la commande
+        reevaluer_debourses_devis).
+        """
+        from .tarification import reevaluer_debourses
+        
+        devis = Devis.objects.filter(statut='brouillon')
+        devis_ids = request.data.get('devis') if isinstance(request.data, dict) else None
+        if devis_ids is None:
+            if not request.user.is_staff:
+                return Response(
+                    {"detail": "Seul un administrateur peut réévaluer tous les devis en brouillon"},
+                    status=status.HTTP_403_FORBIDDEN
                 )
+        else:
+            ids = [_entier(devis_id) for devis_id in devis_ids] if isinstance(devis_ids, list) else [None]
+            if None in ids:
+                return Response(
+                    {"devis": ["Une liste d'IDs de devis est attendue"]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            devis = devis.filter(pk__in=ids)
         
-        # Retourner le nouveau devis
-        serializer = DevisDetailSerializer(nouveau_devis)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            rapport = reevaluer_debourses(devis)
+        
+        return Response({"devis": rapport})
+    
+    @action(detail=True, methods=['post'])
+    def simulate(self, request, pk=None):
+        """
+        Évalue des scénarios de prix sur le devis, sans rien modifier, et retourne
+        les totaux et la marge de chaque scénario.
+        
+        Corps attendu : {"scenarios": [
+            {"nom": "Main d'œuvre +5 %", "main_oeuvre": 5},
+            {"nom": "Maçonnerie +12 %", "categories": {"3": 12}},
+            {"nom": "Marge 25 %", "marge": 25}
+        ]}
+        
+        Le format complet est décrit dans devis/simulation.py.
+        """
+        from .serializers import SimulationSerializer
+        from .simulation import simuler
+        
+        devis = self.get_object()
+        
+        if not self.user_can_view_costs(request.user):
+            return Response(
+                {"detail": "Vous n'êtes pas autorisé à consulter les coûts"}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = SimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        return Response(simuler(devis, serializer.validated_data['scenarios']))
+    
+    @action(detail=True, methods=['get', 'post'])
+    def revisions(self, request, pk=None):
+        """
+        GET : liste les révisions figées du devis, sans leur contenu.
+        POST : capture une nouvelle révision du devis dans son état actuel.
+        
+        Une révision est aussi capturée automatiquement à l'envoi du devis.
+        """
+        from .revisions import capturer_revision
+        from .serializers import RevisionDevisSerializer
+        
+        devis = self.get_object()
+        context = self.get_serializer_context()
+        if request.method == 'POST':
+            revision = capturer_revision(devis, motif='manuel', auteur=request.user)
+            return Response(RevisionDevisSerializer(revision, context=context).data, status=status.HTTP_201_CREATED)
+        
+        revisions = RevisionDevis.objects.filter(devis_id=devis.pk).defer('donnees').order_by('numero')
+        return Response(RevisionDevisSerializer(revisions, many=True, context=context).data)
+    
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<numero>\d+)')
+    def revision(self, request, pk=None, numero=None):
+        """
+        Retourne le détail figé d'une révision, lu sur une seule ligne sans
+        accéder aux tables vivantes du devis.
+        """
+        from .revisions import lire_revision
+        
+        devis = self.get_object()
+        detail = lire_revision(devis.pk, numero, avec_couts=self.user_can_view_costs(request.user))
+        if detail is None:
+            return Response({"detail": "Révision non trouvée"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(detail)
+    
+    @action(detail=True, methods=['get'], url_path='revisions/diff')
+    def revisions_diff(self, request, pk=None):
+        """
+        Compare deux révisions du devis.
+        
+        Paramètres de requête:
+        - de (int): Numéro de la révision de référence
+        - a (int): Numéro de la révision comparée
+        """
+        from .revisions import comparer_revisions, lire_revision
+        
+        devis = self.get_object()
+        numeros = [_entier(request.query_params.get(param)) for param in ('de', 'a')]
+        if None in numeros:
+            return Response(
+                {"detail": "Les paramètres de et a (numéros de révision) sont requis"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        avec_couts = self.user_can_view_costs(request.user)
+        details = [lire_revision(devis.pk, numero, avec_couts=avec_couts) for numero in numeros]
+        if None in details:
+            return Response({"detail": "Révision non trouvée"}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({"de": numeros[0], "a": numeros[1], **comparer_revisions(*details)})
+    
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        """
+        Compare le contenu du devis (ou d'une de ses révisions) à celui d'un autre
+        devis, par exemple sa copie, ou d'une autre révision. Les lots sont
+        rapprochés par nom et les lignes par ouvrage et description.
+        
+        Paramètres de requête:
+        - avec (int): Devis comparé (par défaut, le devis lui-même)
+        - revision (int): Révision du devis servant de référence (par défaut, son état actuel)
+        - revision_avec (int): Révision du devis comparé (par défaut, son état actuel)
+        
+        Les coûts ne sont inclus que si l'utilisateur peut voir les coûts.
+        """
+        from .comparaison import charger_devis, charger_revision, comparer_arbres
+        
+        devis = self.get_object()
+        params = request.query_params
+        autre = devis
+        if params.get('avec') is not None:
+            autre = self.get_queryset().filter(pk=_entier(params.get('avec'))).first()
+            if autre is None:
+                return Response(
+                    {"detail": f"Le devis avec l'ID {params.get('avec')} n'existe pas"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        cotes = []
+        for cible, param in ((devis, 'revision'), (autre, 'revision_avec')):
+            if params.get(param) is None:
+                cotes.append({'devis': cible.id, 'numero': cible.numero, 'revision': None, 'arbre': charger_devis(cible)})
+                continue
+            numero = _entier(params.get(param))
+            arbre = charger_revision(cible.id, numero) if numero is not None else None
+            if arbre is None:
+                return Response(
+                    {"detail": f"Révision {params.get(param)} du devis {cible.numero} non trouvée"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            cotes.append({'devis': cible.id, 'numero': cible.numero, 'revision': numero, 'arbre': arbre})
+        
+        differences = comparer_arbres(
+            cotes[0].pop('arbre'), cotes[1].pop('arbre'),
+            avec_couts=self.user_can_view_costs(request.user)
+        )
+        return Response({"de": cotes[0], "vers": cotes[1], **differences})
+    
+    @action(detail=True, methods=['post'])
+    def apply_template(self, request, pk=None):
+        """
+        Ajoute les lots et les lignes d'un modèle à la fin du devis, en une transaction.
+        
+        Corps attendu : {"modele": <ID du modèle>, "parametres": {"surface": 12.5}}
+        """
+        from .modeles_devis import ModeleInvalide, ParametresInvalides, instancier_modele
+        from .serializers import InstanciationModeleSerializer
+        
+        devis = self.get_object()
+        serializer = InstanciationModeleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            lots = instancier_modele(
+                serializer.validated_data['modele'], devis, serializer.validated_data.get('parametres')
+            )
+        except ParametresInvalides as e:
+            return Response({"parametres": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        except ModeleInvalide as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        devis.refresh_from_db()
+        context = self.get_serializer_context()
+        return Response({
+            "devis": DevisSerializer(devis, context=context).data,
+            "lots": LotSerializer(lots, many=True, context=context).data
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def import_dpgf(self, request, pk=None):
+        """
+        Importe un bordereau de quantités (DPGF) à la fin du devis.
+        
+        Corps attendu (multipart) : fichier = fichier CSV ou XLSX
+        
+        Les lignes invalides sont ignorées et renvoyées avec leur numéro dans le
+        fichier ; les autres sont importées en une transaction.
+        """
+        from .import_dpgf import FichierInvalide, importer_dpgf, lire_lignes
+        
+        devis = self.get_object()
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return Response(
+                {"detail": "Le fichier à importer est requis (champ 'fichier')"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            resultat = importer_dpgf(devis, lire_lignes(fichier, fichier.name))
+        except FichierInvalide as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        devis.refresh_from_db()
+        context = self.get_serializer_context()
+        return Response({
+            "devis": DevisSerializer(devis, context=context).data,
+            "lots": LotSerializer(Lot.objects.filter(pk__in=resultat['lots']), many=True, context=context).data,
+            "lignes_importees": resultat['lignes'],
+            "erreurs": resultat['erreurs']
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def save_as_template(self, request, pk=None):
+        """
+        Crée un modèle de devis reprenant les lots et les lignes du devis.
+        
+        Corps attendu : {"nom": "Salle de bain standard", "description": "..."}
+        """
+        from .modeles_devis import creer_modele_depuis_devis
+        from .serializers import ModeleDepuisDevisSerializer
+        
+        devis = self.get_object()
+        serializer = ModeleDepuisDevisSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        modele = creer_modele_depuis_devis(devis, **serializer.validated_data)
+        modele = ModeleDevisViewSet.queryset.get(pk=modele.pk)
+        return Response(ModeleDevisDetailSerializer(modele).data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['put'])
     def change_status(self, request, pk=None):
@@ -116,11 +676,22 @@ class DevisViewSet(viewsets.ModelViewSet):
             )
         
         devis.statut = nouveau_statut
-        devis.save()
+        devis.save(auteur=request.user)
         
         serializer = DevisSerializer(devis)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def status_history(self, request, pk=None):
+        """
+        Journal des changements de statut du devis, du plus ancien au plus récent.
+        """
+        from .serializers import TransitionStatutDevisSerializer
+        
+        devis = self.get_object()
+        transitions = devis.transitions_statut.order_by('date', 'id')
+        return Response(TransitionStatutDevisSerializer(transitions, many=True).data)
+    
     @action(detail=True, methods=['get'])
     def pdf(self, request, pk=None):
         """
@@ -151,13 +722,126 @@ class DevisViewSet(viewsets.ModelViewSet):
         
         return response
         
+    @action(detail=True, methods=['get'])
+    def takeoff(self, request, pk=None):
+        """
+        Quantitatif du devis : quantité totale de chaque fourniture et heures de
+        chaque main d'œuvre, avec leur coût selon les prix de la bibliothèque.
+        
+        Paramètres de requête:
+        - export (str): 'csv' pour télécharger le quantitatif au format CSV
+        
+        Les coûts ne sont inclus que si l'utilisateur peut voir les coûts.
+        """
+        from .quantitatif import calculer_quantitatif, reponse_csv_quantitatif
+        
+        devis = self.get_object()
+        show_costs = self.user_can_view_costs(request.user)
+        elements = calculer_quantitatif(devis, avec_couts=show_costs)
+        
+        if request.query_params.get('export') == 'csv':
+            return reponse_csv_quantitatif(devis, elements, avec_couts=show_costs)
+        
+        result = {"devis": devis.id, "elements": elements}
+        if show_costs:
+            result["cout_total"] = sum((element['cout'] for element in elements), Decimal('0'))
+        return Response(result)
+    
+    def _format_export(self):
+        """
+        Format d'export demandé (?export=csv ou xlsx, CSV par défaut), ou None s'il est inconnu.
+        """
+        from .export import FORMATS
+        
+        format_export = self.request.query_params.get('export', 'csv').lower()
+        return format_export if format_export in FORMATS else None
+    
+    def _reponse_export(self, exporter, *args):
+        """
+        Produit un export au format demandé, ou la réponse d'erreur correspondante.
+        """
+        from .export import ExportIndisponible
+        
+        format_export = self._format_export()
+        if format_export is None:
+            return Response(
+                {"detail": "Le paramètre export doit valoir 'csv' ou 'xlsx'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            return exporter(
+                *args, format_export=format_export,
+                avec_couts=self.user_can_view_costs(self.request.user)
+            )
+        except ExportIndisponible as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Exporte les lignes du devis au format CSV ou XLSX.
+        
+        Paramètres de requête:
+        - export (str): 'csv' (par défaut) ou 'xlsx'
+        
+        Les coûts ne sont inclus que si l'utilisateur peut voir les coûts.
+        """
+        from .export import exporter_lignes
+        
+        devis = self.get_object()
+        nom = f"devis_{devis.numero}".replace('/', '-').replace(' ', '_')
+        return self._reponse_export(exporter_lignes, nom, LigneDevis.objects.filter(lot__devis=devis))
+    
+    @action(detail=False, methods=['get'])
+    def export_quotes(self, request):
+        """
+        Exporte les devis au format CSV ou XLSX, avec les mêmes filtres, recherche
+        et tri que la liste.
+        
+        Paramètres de requête:
+        - export (str): 'csv' (par défaut) ou 'xlsx'
+        - filtres de la liste (client, statut, total_ht__gte, ..., search, ordering)
+        """
+        from .export import exporter_devis
+        
+        return self._reponse_export(exporter_devis, self.filter_queryset(self.get_queryset()))
+    
+    @action(detail=False, methods=['get'])
+    def export_lines(self, request):
+        """
+        Exporte les lignes des devis créés sur une période, au format CSV ou XLSX.
+        
+        Paramètres de requête:
+        - export (str): 'csv' (par défaut) ou 'xlsx'
+        - debut, fin (AAAA-MM-JJ): Première et dernière dates de création retenues
+        - filtres de la liste des devis (client, statut, total_ht__gte, ..., search)
+        """
+        from datetime import date
+        from .export import exporter_lignes, lignes_des_devis
+        
+        devis = self.filter_queryset(self.get_queryset())
+        for param, lookup in (('debut', 'date_creation__gte'), ('fin', 'date_creation__lte')):
+            valeur = request.query_params.get(param)
+            if not valeur:
+                continue
+            try:
+                devis = devis.filter(**{lookup: date.fromisoformat(valeur)})
+            except ValueError:
+                return Response(
+                    {"detail": f"Le paramètre {param} doit être au format AAAA-MM-JJ"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        return self._reponse_export(exporter_lignes, "lignes_devis", lignes_des_devis(devis))
+    
     @action(detail=True, methods=['get'])
     def calculations(self, request, pk=None):
         """
         Retourne les calculs détaillés pour un devis : totaux par lot, totaux globaux, marges.
         L'accès aux informations de coûts et marges est filtré selon le rôle de l'utilisateur.
         """
-        devis = self.get_object()
+        arbre = ArbreDevis(self.get_object())
+        devis = arbre.devis
         
         # Vérifier si l'utilisateur a le droit de voir les données de coûts
         show_costs = self.user_can_view_costs(request.user)
@@ -166,38 +850,39 @@ class DevisViewSet(viewsets.ModelViewSet):
         result = {
             "id": devis.id,
             "numero": devis.numero,
-            "client": devis.client.nom,
+            "client": arbre.client.nom,
             "objet": devis.objet,
             "statut": devis.statut,
-            "total_ht": devis.total_ht
+            "total_ht": arbre.total_ht
         }
         
         # Ajouter les informations de coûts si l'utilisateur est autorisé
         if show_costs:
             result.update({
-                "total_debourse": devis.total_debourse,
-                "marge_totale": devis.marge_totale
+                "total_debourse": arbre.total_debourse,
+                "marge_totale": arbre.marge_totale
             })
         
         # Préparer les détails par lot
         lots_data = []
-        for lot in devis.lots.all().order_by('ordre'):
+        for noeud in arbre.lots:
+            lot = noeud.lot
             lot_data = {
                 "id": lot.id,
                 "nom": lot.nom,
-                "total_ht": lot.total_ht
+                "total_ht": noeud.total_ht
             }
             
             # Ajouter les informations de coûts des lots si l'utilisateur est autorisé
             if show_costs:
                 lot_data.update({
-                    "total_debourse": lot.total_debourse,
-                    "marge": lot.marge
+                    "total_debourse": noeud.total_debourse,
+                    "marge": noeud.marge
                 })
             
             # Ajouter les détails des lignes
             lignes_data = []
-            for ligne in lot.lignes.all().order_by('ordre'):
+            for ligne in noeud.lignes:
                 ligne_data = {
                     "id": ligne.id,
                     "description": ligne.description,
@@ -225,6 +910,41 @@ class DevisViewSet(viewsets.ModelViewSet):
         # Retourner le résultat complet
         return Response(result)
     
+    @action(detail=False, methods=['post'], url_path='calculations/batch', url_name='calculations-batch')
+    def calculations_batch(self, request):
+        """
+        Retourne les totaux, déboursés et marges de plusieurs devis et de leurs lots,
+        en trois requêtes quel que soit le nombre de devis.
+        
+        Corps attendu : {"ids": [1, 2, 3]} (facultatif, 1000 devis au plus)
+        
+        Les devis peuvent aussi (ou en plus) être sélectionnés par les filtres,
+        la recherche et le tri de la liste, passés en paramètres de requête.
+        L'accès aux informations de coûts et marges est filtré selon le rôle de l'utilisateur.
+        """
+        from .calculs_groupes import LIMITE_DEVIS, calculer_devis
+        from .serializers import CalculsGroupesSerializer
+        
+        serializer = CalculsGroupesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        devis = self.filter_queryset(self.get_queryset())
+        ids = serializer.validated_data.get('ids')
+        if ids is not None:
+            devis = devis.filter(pk__in=ids)
+        if devis.count() > LIMITE_DEVIS:
+            return Response(
+                {"detail": f"Trop de devis sélectionnés ({LIMITE_DEVIS} au plus) : précisez les filtres ou les ids"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resultats = calculer_devis(devis, avec_couts=self.user_can_view_costs(request.user))
+        result = {"devis": resultats}
+        if ids is not None:
+            trouves = {resultat['id'] for resultat in resultats}
+            result["introuvables"] = [devis_id for devis_id in ids if devis_id not in trouves]
+        return Response(result)
+    
     def user_can_view_costs(self, user):
         """
         Détermine si un utilisateur peut voir les informations de coûts et marges.
@@ -235,50 +955,110 @@ class DevisViewSet(viewsets.ModelViewSet):
         # Pour l'instant, on suppose que c'est accessible à tous les utilisateurs authentifiés
         return user.is_authenticated
         
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """
+        Prévision des fournitures et heures de main d'œuvre engagées par les devis
+        acceptés, par mois de validité (ou d'acceptation).
+        
+        Paramètres de requête:
+        - categorie (int): Ne retient que les éléments de cette catégorie
+        - debut, fin (AAAA-MM): Premier et dernier mois retenus
+        
+        Les coûts ne sont inclus que si l'utilisateur peut voir les coûts.
+        """
+        from .prevision import rapport_prevision
+        
+        mois = _mois_periode(request.query_params)
+        if isinstance(mois, Response):
+            return mois
+        
+        categorie = request.query_params.get('categorie')
+        if categorie is not None and _entier(categorie) is None:
+            return Response(
+                {"detail": "Le paramètre categorie doit être un identifiant de catégorie"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(rapport_prevision(
+            categorie=_entier(categorie) if categorie is not None else None,
+            avec_couts=self.user_can_view_costs(request.user),
+            **mois
+        ))
+    
+    @action(detail=False, methods=['get'])
+    def funnel(self, request):
+        """
+        Entonnoir de conversion (brouillon, envoyé, accepté) et délais moyens entre
+        statuts, par mois de changement de statut.
+        
+        Paramètres de requête:
+        - client (uuid): Limite le rapport aux devis d'un client
+        - debut, fin (AAAA-MM): Premier et dernier mois retenus
+        
+        Le rapport est lu depuis des agrégats mensuels maintenus à chaque changement
+        de statut (voir devis/entonnoir.py).
+        """
+        from .entonnoir import rapport_entonnoir
+        
+        mois = _mois_periode(request.query_params)
+        if isinstance(mois, Response):
+            return mois
+        
+        client_id = request.query_params.get('client')
+        if client_id:
+            try:
+                client_id = uuid.UUID(client_id)
+            except ValueError:
+                return Response(
+                    {"detail": "Identifiant de client invalide"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        return Response(rapport_entonnoir(client_id=client_id or None, **mois))
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
-        Retourne des statistiques globales sur les devis.
+        Retourne des statistiques globales sur les devis : répartition par statut
+        (nombre, montant HT, déboursé, marge) et série mensuelle par date de création.
         L'accès est filtré selon les rôles.
+        
+        Paramètres de requête:
+        - client (uuid): Limite les statistiques aux devis d'un client
+        
+        Les statistiques sont lues depuis un instantané recalculé uniquement
+        après une modification de devis.
         """
+        from .statistiques import obtenir_statistiques
+        
         # Vérifier si l'utilisateur a le droit de voir les données de coûts
         show_costs = self.user_can_view_costs(request.user)
         
-        # Statistiques de base accessibles à tous
-        basic_stats = {
-            "total_devis": Devis.objects.count(),
-            "devis_par_statut": {
-                status: Devis.objects.filter(statut=status).count()
-                for status, _ in Devis.STATUT_CHOICES
-            },
-            "montant_total_ht": Devis.objects.aggregate(total=Sum('total_ht'))['total'] or 0,
-        }
+        client_id = request.query_params.get('client')
+        if client_id:
+            try:
+                client_id = uuid.UUID(client_id)
+            except ValueError:
+                return Response(
+                    {"detail": "Identifiant de client invalide"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
-        # Statistiques incluant les informations de coûts (réservées aux rôles autorisés)
-        cost_stats = {}
-        if show_costs:
-            # Récupérer les données de coûts et de marges
-            margin_data = Devis.objects.aggregate(
-                debourse_total=Sum('total_debourse'),
-                marge_moyenne=Avg('marge_totale')
-            )
-            
-            cost_stats = {
-                "debourse_total": margin_data['debourse_total'] or 0,
-                "marge_moyenne": margin_data['marge_moyenne'] or 0,
-                # Répartition de marge par statut (pour analyse)
-                "marges_par_statut": {
-                    status: Devis.objects.filter(statut=status).aggregate(
-                        avg_margin=Avg('marge_totale')
-                    )['avg_margin'] or 0
-                    for status, _ in Devis.STATUT_CHOICES
-                }
-            }
+        result = dict(obtenir_statistiques(client_id or None))
         
-        # Combiner les statistiques
-        result = {**basic_stats}
-        if cost_stats:
-            result.update(cost_stats)
+        # Retirer les informations de coûts si l'utilisateur n'est pas autorisé
+        if not show_costs:
+            for key in ['debourse_total', 'marge_moyenne', 'marges_par_statut']:
+                result.pop(key, None)
+            result['par_statut'] = {
+                statut: {k: v for k, v in groupe.items() if k not in ['debourse', 'marge_moyenne']}
+                for statut, groupe in result['par_statut'].items()
+            }
+            result['serie_mensuelle'] = [
+                {k: v for k, v in mois.items() if k not in ['debourse', 'marge_moyenne']}
+                for mois in result['serie_mensuelle']
+            ]
         
         return Response(result)
 
@@ -297,7 +1077,7 @@ class LotViewSet(viewsets.ModelViewSet):
     serializer_class = LotSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['devis']
-    ordering_fields = ['ordre', 'nom']
+    ordering_fields = ['ordre', 'nom', 'total_ht']
     ordering = ['ordre', 'nom']
     
     def get_serializer_class(self):
@@ -344,17 +1124,42 @@ class LotViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Mettre à jour l'ordre des lots
-        for i, lot_id in enumerate(lot_ids):
-            lot = lots.get(id=lot_id)
-            lot.ordre = i
-            lot.save()
+        # Mettre à jour l'ordre des lots (clés espacées, sans doublon intermédiaire)
+        with transaction.atomic():
+            verrouiller(Devis, [devis.pk])
+            appliquer_ordre(Lot.objects.filter(devis=devis), [_entier(lot_id) for lot_id in lot_ids])
         
         # Retourner les lots mis à jour
-        serializer = LotSerializer(lots, many=True)
+        serializer = LotSerializer(Lot.objects.filter(id__in=lot_ids).order_by('ordre'), many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """
+        Déplace un lot entre deux lots voisins de son devis. Seul le lot déplacé est
+        modifié (sauf renumérotation occasionnelle du devis).
+        
+        Corps attendu : {"apres": <ID du lot précédent, null pour placer en tête>,
+                         "avant": <ID du lot suivant, facultatif>}
+        """
+        lot = self.get_object()
+        
+        try:
+            with transaction.atomic():
+                verrouiller(Devis, [lot.devis_id])
+                placer(
+                    lot, Lot.objects.filter(devis_id=lot.devis_id),
+                    apres_id=_entier(request.data.get('apres')),
+                    avant_id=_entier(request.data.get('avant'))
+                )
+                Lot.objects.filter(pk=lot.pk).update(ordre=lot.ordre)
+        except PlacementInvalide as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = LotSerializer(lot, context=self.get_serializer_context())
         return Response(serializer.data)
 
-class LigneDevisViewSet(viewsets.ModelViewSet):
+class LigneDevisViewSet(TarifsMemorisesMixin, viewsets.ModelViewSet):
     """
     ViewSet pour gérer les opérations CRUD sur les lignes de devis.
     
@@ -390,46 +1195,10 @@ class LigneDevisViewSet(viewsets.ModelViewSet):
         # Récupérer les données de la requête
         request_data = request.data.copy()
         
-        # Vérifier si c'est une ligne de type 'ouvrage'
-        if request_data.get('type') == 'ouvrage' and request_data.get('ouvrage'):
-            try:
-                # Récupérer l'ouvrage avant la validation
-                ouvrage_id = request_data.get('ouvrage')
-                ouvrage = Ouvrage.objects.get(pk=ouvrage_id)
-                
-                # Pré-remplir les champs manquants avec les valeurs de l'ouvrage
-                if not request_data.get('description'):
-                    request_data['description'] = ouvrage.nom
-                
-                if not request_data.get('unite'):
-                    request_data['unite'] = ouvrage.unite
-                
-                if not request_data.get('debourse'):
-                    # On arrondit à 2 décimales maximum
-                    request_data['debourse'] = str(round(ouvrage.debourse_sec, 2))  # Conversion en string pour JSON
-                
-                # Si le prix unitaire n'est pas fourni, on le calcule avec une marge de 30%
-                if not request_data.get('prix_unitaire'):
-                    from decimal import Decimal, ROUND_HALF_UP
-                    debourse = ouvrage.debourse_sec
-                    if debourse > 0:
-                        # Utilisation de Decimal pour éviter l'erreur de type
-                        # On arrondit à 2 décimales et on s'assure de ne pas dépasser 10 chiffres au total
-                        prix = (debourse / Decimal('0.7')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                        # Vérifier que le nombre ne dépasse pas 10 chiffres au total
-                        # Si c'est le cas, on le tronque à 9999999.99
-                        if len(str(prix).replace('.', '')) > 10:
-                            prix = Decimal('9999999.99')
-                        request_data['prix_unitaire'] = str(prix)
-                    else:
-                        request_data['prix_unitaire'] = '0'
-                        
-            except Ouvrage.DoesNotExist:
-                # Si l'ouvrage n'existe pas, on retourne une erreur claire
-                return Response(
-                    {"ouvrage": [f"L'ouvrage avec l'ID {ouvrage_id} n'existe pas."]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        # Pré-remplir une ligne de type 'ouvrage' depuis la bibliothèque
+        request_data, erreur = _preremplir_ouvrage(request_data)
+        if erreur is not None:
+            return erreur
         
         # Maintenant on valide le sérialiseur avec les données complétées
         serializer = self.get_serializer(data=request_data)
@@ -437,7 +1206,7 @@ class LigneDevisViewSet(viewsets.ModelViewSet):
         
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        return Response(_avec_historique_prix(serializer), status=status.HTTP_201_CREATED, headers=headers)
     
     @action(detail=False, methods=['post'])
     def reorder(self, request):
@@ -475,18 +1244,61 @@ class LigneDevisViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Mettre à jour l'ordre des lignes
-        for i, ligne_id in enumerate(ligne_ids):
-            ligne = lignes.get(id=ligne_id)
-            ligne.ordre = i
-            ligne.save()
+        # Mettre à jour l'ordre des lignes (clés espacées, en deux requêtes)
+        with transaction.atomic():
+            verrouiller(Lot, [lot.pk])
+            appliquer_ordre(LigneDevis.objects.filter(lot=lot), [_entier(ligne_id) for ligne_id in ligne_ids])
         
         # Retourner les lignes mises à jour
-        serializer = LigneDevisSerializer(lignes, many=True)
+        serializer = LigneDevisSerializer(LigneDevis.objects.filter(id__in=ligne_ids).order_by('ordre'), many=True)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """
+        Déplace une ligne entre deux lignes voisines, éventuellement vers un autre lot
+        du même devis. Seule la ligne déplacée est modifiée.
+        
+        Corps attendu : {"lot": <ID du lot cible, facultatif>,
+                         "apres": <ID de la ligne précédente, null pour placer en tête>,
+                         "avant": <ID de la ligne suivante, facultatif>}
+        """
+        ligne = self.get_object()
+        return _deplacer_ligne(ligne, request.data, Lot.objects.filter(devis__lots=ligne.lot_id),
+                               self.get_serializer_context())
+
+
+class ModeleDevisViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet pour gérer les opérations CRUD sur les modèles de devis.
+    
+    La création et la mise à jour acceptent la structure complète du modèle
+    (lots et lignes imbriqués). Un modèle peut aussi être créé à partir d'un devis
+    (devis/{id}/save_as_template/) et instancié dans un devis (devis/{id}/apply_template/).
+    """
+    queryset = ModeleDevis.objects.prefetch_related('lots__lignes')
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ['nom', 'description']
+    ordering_fields = ['nom', 'date_creation']
+    
+    def get_queryset(self):
+        """
+        La liste n'affiche que le nombre de lots et de lignes de chaque modèle.
+        """
+        if self.action == 'list':
+            return ModeleDevis.objects.annotate(
+                nombre_lots=Count('lots', distinct=True),
+                nombre_lignes=Count('lots__lignes')
+            )
+        return super().get_queryset()
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ModeleDevisSerializer
+        return ModeleDevisDetailSerializer
 
 
-class DevisLineViewSet(viewsets.ModelViewSet):
+class DevisLineViewSet(TarifsMemorisesMixin, viewsets.ModelViewSet):
     """
     ViewSet pour gérer les opérations CRUD sur les lignes de devis avec routes imbriquées.
     
@@ -497,6 +1309,8 @@ class DevisLineViewSet(viewsets.ModelViewSet):
     - PUT /api/quotes/devis/{devis_pk}/lines/{pk}/
     - DELETE /api/quotes/devis/{devis_pk}/lines/{pk}/
     - POST /api/quotes/devis/{devis_pk}/lines/reorder/
+    - POST /api/quotes/devis/{devis_pk}/lines/bulk/
+    - POST /api/quotes/devis/{devis_pk}/lines/{pk}/move/
     """
     serializer_class = LigneDevisSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -531,44 +1345,10 @@ class DevisLineViewSet(viewsets.ModelViewSet):
         # Récupérer les données de la requête
         request_data = request.data.copy()
         
-        # Vérifier si c'est une ligne de type 'ouvrage'
-        if request_data.get('type') == 'ouvrage' and request_data.get('ouvrage'):
-            try:
-                # Récupérer l'ouvrage avant la validation
-                ouvrage_id = request_data.get('ouvrage')
-                ouvrage = Ouvrage.objects.get(pk=ouvrage_id)
-                
-                # Pré-remplir les champs manquants avec les valeurs de l'ouvrage
-                if not request_data.get('description'):
-                    request_data['description'] = ouvrage.nom
-                
-                if not request_data.get('unite'):
-                    request_data['unite'] = ouvrage.unite
-                
-                # On arrondit le déboursé à 2 décimales maximum
-                if not request_data.get('debourse'):
-                    request_data['debourse'] = str(round(ouvrage.debourse_sec, 2))  # Conversion en string pour JSON
-                
-                # Si le prix unitaire n'est pas fourni, on le calcule avec une marge de 30%
-                if not request_data.get('prix_unitaire'):
-                    from decimal import Decimal, ROUND_HALF_UP
-                    debourse = ouvrage.debourse_sec
-                    if debourse > 0:
-                        # On arrondit à 2 décimales et on s'assure de ne pas dépasser 10 chiffres au total
-                        prix = (debourse / Decimal('0.7')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                        # Vérifier que le nombre ne dépasse pas 10 chiffres au total
-                        if len(str(prix).replace('.', '')) > 10:
-                            prix = Decimal('9999999.99')
-                        request_data['prix_unitaire'] = str(prix)
-                    else:
-                        request_data['prix_unitaire'] = '0'
-                        
-            except Ouvrage.DoesNotExist:
-                # Si l'ouvrage n'existe pas, on retourne une erreur claire
-                return Response(
-                    {"ouvrage": [f"L'ouvrage avec l'ID {ouvrage_id} n'existe pas."]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        # Pré-remplir une ligne de type 'ouvrage' depuis la bibliothèque
+        request_data, erreur = _preremplir_ouvrage(request_data)
+        if erreur is not None:
+            return erreur
         
         # Maintenant on valide le sérialiseur avec les données complétées
         serializer = self.get_serializer(data=request_data)
@@ -587,7 +1367,7 @@ class DevisLineViewSet(viewsets.ModelViewSet):
         
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        return Response(_avec_historique_prix(serializer), status=status.HTTP_201_CREATED, headers=headers)
     
     def perform_create(self, serializer):
         """
@@ -595,6 +1375,83 @@ class DevisLineViewSet(viewsets.ModelViewSet):
         """
         serializer.save()
     
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, devis_pk=None):
+        """
+        Insère en une seule fois un ensemble de lignes réparties sur les lots du devis.
+        
+        Corps attendu : {"lignes": [{"lot": 1, "type": "ouvrage", "ouvrage": 4, "quantite": "12.5"}, ...]}
+        
+        Le déboursé de chaque ouvrage distinct n'est calculé qu'une fois et les champs
+        manquants des lignes 'ouvrage' sont pré-remplis comme pour une création unitaire.
+        Les lignes sont validées puis insérées en une transaction : si une seule ligne
+        est invalide, aucune n'est créée et les erreurs sont renvoyées ligne par ligne.
+        """
+        from .tarification import debourses_ouvrages, preremplir_ligne
+        from .totaux import lignes_inserees
+        
+        devis = get_object_or_404(Devis, pk=devis_pk)
+        
+        lignes_data = request.data.get('lignes') if isinstance(request.data, dict) else request.data
+        if not isinstance(lignes_data, list) or not lignes_data:
+            return Response(
+                {"detail": "La liste des lignes est requise"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Précharger les lots du devis et les ouvrages référencés en une requête chacun
+        lots = set(devis.lots.values_list('id', flat=True))
+        ouvrage_ids = {
+            _entier(ligne.get('ouvrage'))
+            for ligne in lignes_data
+            if isinstance(ligne, dict) and ligne.get('type') == 'ouvrage'
+        }
+        ouvrage_ids.discard(None)
+        ouvrages = Ouvrage.objects.in_bulk(ouvrage_ids)
+        debourses = debourses_ouvrages(ouvrages.keys())
+        
+        # Pré-remplir les champs manquants des lignes 'ouvrage'
+        donnees = []
+        for ligne in lignes_data:
+            if isinstance(ligne, dict) and ligne.get('type') == 'ouvrage':
+                ouvrage = ouvrages.get(_entier(ligne.get('ouvrage')))
+                if ouvrage:
+                    ligne = preremplir_ligne(ligne, ouvrage, debourses[ouvrage.id])
+            donnees.append(ligne)
+        
+        serializer = LigneDevisBulkSerializer(
+            data=donnees, many=True, context={'lots': lots, 'ouvrages': ouvrages}
+        )
+        if not serializer.is_valid():
+            return Response({"lignes": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Les lignes sans ordre explicite sont ajoutées à la fin de leur lot
+        ordres = dict(
+            LigneDevis.objects.filter(lot__devis=devis)
+            .values('lot').annotate(ordre_max=Max('ordre'))
+            .values_list('lot', 'ordre_max')
+        )
+        nouvelles_lignes = []
+        for data in serializer.validated_data:
+            lot_id = data.pop('lot')
+            if 'ordre' not in data:
+                ordres[lot_id] = ordres[lot_id] + PAS_ORDRE if lot_id in ordres else PAS_ORDRE
+                data['ordre'] = ordres[lot_id]
+            nouvelles_lignes.append(
+                LigneDevis(lot_id=lot_id, ouvrage_id=data.pop('ouvrage', None), **data)
+            )
+        
+        with transaction.atomic():
+            nouvelles_lignes = LigneDevis.objects.bulk_create(nouvelles_lignes, batch_size=500)
+            lignes_inserees(devis.id, nouvelles_lignes)
+        
+        devis.refresh_from_db()
+        context = self.get_serializer_context()
+        return Response({
+            "devis": DevisSerializer(devis, context=context).data,
+            "lignes": LigneDevisSerializer(nouvelles_lignes, many=True, context=context).data
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['post'])
     def reorder(self, request, devis_pk=None):
         """
@@ -632,12 +1489,25 @@ class DevisLineViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Mettre à jour l'ordre des lignes
-        for i, ligne_id in enumerate(ligne_ids):
-            ligne = lignes.get(id=ligne_id)
-            ligne.ordre = i
-            ligne.save()
+        # Mettre à jour l'ordre des lignes (clés espacées, en deux requêtes)
+        with transaction.atomic():
+            verrouiller(Lot, [lot.pk])
+            appliquer_ordre(LigneDevis.objects.filter(lot=lot), [_entier(ligne_id) for ligne_id in ligne_ids])
         
         # Retourner les lignes mises à jour
-        serializer = LigneDevisSerializer(lignes, many=True)
+        serializer = LigneDevisSerializer(LigneDevis.objects.filter(id__in=ligne_ids).order_by('ordre'), many=True)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def move(self, request, devis_pk=None, pk=None):
+        """
+        Déplace une ligne entre deux lignes voisines, éventuellement vers un autre lot
+        du devis. Seule la ligne déplacée est modifiée.
+        
+        Corps attendu : {"lot": <ID du lot cible, facultatif>,
+                         "apres": <ID de la ligne précédente, null pour placer en tête>,
+                         "avant": <ID de la ligne suivante, facultatif>}
+        """
+        ligne = self.get_object()
+        return _deplacer_ligne(ligne, request.data, Lot.objects.filter(devis=devis_pk),
+                               self.get_serializer_context())
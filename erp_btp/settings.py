@@ -207,3 +207,7 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Numérotation des devis (voir devis/numerotation.py)
+# Un compteur par entreprise de l'utilisateur (User.company) plutôt qu'un compteur commun
+DEVIS_NUMEROTATION_PAR_ENTREPRISE = False